@@ -0,0 +1,95 @@
+import os
+import re
+import zlib
+import logging
+import threading
+import numpy as np
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Near-duplicate filter settings (can be overridden from the environment)
+CHUNK_DEDUP = os.getenv("CHUNK_DEDUP", "true").lower() == "true"
+# Estimated Jaccard similarity of word shingles above which a chunk is a duplicate
+CHUNK_DEDUP_THRESHOLD = float(os.getenv("CHUNK_DEDUP_THRESHOLD", "0.85"))
+# Signature length and LSH bands; 128 hashes in 16 bands of 8 make pairs above
+# roughly 0.7 similarity collide in some band, so they get compared at all
+MINHASH_PERMUTATIONS = int(os.getenv("MINHASH_PERMUTATIONS", "128"))
+MINHASH_BANDS = int(os.getenv("MINHASH_BANDS", "16"))
+SHINGLE_WORDS = 5
+
+# Mersenne prime for the universal hashes; a * x stays below 2**64 for 32-bit x
+PRIME = (1 << 31) - 1
+WORD = re.compile(r"\w+")
+
+
+def shingles(text, size=SHINGLE_WORDS):
+    """32-bit hashes of the text's overlapping word n-grams, ignoring case and punctuation"""
+    words = WORD.findall(text.lower())
+    if len(words) <= size:
+        return {zlib.crc32(" ".join(words).encode("utf-8"))}
+    return {zlib.crc32(" ".join(words[i:i + size]).encode("utf-8")) for i in range(len(words) - size + 1)}
+
+
+class ChunkDeduplicator:
+    """Drops chunks that nearly repeat an earlier chunk of the same document.
+
+    Each chunk gets a MinHash signature of its word shingles. Signatures are
+    cut into bands and bucketed, so a chunk is only compared with the earlier
+    chunks it shares a band with; it is dropped when the fraction of equal
+    signature values (the estimated Jaccard similarity) reaches the threshold.
+    Scraped pages repeat nested sections and page-level text, and none of
+    those copies are worth an embedding or a top-k slot.
+    """
+
+    def __init__(self, threshold=CHUNK_DEDUP_THRESHOLD, permutations=MINHASH_PERMUTATIONS, bands=MINHASH_BANDS,
+                 seed=1):
+        if permutations % bands:
+            raise ValueError(f"{permutations} MinHash permutations cannot be split into {bands} bands")
+        self.threshold = threshold
+        self.bands = bands
+        self.rows = permutations // bands
+        rng = np.random.default_rng(seed)
+        self._a = rng.integers(1, PRIME, size=(permutations, 1), dtype=np.uint64)
+        self._b = rng.integers(0, PRIME, size=(permutations, 1), dtype=np.uint64)
+        self._lock = threading.Lock()
+        self._metrics = {"documents": 0, "chunks_seen": 0, "chunks_dropped": 0}
+
+    def signature(self, text):
+        values = np.fromiter(shingles(text), dtype=np.uint64)
+        return ((self._a * values + self._b) % PRIME).min(axis=1)
+
+    def filter(self, chunks):
+        """The chunks without near-duplicates of earlier ones, in their original order"""
+        return list(self.stream(chunks))
+
+    def stream(self, chunks):
+        """filter() for an iterable of chunks, yielding each kept chunk as soon as it is seen"""
+        signatures, buckets = [], {}
+        seen = 0
+        for chunk in chunks:
+            seen += 1
+            signature = self.signature(chunk)
+            keys = [(band, signature[band * self.rows:(band + 1) * self.rows].tobytes()) for band in range(self.bands)]
+            candidates = {index for key in keys for index in buckets.get(key, ())}
+            if any(np.mean(signatures[index] == signature) >= self.threshold for index in candidates):
+                continue
+            for key in keys:
+                buckets.setdefault(key, []).append(len(signatures))
+            signatures.append(signature)
+            yield chunk
+
+        dropped = seen - len(signatures)
+        with self._lock:
+            self._metrics["documents"] += 1
+            self._metrics["chunks_seen"] += seen
+            self._metrics["chunks_dropped"] += dropped
+        if dropped:
+            logger.info(f"Dropped {dropped} of {seen} chunks as near-duplicates")
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._metrics)
+        stats["dedupe_ratio"] = round(stats["chunks_dropped"] / stats["chunks_seen"], 4) if stats["chunks_seen"] else 0.0
+        return stats
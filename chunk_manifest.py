@@ -0,0 +1,125 @@
+"""
+Content-defined chunk ids and incremental document updates.
+
+A chunk's vector id is "<document key>_<hash of its text>", where the
+document key is the source URL (made id-safe) prefixed with the session id
+for session documents. The ids a document has in an index are its manifest:
+when the document is ingested again, the new chunks are diffed against it and
+only chunks whose text is new get embedded. Chunks that kept their text but
+moved, or whose paper fields changed, are rewritten with their stored vector,
+and chunks that disappeared are deleted. An arXiv v1 -> v2 update then costs
+the embeddings of the edited chunks instead of the whole paper.
+"""
+import os
+import time
+import uuid
+import hashlib
+import logging
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Per-write metadata that does not make a stored chunk stale
+VOLATILE_FIELDS = ("batch_id", "created", "chunk_id", "text")
+# Chunks embedded and written at a time, so a long document is never held as vectors at once
+# (can be overridden from the environment)
+SYNC_BATCH_CHUNKS = int(os.getenv("SYNC_BATCH_CHUNKS", "128"))
+
+
+def document_prefix(url, session_id=None):
+    """The part of every chunk id of a document before the chunk hash"""
+    key = url.replace('/', '_')
+    return f"{session_id}_{key}" if session_id else key
+
+
+def chunk_hash(text):
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()[:16]
+
+
+def chunk_vector_id(prefix, text):
+    return f"{prefix}_{chunk_hash(text)}"
+
+
+def belongs_to(vector_id, prefix):
+    """Whether a vector id is a chunk of the document (and not of one whose key merely starts the same)"""
+    return vector_id.startswith(f"{prefix}_") and "_" not in vector_id[len(prefix) + 1:]
+
+
+def sync_document(index, prefix, texts, base_metadata, embed, on_batch=None, batch_size=SYNC_BATCH_CHUNKS):
+    """
+    Make index hold exactly the chunks texts for the document, embedding only new text.
+
+    index provides document(prefix) -> {id: metadata}, vectors(ids) -> {id: vector},
+    upsert(ids, vectors, metadatas) and delete_ids(ids); embed(texts) returns vectors.
+    texts may be any iterable: it is consumed, embedded and written batch_size
+    chunks at a time. base_metadata is stored with every written chunk, together
+    with its position ("chunk_id"), text, a new batch id and a timestamp. Returns a
+    report of what was done. on_batch(texts, vectors), if given, is called with the
+    texts and vectors of each batch in document order, for callers that need every
+    vector (the library index) without holding the whole document.
+    """
+    # Only what the diff needs; the stored texts are not kept around
+    stored = {vector_id: {field: value for field, value in metadata.items() if field != "text"}
+              for vector_id, metadata in index.document(prefix).items()}
+    # created lets reconcile_vectors.py leave chunks of a just-created session alone
+    batch_id, created = str(uuid.uuid4()), time.time()
+    report = {"chunks": 0, "added": 0, "rewritten": 0, "removed": 0, "unchanged": 0, "embedded": 0}
+
+    wanted, batch = set(), []
+    for text in texts:
+        vector_id = chunk_vector_id(prefix, text)
+        # The same text twice would be the same vector
+        if vector_id in wanted:
+            continue
+        wanted.add(vector_id)
+        batch.append((len(wanted) - 1, vector_id, text))
+        if len(batch) >= batch_size:
+            _write_batch(index, batch, stored, base_metadata, embed, batch_id, created, report, on_batch)
+            batch = []
+    if batch:
+        _write_batch(index, batch, stored, base_metadata, embed, batch_id, created, report, on_batch)
+
+    removed = [vector_id for vector_id in stored if vector_id not in wanted]
+    if removed:
+        # After the upserts, so a failure in between never leaves the document with fewer chunks
+        index.delete_ids(removed)
+    report["removed"] = len(removed)
+    return report
+
+
+def _write_batch(index, batch, stored, base_metadata, embed, batch_id, created, report, on_batch=None):
+    """Embed and write the chunks of one batch of (position, id, text) that are new or stale"""
+    added = [row for row in batch if row[1] not in stored]
+    rewritten = [row for row in batch if row[1] in stored and is_stale(stored[row[1]], row[0], base_metadata)]
+    written = sorted(added + rewritten)
+    report["chunks"] += len(batch)
+    report["added"] += len(added)
+    report["rewritten"] += len(rewritten)
+    report["unchanged"] += len(batch) - len(written)
+
+    needed = batch if on_batch is not None else written
+    kept = [vector_id for _, vector_id, _ in needed if vector_id in stored]
+    vectors = index.vectors(kept) if kept else {}
+    # New text, and stored chunks whose vector could not be read back
+    to_embed = [(vector_id, text) for _, vector_id, text in needed if vector_id not in vectors]
+    if to_embed:
+        vectors.update(zip([vector_id for vector_id, _ in to_embed], embed([text for _, text in to_embed])))
+    report["embedded"] += len(to_embed)
+
+    if written:
+        index.upsert(
+            [vector_id for _, vector_id, _ in written],
+            [vectors[vector_id] for _, vector_id, _ in written],
+            [dict(base_metadata, chunk_id=position, text=text, batch_id=batch_id, created=created)
+             for position, _, text in written]
+        )
+    if on_batch is not None:
+        on_batch([text for _, _, text in batch], [vectors[vector_id] for _, vector_id, _ in batch])
+
+
+def is_stale(metadata, position, base_metadata):
+    """Whether a stored chunk with unchanged text needs its metadata rewritten"""
+    if metadata.get("chunk_id") != position:
+        return True
+    return any(metadata.get(field) != value for field, value in base_metadata.items() if field not in VOLATILE_FIELDS)
@@ -0,0 +1,344 @@
+"""
+Per-document summaries and key points, computed once in the background after
+a document is indexed and cached on disk next to the other indexes.
+
+The text is cut into section-sized parts, each part is summarized on its own
+(map) and the part summaries are merged into one summary plus a list of key
+points (reduce). "Summarize this paper" style questions are then answered from
+the cache instead of from a 1000 character slice of retrieved context. Off
+unless DOCUMENT_SUMMARIES=true, since each document costs several generation calls.
+"""
+import os
+import re
+import json
+import time
+import hashlib
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Summary configuration (can be overridden from the environment)
+# Off by default: every ingested document costs up to SUMMARY_MAX_PARTS + 1 generation calls
+DOCUMENT_SUMMARIES = os.getenv("DOCUMENT_SUMMARIES", "false").lower() == "true"
+SUMMARY_CACHE_DIR = os.getenv("SUMMARY_CACHE_DIR", "summaries")
+# Characters of document text per map call, and the most map calls per document
+SUMMARY_PART_CHARS = int(os.getenv("SUMMARY_PART_CHARS", "3000"))
+SUMMARY_MAX_PARTS = int(os.getenv("SUMMARY_MAX_PARTS", "16"))
+# Part summaries merged by one reduce call; longer lists are reduced in rounds
+SUMMARY_REDUCE_CHARS = int(os.getenv("SUMMARY_REDUCE_CHARS", "6000"))
+# Documents summarized at once, and map calls in flight per document
+SUMMARY_WORKERS = int(os.getenv("SUMMARY_WORKERS", "1"))
+# Longer questions are about something more specific than the whole paper
+SUMMARY_MAX_WORDS = int(os.getenv("SUMMARY_MAX_WORDS", "12"))
+SUMMARY_MAP_CONCURRENCY = int(os.getenv("SUMMARY_MAP_CONCURRENCY", "4"))
+# Oldest cached summaries are removed beyond this many files
+SUMMARY_CACHE_MAX_FILES = int(os.getenv("SUMMARY_CACHE_MAX_FILES", "5000"))
+
+MAP_PROMPT = """<s>[INST] Summarize this part of a research paper in 2-3 sentences. Keep the specific methods, datasets, results and numbers; do not add anything that is not in the text.
+
+Part {number} of {total}:
+{text} [/INST]"""
+
+COMBINE_PROMPT = """<s>[INST] These are summaries of consecutive parts of a research paper. Merge them into one summary of at most 5 sentences, keeping the specific methods, results and numbers.
+
+{text} [/INST]"""
+
+REDUCE_PROMPT = """<s>[INST] These are summaries of consecutive parts of the research paper "{title}". Write an overall summary of the paper in at most 5 sentences, then list its main contributions and findings as 3-6 short bullet points. Use only the information below.
+
+{text}
+
+Answer in exactly this format:
+Summary: <summary>
+Key points:
+- <point>
+- <point> [/INST]"""
+
+# Politeness wrappers stripped before matching
+_PREFIX = re.compile(r"^(?:(?:please|hey|hi|ok|okay|so)\s*,?\s+)*"
+                     r"(?:(?:can|could|would) you (?:please )?(?:give(?: me)? |write |provide )?"
+                     r"|(?:give(?: me)?|write|provide|i want|i'd like)\s+)?")
+_DOCUMENT = r"(?:paper|article|work|study|document)"
+# "... of this paper"; only the paper as a whole, not one of its sections or tables
+_WHOLE = rf"(?:\s+(?:of|for|on)\s+(?:this|the|that|it)(?:\s+{_DOCUMENT})?)?"
+_IT = rf"(?:it|this|that|(?:this|the) {_DOCUMENT})"
+
+# Whole questions answered from the summary, and the ones asking for the key points
+SUMMARY_QUERY = re.compile(
+    rf"(?:what(?:'s| is) )?(?:a |an |the |its )?(?:short |brief |quick |high-level )?"
+    rf"(?:summary|overview|tl;?dr|gist|summarization){_WHOLE}"
+    rf"|summari[sz]e(?: {_IT})?(?: for me| briefly| in brief| in a nutshell)?"
+    rf"|what(?:'s| is) {_IT} about"
+    rf"|what does {_IT} (?:do|propose|say)"
+    rf"|explain {_IT}(?: in brief| briefly| in a nutshell| in simple terms)?"
+)
+KEY_POINTS_QUERY = re.compile(
+    rf"(?:what are |list )?(?:the |its )?(?:main|key|major|primary|core) "
+    rf"(?:contributions?|points?|findings?|ideas?|takeaways?|results?){_WHOLE}"
+    rf"|(?:what are |list )?(?:the |its )?(?:contributions?|takeaways?) of {_IT}"
+    rf"|what (?:does|did) {_IT} (?:contribute|find|show)"
+)
+
+
+def summary_intent(query):
+    """'key_points', 'summary' or None for any other question, including ones about part of the paper"""
+    text = " ".join(query.lower().split()).rstrip("?.! ")
+    text = _PREFIX.sub("", text)
+    if not text or len(text.split()) > SUMMARY_MAX_WORDS:
+        return None
+    if KEY_POINTS_QUERY.fullmatch(text):
+        return "key_points"
+    if SUMMARY_QUERY.fullmatch(text):
+        return "summary"
+    return None
+
+
+def content_hash(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def split_parts(text, part_chars=SUMMARY_PART_CHARS, max_parts=SUMMARY_MAX_PARTS):
+    """Cut text at paragraph boundaries into at most max_parts parts of about part_chars"""
+    # Long documents get bigger parts rather than an unbounded number of calls
+    part_chars = max(part_chars, -(-len(text) // max_parts))
+    paragraphs = [paragraph.strip() for paragraph in re.split(r"\n\s*\n", text) if paragraph.strip()]
+    parts, current = [], ""
+    for paragraph in paragraphs:
+        # A single paragraph longer than a part is cut where it must be
+        while len(paragraph) > part_chars:
+            if current:
+                parts.append(current)
+                current = ""
+            parts.append(paragraph[:part_chars])
+            paragraph = paragraph[part_chars:]
+        if current and len(current) + len(paragraph) + 2 > part_chars:
+            parts.append(current)
+            current = ""
+        current = f"{current}\n\n{paragraph}" if current else paragraph
+    if current:
+        parts.append(current)
+    return parts[:max_parts]
+
+
+def parse_reduce(response):
+    """(summary, key points) from the reduce call's answer"""
+    summary_text, _, points_text = response.partition("Key points:")
+    summary = re.sub(r"^\s*Summary:\s*", "", summary_text).strip()
+    key_points = [
+        re.sub(r"^\s*(?:[-*•]|\d+[.)])\s*", "", line).strip()
+        for line in points_text.splitlines()
+    ]
+    return summary, [point for point in key_points if point]
+
+
+class DocumentSummarizer:
+    """
+    Runs summary jobs on a small background pool and caches the results.
+
+    complete(prompt, max_new_tokens) is the text generation call; it returns
+    the generated text or None on failure. Results are stored as one JSON file
+    per document so every worker process can serve them.
+    """
+
+    def __init__(self, complete, cache_dir=SUMMARY_CACHE_DIR, workers=SUMMARY_WORKERS):
+        self.complete = complete
+        self.cache_dir = cache_dir
+        self._executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="summary")
+        self._lock = threading.Lock()
+        self._pending = {}  # source -> content hash being summarized
+        self._cache = {}  # source -> (file mtime, record)
+        self._stats = {"scheduled": 0, "completed": 0, "failed": 0, "served": 0, "seconds": 0.0}
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _path(self, source):
+        return os.path.join(self.cache_dir, hashlib.sha1(source.encode("utf-8")).hexdigest() + ".json")
+
+    def _load(self, source):
+        """The cached record of a document, re-read when another worker rewrote it"""
+        path = self._path(source)
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except FileNotFoundError:
+            with self._lock:
+                self._cache.pop(source, None)
+            return None
+        with self._lock:
+            cached = self._cache.get(source)
+        if cached and cached[0] == mtime:
+            return cached[1]
+        try:
+            with open(path, encoding="utf-8") as f:
+                record = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.error(f"Error reading summary for {source}: {str(e)}")
+            return None
+        with self._lock:
+            self._cache[source] = (mtime, record)
+        return record
+
+    def schedule(self, source, text, title=None):
+        """Queue a summary of a document unless an up to date one exists or is being made"""
+        digest = content_hash(text)
+        with self._lock:
+            if self._pending.get(source) == digest:
+                return False
+        record = self._load(source)
+        if record and record.get("content_hash") == digest:
+            return False
+        if record:
+            # The document changed, so the old summary must not be served
+            self.discard(source)
+        with self._lock:
+            if self._pending.get(source) == digest:
+                return False
+            self._pending[source] = digest
+            self._stats["scheduled"] += 1
+        self._executor.submit(self._run, source, text, title or "", digest)
+        logger.info(f"Scheduled summary of {source}")
+        return True
+
+    def get(self, source):
+        """The cached summary record of a document, or None if there is none yet"""
+        return self._load(source)
+
+    def is_pending(self, source):
+        with self._lock:
+            return source in self._pending
+
+    def discard(self, source):
+        try:
+            os.remove(self._path(source))
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.error(f"Error removing summary for {source}: {str(e)}")
+        with self._lock:
+            self._cache.pop(source, None)
+
+    def mark_served(self):
+        with self._lock:
+            self._stats["served"] += 1
+
+    def _run(self, source, text, title, digest):
+        started = time.time()
+        try:
+            record = self.summarize(text, title)
+            if record is None:
+                with self._lock:
+                    self._stats["failed"] += 1
+                logger.warning(f"Could not summarize {source}")
+                return
+            elapsed = time.time() - started
+            record.update(source=source, content_hash=digest, created=time.time(), seconds=round(elapsed, 2))
+            self._write(source, record)
+            with self._lock:
+                self._stats["completed"] += 1
+                self._stats["seconds"] += elapsed
+            logger.info(f"Summarized {source} from {record['parts']} parts in {elapsed:.1f}s")
+        except Exception as e:
+            with self._lock:
+                self._stats["failed"] += 1
+            logger.error(f"Error summarizing {source}: {str(e)}")
+        finally:
+            with self._lock:
+                if self._pending.get(source) == digest:
+                    del self._pending[source]
+
+    def summarize(self, text, title=""):
+        """Map-reduce summary of a text; None if any generation call failed"""
+        parts = split_parts(text)
+        if not parts:
+            return None
+
+        def summarize_part(numbered):
+            number, part = numbered
+            return self.complete(MAP_PROMPT.format(number=number, total=len(parts), text=part), 150)
+
+        with ThreadPoolExecutor(max_workers=max(1, min(SUMMARY_MAP_CONCURRENCY, len(parts)))) as executor:
+            summaries = list(executor.map(summarize_part, enumerate(parts, 1)))
+        if any(not summary for summary in summaries):
+            return None
+
+        # Merge neighbouring part summaries until they fit one reduce call
+        while len("\n\n".join(summaries)) > SUMMARY_REDUCE_CHARS and len(summaries) > 1:
+            groups, current = [], []
+            for summary in summaries:
+                if current and len("\n\n".join(current + [summary])) > SUMMARY_REDUCE_CHARS:
+                    groups.append(current)
+                    current = []
+                current.append(summary)
+            groups.append(current)
+            if len(groups) == len(summaries):
+                # Every summary is too long on its own; pair them up instead
+                groups = [summaries[i:i + 2] for i in range(0, len(summaries), 2)]
+            summaries = [
+                self.complete(COMBINE_PROMPT.format(text="\n\n".join(group)), 250) if len(group) > 1 else group[0]
+                for group in groups
+            ]
+            if any(not summary for summary in summaries):
+                return None
+
+        response = self.complete(
+            REDUCE_PROMPT.format(title=title or "untitled", text="\n\n".join(summaries)),
+            400
+        )
+        if not response:
+            return None
+        summary, key_points = parse_reduce(response)
+        if not summary:
+            return None
+        return {"title": title, "summary": summary, "key_points": key_points, "parts": len(parts)}
+
+    def _write(self, source, record):
+        path = self._path(source)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(record, f)
+        os.replace(tmp_path, path)
+        self._prune()
+
+    def _prune(self):
+        """Drop the oldest summaries once the cache holds too many"""
+        try:
+            entries = [entry for entry in os.scandir(self.cache_dir) if entry.name.endswith(".json")]
+            if len(entries) <= SUMMARY_CACHE_MAX_FILES:
+                return
+            entries.sort(key=lambda entry: entry.stat().st_mtime)
+            for entry in entries[:len(entries) - SUMMARY_CACHE_MAX_FILES]:
+                os.remove(entry.path)
+            logger.info(f"Pruned {len(entries) - SUMMARY_CACHE_MAX_FILES} old summaries")
+        except OSError as e:
+            logger.error(f"Error pruning summaries: {str(e)}")
+
+    def stats(self):
+        with self._lock:
+            completed = self._stats["completed"]
+            return {
+                "enabled": DOCUMENT_SUMMARIES,
+                "pending": len(self._pending),
+                "scheduled": self._stats["scheduled"],
+                "completed": completed,
+                "failed": self._stats["failed"],
+                "served": self._stats["served"],
+                "avg_seconds": round(self._stats["seconds"] / completed, 2) if completed else None,
+            }
+
+
+def format_answer(intent, records):
+    """
+    Answer text from summary records.
+    records is a list of (label, record); labels are only shown for several documents.
+    """
+    blocks = []
+    for label, record in records:
+        if intent == "key_points" and record.get("key_points"):
+            body = "\n".join(f"- {point}" for point in record["key_points"])
+        else:
+            body = record["summary"]
+            if record.get("key_points"):
+                body += "\n\nKey points:\n" + "\n".join(f"- {point}" for point in record["key_points"])
+        blocks.append(f"[{label}]\n{body}" if len(records) > 1 else body)
+    return "\n\n".join(blocks)
@@ -0,0 +1,151 @@
+import os
+import time
+import queue
+import logging
+import threading
+from concurrent.futures import Future
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Batcher configuration (can be overridden from the environment)
+EMBED_BATCH_WINDOW_MS = float(os.getenv("EMBED_BATCH_WINDOW_MS", "5"))
+EMBED_BATCH_MAX_SIZE = int(os.getenv("EMBED_BATCH_MAX_SIZE", "32"))
+
+# Upper bounds of the batch size histogram buckets
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128)
+
+
+class EmbeddingBatcher:
+    """Collects concurrent embedding requests and runs them as one batch.
+
+    Callers get a Future from ``submit``. A single worker thread takes the
+    first queued text, keeps collecting for up to ``window_ms`` or until
+    ``max_batch_size`` texts are waiting, then passes them all to
+    ``embed_batch(texts)`` and resolves every caller's future with its row.
+    A lone request therefore waits at most one window; under concurrency
+    the model runs one forward pass per batch instead of one per query.
+    """
+
+    def __init__(self, embed_batch, max_batch_size=EMBED_BATCH_MAX_SIZE, window_ms=EMBED_BATCH_WINDOW_MS):
+        self.embed_batch = embed_batch
+        self.max_batch_size = max(1, max_batch_size)
+        self.window = max(0.0, window_ms) / 1000.0
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        self._metrics = {
+            "requests": 0,
+            "batches": 0,
+            "errors": 0,
+            "max_batch_size_seen": 0,
+            "total_queue_wait_seconds": 0.0,
+            "max_queue_wait_seconds": 0.0,
+            "total_embed_seconds": 0.0,
+        }
+        self._histogram = {f"<={bucket}": 0 for bucket in BATCH_SIZE_BUCKETS}
+        self._histogram[f">{BATCH_SIZE_BUCKETS[-1]}"] = 0
+
+    def submit(self, text):
+        """Queue one text for embedding; returns a Future resolving to its vector"""
+        self._ensure_started()
+        future = Future()
+        self._queue.put((text, future, time.monotonic()))
+        return future
+
+    def embed(self, text, timeout=None):
+        """Embed one text through the batcher and wait for the result"""
+        return self.submit(text).result(timeout)
+
+    def stats(self):
+        """Batch size and queue wait metrics for monitoring"""
+        with self._lock:
+            stats = dict(self._metrics)
+            batches = stats["batches"]
+            stats.update({
+                "window_ms": self.window * 1000.0,
+                "max_batch_size": self.max_batch_size,
+                "queue_depth": self._queue.qsize(),
+                "avg_batch_size": stats["requests"] / batches if batches else 0.0,
+                "avg_queue_wait_seconds": stats["total_queue_wait_seconds"] / stats["requests"] if stats["requests"] else 0.0,
+                "batch_size_histogram": dict(self._histogram),
+            })
+        return stats
+
+    def _ensure_started(self):
+        # Threads do not survive a fork, so check the owning pid as well
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid():
+                return
+            if self._pid is not None and self._pid != os.getpid():
+                # Requests queued by the parent belong to its (dead) worker
+                self._queue = queue.Queue()
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name="embedding-batcher", daemon=True)
+            self._thread.start()
+            logger.info(f"Started embedding batcher in process {self._pid}")
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            try:
+                self._process(batch)
+            except Exception as e:
+                # Never let one bad batch stop the worker
+                logger.error(f"Embedding batcher failed: {str(e)}")
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.window
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining <= 0:
+                    # Window is over, but still take whatever is already waiting
+                    batch.append(self._queue.get_nowait())
+                else:
+                    batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _process(self, batch):
+        started = time.monotonic()
+        # Skip requests whose callers gave up before the batch ran
+        batch = [item for item in batch if item[1].set_running_or_notify_cancel()]
+        if not batch:
+            return
+
+        try:
+            vectors = self.embed_batch([text for text, _, _ in batch])
+            if len(vectors) != len(batch):
+                raise ValueError(f"Embedding model returned {len(vectors)} vectors for {len(batch)} texts")
+        except Exception as e:
+            logger.error(f"Error embedding batch of {len(batch)} queries: {str(e)}")
+            for _, future, _ in batch:
+                future.set_exception(e)
+            with self._lock:
+                self._metrics["errors"] += 1
+            return
+
+        for (_, future, _), vector in zip(batch, vectors):
+            future.set_result(vector)
+
+        waits = [started - enqueued for _, _, enqueued in batch]
+        with self._lock:
+            self._metrics["requests"] += len(batch)
+            self._metrics["batches"] += 1
+            self._metrics["max_batch_size_seen"] = max(self._metrics["max_batch_size_seen"], len(batch))
+            self._metrics["total_queue_wait_seconds"] += sum(waits)
+            self._metrics["max_queue_wait_seconds"] = max(self._metrics["max_queue_wait_seconds"], max(waits))
+            self._metrics["total_embed_seconds"] += time.monotonic() - started
+            for bucket in BATCH_SIZE_BUCKETS:
+                if len(batch) <= bucket:
+                    self._histogram[f"<={bucket}"] += 1
+                    break
+            else:
+                self._histogram[f">{BATCH_SIZE_BUCKETS[-1]}"] += 1
@@ -0,0 +1,130 @@
+"""
+Compare the memory used by N workers for each EMBEDDING_MODE.
+
+Each mode runs in a fresh interpreter. Workers load (or reach) the model and
+embed one query, then total RSS and PSS are read from /proc for the workers,
+the parent that forked them and, in server mode, the sidecar. PSS splits
+shared pages between the processes that map them, so its total is the real
+footprint; RSS counts shared weights once per worker.
+
+    python embedding_memory_benchmark.py --workers 4
+"""
+import os
+import sys
+import gc
+import json
+import time
+import argparse
+import tempfile
+import subprocess
+import multiprocessing
+
+MODES = ("local", "preload", "server")
+QUERY = "What problem does this paper address?"
+SERVER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "embedding_server.py")
+
+
+def memory_of(pid):
+    """RSS and PSS of a process in bytes (Linux only)"""
+    values = {"rss": 0, "pss": 0}
+    with open(f"/proc/{pid}/smaps_rollup") as rollup:
+        for line in rollup:
+            key, _, rest = line.partition(":")
+            if key in ("Rss", "Pss"):
+                values[key.lower()] = int(rest.split()[0]) * 1024
+    return values
+
+
+def _worker(mode, socket_path, ready, stop):
+    if mode == "server":
+        from embedding_server import RemoteEmbeddings
+        embeddings = RemoteEmbeddings(socket_path, autostart=False)
+    elif mode == "local":
+        from finalEmbed import load_embedding_model
+        embeddings = load_embedding_model()
+    else:
+        from finalEmbed import get_embeddings
+        embeddings = get_embeddings()
+    embeddings.embed_query(QUERY)
+    ready.put(os.getpid())
+    stop.wait()
+
+
+def run_mode(mode, workers):
+    """Measure one mode in this process and return the totals"""
+    os.environ["EMBEDDING_MODE"] = mode
+    context = multiprocessing.get_context("fork")
+    ready, stop = context.Queue(), context.Event()
+    server = None
+    socket_path = os.path.join(tempfile.mkdtemp(), "embeddings.sock")
+
+    started = time.time()
+    if mode == "preload":
+        from finalEmbed import preload_embeddings
+        preload_embeddings()
+        gc.freeze()
+    elif mode == "server":
+        from embedding_server import _can_connect
+        server = subprocess.Popen([sys.executable, SERVER_SCRIPT, "--socket", socket_path])
+        while not _can_connect(socket_path):
+            if server.poll() is not None:
+                raise RuntimeError("Embedding server exited during startup")
+            time.sleep(0.5)
+
+    processes = [context.Process(target=_worker, args=(mode, socket_path, ready, stop)) for _ in range(workers)]
+    for process in processes:
+        process.start()
+    pids = [ready.get(timeout=600) for _ in processes]
+    elapsed = time.time() - started
+
+    measured = pids + [os.getpid()] + ([server.pid] if server else [])
+    totals = {"rss": 0, "pss": 0}
+    for pid in measured:
+        for key, value in memory_of(pid).items():
+            totals[key] += value
+
+    stop.set()
+    for process in processes:
+        process.join()
+    if server:
+        server.terminate()
+        server.wait()
+
+    return {
+        "mode": mode,
+        "workers": workers,
+        "processes": len(measured),
+        "rss_mb": round(totals["rss"] / 2**20, 1),
+        "pss_mb": round(totals["pss"] / 2**20, 1),
+        "startup_seconds": round(elapsed, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--modes", nargs="+", choices=MODES, default=list(MODES))
+    parser.add_argument("--run-mode", choices=MODES, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_mode:
+        print(json.dumps(run_mode(args.run_mode, args.workers)))
+        return
+
+    results = []
+    for mode in args.modes:
+        # A fresh interpreter per mode so one mode's model does not count against the next
+        output = subprocess.run(
+            [sys.executable, __file__, "--run-mode", mode, "--workers", str(args.workers)],
+            check=True, capture_output=True, text=True
+        ).stdout
+        results.append(json.loads(output.strip().splitlines()[-1]))
+
+    print(f"{'mode':<10}{'procs':>7}{'RSS MB':>12}{'PSS MB':>12}{'startup s':>12}")
+    for result in results:
+        print(f"{result['mode']:<10}{result['processes']:>7}{result['rss_mb']:>12}"
+              f"{result['pss_mb']:>12}{result['startup_seconds']:>12}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,279 @@
+import os
+import sys
+import json
+import time
+import socket
+import struct
+import logging
+import argparse
+import threading
+import subprocess
+import socketserver
+from langchain_core.embeddings import Embeddings
+from embedding_batcher import EmbeddingBatcher
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Sidecar configuration (can be overridden from the environment)
+EMBEDDING_SERVER_SOCKET = os.getenv("EMBEDDING_SERVER_SOCKET", "/tmp/research-assistant-embeddings.sock")
+EMBEDDING_SERVER_TIMEOUT = float(os.getenv("EMBEDDING_SERVER_TIMEOUT", "60"))
+# Seconds a worker waits for an auto-started server to load its model
+EMBEDDING_SERVER_START_TIMEOUT = float(os.getenv("EMBEDDING_SERVER_START_TIMEOUT", "180"))
+EMBEDDING_SERVER_AUTOSTART = os.getenv("EMBEDDING_SERVER_AUTOSTART", "true").lower() == "true"
+
+# Messages are a 4-byte big-endian length followed by a JSON body
+_HEADER = struct.Struct(">I")
+MAX_MESSAGE_BYTES = 64 * 1024 * 1024
+
+
+def send_message(sock, payload):
+    body = json.dumps(payload).encode("utf-8")
+    sock.sendall(_HEADER.pack(len(body)) + body)
+
+
+def recv_message(sock):
+    """Read one message; returns None if the peer closed the connection"""
+    header = _recv_exact(sock, _HEADER.size)
+    if header is None:
+        return None
+    (length,) = _HEADER.unpack(header)
+    if length > MAX_MESSAGE_BYTES:
+        raise ValueError(f"Message of {length} bytes exceeds the {MAX_MESSAGE_BYTES} byte limit")
+    body = _recv_exact(sock, length)
+    if body is None:
+        raise ConnectionError("Connection closed in the middle of a message")
+    return json.loads(body.decode("utf-8"))
+
+
+def _recv_exact(sock, size):
+    chunks = []
+    remaining = size
+    while remaining:
+        chunk = sock.recv(remaining)
+        if not chunk:
+            return None
+        chunks.append(chunk)
+        remaining -= len(chunk)
+    return b"".join(chunks)
+
+
+def _rss_bytes():
+    try:
+        with open("/proc/self/status") as status:
+            for line in status:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+class EmbeddingServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """Serves one loaded embedding model to every worker over a Unix socket.
+
+    Query requests from all connections go through a shared EmbeddingBatcher,
+    so concurrent queries from different gunicorn workers share a forward
+    pass. Document batches are embedded directly since they are batched
+    already.
+    """
+
+    daemon_threads = True
+    # Every thread of every worker keeps a connection, and they all connect at once on startup
+    request_queue_size = 128
+
+    def __init__(self, embeddings, socket_path=EMBEDDING_SERVER_SOCKET):
+        self.embeddings = embeddings
+        self.batcher = EmbeddingBatcher(embeddings.embed_documents)
+        self.started = time.time()
+        self.requests = 0
+        self.errors = 0
+        self._lock = threading.Lock()
+        socketserver.UnixStreamServer.__init__(self, socket_path, _EmbeddingRequestHandler)
+
+    def handle_payload(self, payload):
+        op = payload.get("op")
+        if op == "stats":
+            with self._lock:
+                stats = {"requests": self.requests, "errors": self.errors}
+            stats.update({
+                "pid": os.getpid(),
+                "rss_bytes": _rss_bytes(),
+                "uptime_seconds": time.time() - self.started,
+                "batcher": self.batcher.stats(),
+            })
+            return {"stats": stats}
+        if op != "embed":
+            raise ValueError(f"Unknown operation: {op}")
+
+        texts = payload.get("texts") or []
+        if payload.get("kind") == "query":
+            futures = [self.batcher.submit(text) for text in texts]
+            vectors = [future.result(EMBEDDING_SERVER_TIMEOUT) for future in futures]
+        else:
+            vectors = self.embeddings.embed_documents(texts)
+        # Plain lists so numpy rows serialize
+        return {"vectors": [list(map(float, vector)) for vector in vectors]}
+
+
+class _EmbeddingRequestHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        # Workers keep one connection open and send many requests over it
+        while True:
+            try:
+                payload = recv_message(self.request)
+            except (OSError, ValueError) as e:
+                logger.warning(f"Dropping embedding client: {str(e)}")
+                return
+            if payload is None:
+                return
+            try:
+                response = self.server.handle_payload(payload)
+                with self.server._lock:
+                    self.server.requests += 1
+            except Exception as e:
+                logger.error(f"Error serving embedding request: {str(e)}")
+                with self.server._lock:
+                    self.server.errors += 1
+                response = {"error": str(e)}
+            try:
+                send_message(self.request, response)
+            except OSError:
+                return
+
+
+def _can_connect(socket_path):
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as probe:
+            probe.settimeout(1)
+            probe.connect(socket_path)
+        return True
+    except OSError:
+        return False
+
+
+def ensure_server(socket_path=EMBEDDING_SERVER_SOCKET, timeout=EMBEDDING_SERVER_START_TIMEOUT):
+    """Start the sidecar if nothing is listening on socket_path.
+
+    Workers serialize on a lock file next to the socket, so only the first
+    one spawns the server and the others wait for it to come up.
+    """
+    if _can_connect(socket_path):
+        return True
+
+    import fcntl  # Unix only, like the socket itself
+
+    with open(socket_path + ".lock", "w") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            if _can_connect(socket_path):
+                return True
+            logger.info(f"Starting embedding server on {socket_path}")
+            subprocess.Popen(
+                [sys.executable, os.path.abspath(__file__), "--socket", socket_path],
+                stdin=subprocess.DEVNULL,
+                start_new_session=True  # Outlives the worker that happened to start it
+            )
+            deadline = time.time() + timeout
+            while time.time() < deadline:
+                if _can_connect(socket_path):
+                    return True
+                time.sleep(0.5)
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    logger.error(f"Embedding server did not start within {timeout} seconds")
+    return False
+
+
+class RemoteEmbeddings(Embeddings):
+    """Embeddings client for the shared sidecar, one connection per thread"""
+
+    def __init__(self, socket_path=EMBEDDING_SERVER_SOCKET, timeout=EMBEDDING_SERVER_TIMEOUT,
+                 autostart=EMBEDDING_SERVER_AUTOSTART):
+        self.socket_path = socket_path
+        self.timeout = timeout
+        self.autostart = autostart
+        self._local = threading.local()
+
+    def embed_documents(self, texts):
+        return self._request({"op": "embed", "kind": "documents", "texts": list(texts)})["vectors"]
+
+    def embed_query(self, text):
+        return self._request({"op": "embed", "kind": "query", "texts": [text]})["vectors"][0]
+
+    def server_stats(self):
+        return self._request({"op": "stats"})["stats"]
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        # A connection inherited across fork would be shared with the parent
+        if conn is not None and self._local.pid == os.getpid():
+            return conn
+        if self.autostart:
+            ensure_server(self.socket_path)
+        conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        conn.settimeout(self.timeout)
+        conn.connect(self.socket_path)
+        self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    def _close(self):
+        conn = getattr(self._local, "conn", None)
+        self._local.conn = None
+        if conn is not None:
+            try:
+                conn.close()
+            except OSError:
+                pass
+
+    def _request(self, payload):
+        # Retry once on a fresh connection in case the server was restarted
+        for attempt in range(2):
+            try:
+                conn = self._connection()
+                send_message(conn, payload)
+                response = recv_message(conn)
+                if response is None:
+                    raise ConnectionError("Embedding server closed the connection")
+                break
+            except OSError as e:
+                self._close()
+                if attempt:
+                    raise
+                logger.warning(f"Reconnecting to embedding server: {str(e)}")
+        if "error" in response:
+            raise RuntimeError(f"Embedding server error: {response['error']}")
+        return response
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the embedding model to all workers over a Unix socket")
+    parser.add_argument("--socket", default=EMBEDDING_SERVER_SOCKET, help="Unix socket path to listen on")
+    args = parser.parse_args()
+
+    if _can_connect(args.socket):
+        logger.info(f"An embedding server is already listening on {args.socket}")
+        return
+    # Nothing answers on the path, so any file left there is stale
+    if os.path.exists(args.socket):
+        os.remove(args.socket)
+
+    # Imported here so the client side does not pull in the model stack
+    from finalEmbed import load_embedding_model
+
+    started = time.time()
+    embeddings = load_embedding_model()
+    server = EmbeddingServer(embeddings, args.socket)
+    logger.info(f"Embedding server ready on {args.socket} in {time.time() - started:.1f}s (pid {os.getpid()})")
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        if os.path.exists(args.socket):
+            os.remove(args.socket)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+import os
+import re
+import math
+import time
+import logging
+import threading
+import numpy as np
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Extractive answer settings (can be overridden from the environment)
+# Sentences in an answer, and candidate sentences embedded per question
+EXTRACTIVE_SENTENCES = int(os.getenv("EXTRACTIVE_SENTENCES", "3"))
+EXTRACTIVE_MAX_CANDIDATES = int(os.getenv("EXTRACTIVE_MAX_CANDIDATES", "64"))
+# Share of the score that comes from BM25 term overlap rather than embedding similarity
+EXTRACTIVE_BM25_WEIGHT = float(os.getenv("EXTRACTIVE_BM25_WEIGHT", "0.3"))
+# Sentences scoring below this are never used
+EXTRACTIVE_MIN_SCORE = float(os.getenv("EXTRACTIVE_MIN_SCORE", "0.2"))
+
+# Sentences shorter than this are headings or fragments, longer ones are tables or run-ons
+MIN_SENTENCE_CHARS = 25
+MAX_SENTENCE_CHARS = 600
+
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+SENTENCE_BOUNDARY = re.compile(r'(?<=[.!?])\s+(?=["\'(\[]?[A-Z0-9])|\n\s*\n')
+TOKEN = re.compile(r"[a-z0-9]+")
+STOPWORDS = frozenset("""a an and are as at be by do does for from has have how in is it its of on or
+that the their this to was were what when where which who why will with""".split())
+
+
+def split_sentences(text):
+    """Sentences of a passage, without fragments too short or long to quote"""
+    sentences = []
+    for sentence in SENTENCE_BOUNDARY.split(text or ""):
+        sentence = " ".join(sentence.split())
+        if MIN_SENTENCE_CHARS <= len(sentence) <= MAX_SENTENCE_CHARS:
+            sentences.append(sentence)
+    return sentences
+
+
+def terms(text):
+    return [token for token in TOKEN.findall(text.lower()) if token not in STOPWORDS]
+
+
+def bm25_scores(query_terms, documents):
+    """BM25 of every tokenized document for the query, with IDF taken from the documents themselves"""
+    if not documents or not query_terms:
+        return np.zeros(len(documents), dtype=np.float32)
+    average_length = sum(len(document) for document in documents) / len(documents) or 1.0
+    frequencies = {}
+    for document in documents:
+        for term in set(document):
+            frequencies[term] = frequencies.get(term, 0) + 1
+    scores = np.zeros(len(documents), dtype=np.float32)
+    for term in set(query_terms):
+        containing = frequencies.get(term, 0)
+        if not containing:
+            continue
+        idf = math.log(1 + (len(documents) - containing + 0.5) / (containing + 0.5))
+        for position, document in enumerate(documents):
+            count = document.count(term)
+            if count:
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * len(document) / average_length)
+                scores[position] += idf * count * (BM25_K1 + 1) / (count + norm)
+    return scores
+
+
+class ExtractiveAnswerer:
+    """Answers a question with the retrieved sentences that match it best.
+
+    ``get_embeddings()`` returns the embedding model used for retrieval. The
+    passages are split into sentences, the ones sharing the most terms with
+    the question (BM25) are kept as candidates, and all candidates are
+    embedded in one batch and scored against the query vector with a single
+    matrix product. No generative model is involved.
+    """
+
+    def __init__(self, get_embeddings, sentences=EXTRACTIVE_SENTENCES, max_candidates=EXTRACTIVE_MAX_CANDIDATES,
+                 bm25_weight=EXTRACTIVE_BM25_WEIGHT, min_score=EXTRACTIVE_MIN_SCORE):
+        self.get_embeddings = get_embeddings
+        self.sentences = max(1, sentences)
+        self.max_candidates = max(1, max_candidates)
+        self.bm25_weight = bm25_weight
+        self.min_score = min_score
+        self._lock = threading.Lock()
+        self._metrics = {"answers": 0, "no_match": 0, "total_ms": 0.0}
+
+    def rank(self, query, passages):
+        """
+        The best sentences for the query as [(score, label, chunk id, sentence)].
+        passages is a list of (label, chunk id, text); label and chunk id may be None.
+        """
+        candidates, seen = [], set()
+        for label, chunk_id, text in passages:
+            for sentence in split_sentences(text):
+                key = sentence.lower()
+                if key not in seen:
+                    seen.add(key)
+                    candidates.append((label, chunk_id, sentence))
+        if not candidates:
+            return []
+
+        lexical = bm25_scores(terms(query), [terms(sentence) for _, _, sentence in candidates])
+        if len(candidates) > self.max_candidates:
+            # Stable, so ties keep retrieval order
+            keep = np.argsort(-lexical, kind="stable")[:self.max_candidates]
+            candidates = [candidates[i] for i in keep]
+            lexical = lexical[keep]
+        if lexical.max() > 0:
+            lexical = lexical / lexical.max()
+
+        embeddings = self.get_embeddings()
+        matrix = np.asarray(embeddings.embed_documents([sentence for _, _, sentence in candidates]), dtype=np.float32)
+        query_vector = np.asarray(embeddings.embed_query(query), dtype=np.float32)
+        matrix /= np.linalg.norm(matrix, axis=1, keepdims=True) + 1e-12
+        query_vector /= np.linalg.norm(query_vector) + 1e-12
+        semantic = matrix @ query_vector
+
+        scores = (1 - self.bm25_weight) * semantic + self.bm25_weight * lexical
+        order = np.argsort(-scores, kind="stable")[:self.sentences]
+        return [(float(scores[i]),) + candidates[i] for i in order if scores[i] >= self.min_score]
+
+    def answer(self, query, passages):
+        """A few quoted sentences with their sources, or None if nothing matched"""
+        started = time.time()
+        ranked = self.rank(query, passages)
+        with self._lock:
+            self._metrics["total_ms"] += (time.time() - started) * 1000
+            self._metrics["answers" if ranked else "no_match"] += 1
+        if not ranked:
+            return None
+        return format_answer(ranked)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._metrics)
+        calls = stats["answers"] + stats["no_match"]
+        stats["average_ms"] = round(stats.pop("total_ms") / calls, 1) if calls else None
+        return stats
+
+
+def format_answer(ranked):
+    """Sentences in ranked order, each followed by the chunk it was taken from"""
+    lines = []
+    for _, label, chunk_id, sentence in ranked:
+        cited = [part for part in (label, f"chunk {chunk_id}" if chunk_id is not None else None) if part]
+        lines.append(f"{sentence} [{', '.join(cited)}]" if cited else sentence)
+    return "From the paper:\n" + "\n".join(lines)
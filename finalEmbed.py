@@ -1,15 +1,27 @@
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_huggingface import HuggingFaceEmbeddings
-from langchain_core.prompts import ChatPromptTemplate
-from langchain_huggingface import HuggingFaceEndpoint
-from langchain_pinecone import PineconeVectorStore
-import pinecone
+from langchain_core.embeddings import Embeddings
 import os
+import re
 import time
+import itertools
 import logging
 import requests
-import uuid
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
+from embedding_batcher import EmbeddingBatcher
+from vector_writer import VectorWriter, VectorWriteError
+from embedding_server import RemoteEmbeddings
+from onnx_embeddings import load_backend
+from local_index import LocalVectorIndex, LocalVectorStore, LOCAL_INDEX_DIR
+from library_index import LibraryIndex, LIBRARY_INDEX_DIR
+from index_schema import IndexSchema, SchemaRegistry
+from document_summaries import DocumentSummarizer, DOCUMENT_SUMMARIES, summary_intent, format_answer
+from generation_scheduler import GenerationScheduler, GenerationBusy, INTERACTIVE, BACKGROUND, current_deadline
+from generation_client import GenerationClient, BackendError
+from extractive_answerer import ExtractiveAnswerer
+from chunk_dedup import ChunkDeduplicator, CHUNK_DEDUP
+from chunk_manifest import sync_document, document_prefix, belongs_to
+from scrapers.paper import pack_segments
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
@@ -18,74 +30,559 @@ logger = logging.getLogger(__name__)
 # Load environment variables
 load_dotenv()
 
-# Initialize Pinecone
-def init_pinecone():
+# Embedding model and chunker for stored chunks and queries. Together they form
+# the index schema (see index_schema.py): changing any of them builds a new index
+# with index_migration.py while the current one keeps serving
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "mistralai/Mistral-Embed")
+EMBEDDING_DIMENSION = int(os.getenv("EMBEDDING_DIMENSION", "1024"))
+CHUNK_SIZE = int(os.getenv("CHUNK_SIZE", "1000"))
+CHUNK_OVERLAP = int(os.getenv("CHUNK_OVERLAP", "300"))
+CHUNKER_VERSION = f"recursive-{CHUNK_SIZE}-{CHUNK_OVERLAP}"
+CONFIGURED_SCHEMA = IndexSchema(EMBEDDING_MODEL, EMBEDDING_DIMENSION, CHUNKER_VERSION)
+
+# Pinecone index of the first schema, later schemas get "<name>-<schema id>";
+# provisioned with `python fix_index.py provision`
+PINECONE_INDEX_NAME = "research-assistant"
+# Seconds a Pinecone connectivity check is reused by /health and the request routes
+PINECONE_CHECK_INTERVAL = int(os.getenv("PINECONE_CHECK_INTERVAL", "60"))
+
+# Text generation endpoint used for answers and document summaries
+GENERATION_URL = "https://api-inference.huggingface.co/models/mistralai/Mistral-7B-Instruct-v0.2"
+# Seconds to connect to it and to wait for one reply
+GENERATION_CONNECT_TIMEOUT = float(os.getenv("GENERATION_CONNECT_TIMEOUT", "5"))
+GENERATION_TIMEOUT = float(os.getenv("GENERATION_TIMEOUT", "30"))
+# Seconds a call may wait for a free slot and run when the caller set no deadline,
+# and the (longer) allowance for background summaries
+GENERATION_DEADLINE = float(os.getenv("GENERATION_DEADLINE", "45"))
+GENERATION_BACKGROUND_DEADLINE = float(os.getenv("GENERATION_BACKGROUND_DEADLINE", "300"))
+# Small transformers model used while the endpoint's circuit is open ("" to disable)
+GENERATION_LOCAL_MODEL = os.getenv("GENERATION_LOCAL_MODEL", "")
+
+# "generative" answers with the model and quotes the paper when it is unavailable,
+# "extractive" always quotes the best matching sentences (see extractive_answerer.py)
+ANSWER_MODE = os.getenv("ANSWER_MODE", "generative").lower()
+
+# Multi-document retrieval: hits kept per document, overall, and context size
+PER_DOCUMENT_K = int(os.getenv("PER_DOCUMENT_K", "4"))
+MULTI_DOCUMENT_K = int(os.getenv("MULTI_DOCUMENT_K", "8"))
+MULTI_DOCUMENT_CONTEXT_CHARS = int(os.getenv("MULTI_DOCUMENT_CONTEXT_CHARS", "3000"))
+
+# Batch concurrent query embeddings into one forward pass ("false" to disable)
+EMBED_BATCHING = os.getenv("EMBED_BATCHING", "true").lower() == "true"
+
+# Where the model lives: "local" loads it in every worker, "preload" loads it
+# once before gunicorn forks so workers share the weights copy-on-write, and
+# "server" uses the embedding_server sidecar over a Unix socket
+EMBEDDING_MODE = os.getenv("EMBEDDING_MODE", "local").lower()
+
+# How the model runs: "torch", "onnx" or "onnx-int8" (see onnx_embeddings.py)
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch").lower()
+
+# Where vectors live: "pinecone" or "local" (memory-mapped segments shared by workers, see local_index.py)
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "pinecone").lower()
+
+# Library-wide search across every ingested paper (see library_index.py); uploaded
+# PDFs belong to one session and are left out unless LIBRARY_INCLUDE_UPLOADS is set
+LIBRARY_SEARCH = os.getenv("LIBRARY_SEARCH", "true").lower() == "true"
+LIBRARY_INCLUDE_UPLOADS = os.getenv("LIBRARY_INCLUDE_UPLOADS", "false").lower() == "true"
+
+_schema_registry = SchemaRegistry(base_name=PINECONE_INDEX_NAME)
+_schema_registered = False
+
+def schema_registry():
+    """The index schema registry, with the configured schema registered"""
+    global _schema_registered
+    if not _schema_registered:
+        _schema_registry.ensure(CONFIGURED_SCHEMA)
+        _schema_registered = True
+    return _schema_registry
+
+def active_schema():
+    """(schema, index name) serving queries; a pending migration does not change it"""
+    schema, index_name = schema_registry().active()
+    return schema or CONFIGURED_SCHEMA, index_name
+
+_embeddings = None
+_embeddings_model = None
+_embeddings_lock = threading.Lock()
+
+def load_embedding_model(model_name=None):
+    """Instantiate the embedding model in this process"""
+    model_name = model_name or active_schema()[0].model
+    started = time.time()
+    embeddings = load_backend(model_name, EMBEDDING_BACKEND)
+    logger.info(f"Loaded {model_name} with the {EMBEDDING_BACKEND} backend in {time.time() - started:.1f}s")
+    return embeddings
+
+def get_embeddings():
+    """Load the active schema's embedding model once per process and reuse it.
+
+    After a cut-over to a new schema the new model is loaded on the next call.
+    The sidecar (EMBEDDING_MODE=server) serves whatever model it was started
+    with and has to be restarted after a cut-over.
+    """
+    global _embeddings, _embeddings_model
+    model_name = active_schema()[0].model
+    if _embeddings is None or _embeddings_model != model_name:
+        with _embeddings_lock:
+            if _embeddings is None or _embeddings_model != model_name:
+                if EMBEDDING_MODE == "server":
+                    _embeddings = RemoteEmbeddings()
+                else:
+                    _embeddings = load_embedding_model(model_name)
+                _embeddings_model = model_name
+    return _embeddings
+
+def preload_embeddings():
+    """Load the model in the gunicorn master before workers fork"""
+    if EMBEDDING_MODE != "preload":
+        return False
+    started = time.time()
+    get_embeddings()
+    logger.info(f"Preloaded embedding model in {time.time() - started:.1f}s for copy-on-write sharing")
+    return True
+
+class BatchedQueryEmbeddings(Embeddings):
+    """Embeddings that send single queries through the shared micro-batcher"""
+    
+    def __init__(self, embeddings, batcher):
+        self.embeddings = embeddings
+        self.batcher = batcher
+    
+    def embed_documents(self, texts):
+        # Document chunks already arrive in batches
+        return self.embeddings.embed_documents(texts)
+    
+    def embed_query(self, text):
+        return self.batcher.embed(text)
+
+_query_embeddings = None
+
+def get_query_embeddings():
+    """Embeddings for query lookups, batched across concurrent requests"""
+    global _query_embeddings
+    # The sidecar already batches queries across all workers
+    if not EMBED_BATCHING or EMBEDDING_MODE == "server":
+        return get_embeddings()
+    embeddings = get_embeddings()
+    if _query_embeddings is None or _query_embeddings.embeddings is not embeddings:
+        with _embeddings_lock:
+            if _query_embeddings is None or _query_embeddings.embeddings is not embeddings:
+                _query_embeddings = BatchedQueryEmbeddings(embeddings, EmbeddingBatcher(embeddings.embed_documents))
+    return _query_embeddings
+
+def embedding_batcher_stats():
+    """Batcher metrics, or None when query batching is off or unused"""
+    if EMBEDDING_MODE == "server" and _embeddings is not None:
+        try:
+            return _embeddings.server_stats()
+        except Exception as e:
+            logger.error(f"Error fetching embedding server stats: {str(e)}")
+            return None
+    if _query_embeddings is None:
+        return None
+    return _query_embeddings.batcher.stats()
+
+_local_indexes = {}
+
+def get_local_index(index_name=None):
+    """The process-wide local vector index of a schema, the active one by default"""
+    if index_name is None:
+        index_name = active_schema()[1]
+    if index_name not in _local_indexes:
+        with _embeddings_lock:
+            if index_name not in _local_indexes:
+                schema = schema_registry().schema_of(index_name) or active_schema()[0]
+                _local_indexes[index_name] = LocalVectorIndex(
+                    model_name=schema.model,
+                    directory=schema_registry().directory(LOCAL_INDEX_DIR, index_name)
+                )
+    return _local_indexes[index_name]
+
+def local_index_stats():
+    """Memory footprint of the local index, or None when Pinecone is used"""
+    if VECTOR_BACKEND != "local":
+        return None
+    return get_local_index().stats()
+
+_library_indexes = {}
+
+def get_library_index(index_name=None):
+    """The process-wide library index of a schema, the active one by default"""
+    if index_name is None:
+        index_name = active_schema()[1]
+    if index_name not in _library_indexes:
+        with _embeddings_lock:
+            if index_name not in _library_indexes:
+                _library_indexes[index_name] = LibraryIndex(
+                    directory=schema_registry().directory(LIBRARY_INDEX_DIR, index_name)
+                )
+    return _library_indexes[index_name]
+
+def library_index_stats():
+    """Size and tuning of the library index, or None when library search is off"""
+    if not LIBRARY_SEARCH:
+        return None
+    return get_library_index().stats()
+
+def library_accepts(source):
+    """Whether a document's chunks go to the library index"""
+    return LIBRARY_SEARCH and (LIBRARY_INCLUDE_UPLOADS or not source.startswith("pdf:"))
+
+class LibraryWriter:
+    """Copies a paper into the library index one batch at a time, as sync_document's on_batch.
+
+    Batches the library already holds are skipped; from the first batch that
+    differs on, the stored copy is rewritten. Errors are logged and stop the copy.
+    """
+
+    def __init__(self, source, title=None):
+        self.source = source
+        self.title = title
+        self.position = 0  # Chunks of the paper seen so far
+        self.written = 0
+        self.failed = False
+        try:
+            self.library = get_library_index()
+            self.matching = self.library.document_chunks(source) is not None
+        except Exception as e:
+            self._fail(e)
+
+    def __call__(self, texts, vectors):
+        if self.failed:
+            return
+        try:
+            if self.matching:
+                stored = self.library.document_texts(self.source, self.position, self.position + len(texts))
+                self.matching = stored == texts
+            if not self.matching:
+                self.library.add_document(self.source, vectors, texts, title=self.title, start=self.position)
+                self.written += len(texts)
+            self.position += len(texts)
+        except Exception as e:
+            self._fail(e)
+
+    def finish(self):
+        """Drop stored chunks past the end of the paper; returns True on success"""
+        if self.failed:
+            return False
+        try:
+            dropped = self.library.truncate_document(self.source, self.position)
+        except Exception as e:
+            self._fail(e)
+            return False
+        if self.written or dropped:
+            logger.info(f"Added {self.written} chunks of {self.source} to the library index")
+        return True
+
+    def _fail(self, error):
+        self.failed = True
+        logger.error(f"Error adding {self.source} to the library index: {str(error)}")
+
+def search_library(query, k=10, passages=3, ef=None, nprobe=None):
+    """
+    Rank every ingested paper for a query.
+    Returns a list of papers with their best passages (see LibraryIndex.search),
+    or None if the search failed.
+    """
     try:
-        pinecone_api_key = os.getenv("PINECONE_API_KEY")
-        pinecone_env = os.getenv("PINECONE_ENVIRONMENT")
-        
-        if not pinecone_api_key or not pinecone_env:
-            logger.warning("Pinecone API key or environment not set")
+        query_vector = get_query_embeddings().embed_query(query)
+        return get_library_index().search(query_vector, k=k, passages=passages, ef=ef, nprobe=nprobe)
+    except Exception as e:
+        logger.error(f"Error searching the library: {str(e)}")
+        return None
+
+_summarizer = None
+
+def get_summarizer():
+    """The process-wide document summarizer"""
+    global _summarizer
+    if _summarizer is None:
+        with _embeddings_lock:
+            if _summarizer is None:
+                _summarizer = DocumentSummarizer(complete_in_background)
+    return _summarizer
+
+def summary_stats():
+    """Background summary jobs, or None when summaries are off"""
+    if not DOCUMENT_SUMMARIES:
+        return None
+    return get_summarizer().stats()
+
+def schedule_summary(source, text, title=None):
+    """Start summarizing a document in the background; returns True if a job was queued"""
+    if not DOCUMENT_SUMMARIES:
+        return False
+    try:
+        return get_summarizer().schedule(source, text, title)
+    except Exception as e:
+        logger.error(f"Error scheduling summary of {source}: {str(e)}")
+        return False
+
+def answer_from_summaries(query, documents):
+    """
+    Answer a summary or main-contribution question from the cached summaries.
+    documents is a list of (source, label) pairs. Returns None when the question
+    is of another kind or a document has no summary yet.
+    """
+    if not DOCUMENT_SUMMARIES or not documents:
+        return None
+    intent = summary_intent(query)
+    if intent is None:
+        return None
+    summarizer = get_summarizer()
+    records = []
+    for source, label in documents:
+        record = summarizer.get(source)
+        if record is None:
+            logger.info(f"No summary of {source} yet, answering through retrieval")
+            return None
+        records.append((label, record))
+    summarizer.mark_served()
+    logger.info(f"Answered {intent} question from {len(records)} cached summaries")
+    return format_answer(intent, records)
+
+def paper_title(text):
+    """Title from a leading 'Title: ...' line, for text that did not come with a Paper"""
+    match = re.match(r'\s*Title:\s*(.+)', text)
+    return match.group(1).strip() if match else None
+
+def get_vector_store(embeddings):
+    """Vector store of the active schema's index, or None if it is not configured"""
+    index_name = active_schema()[1]
+    if VECTOR_BACKEND == "local":
+        return LocalVectorStore(get_local_index(index_name), embeddings)
+    
+    pinecone_api_key = os.getenv("PINECONE_API_KEY")
+    pinecone_env = os.getenv("PINECONE_ENVIRONMENT")
+    
+    if not pinecone_api_key or not pinecone_env:
+        logger.warning("Pinecone API key or environment not set")
+        return None
+    
+    # Imported on first use, langchain_pinecone and the Pinecone client are slow to import
+    from langchain_pinecone import PineconeVectorStore
+    return PineconeVectorStore(index_name=index_name, embedding=embeddings)
+
+def live_index_names():
+    """Indexes of every live schema: deletes must reach an index being built by a
+    migration, or kept for rollback, so deleted vectors do not come back"""
+    return [index_name for _, index_name in schema_registry().live()] or [active_schema()[1]]
+
+def delete_vectors(filter):
+    """Delete every vector matching a metadata filter from the configured backend"""
+    index_names = live_index_names()
+    
+    if VECTOR_BACKEND == "local":
+        for index_name in index_names:
+            removed = get_local_index(index_name).delete(filter=filter)
+            logger.info(f"Deleted {removed} vectors from the local index {index_name}")
+        return True
+    
+    if pinecone_index(index_names[0]) is None:
+        return False
+    try:
+        return get_vector_writer().delete(index_names, filter)
+    except VectorWriteError as e:
+        logger.error(f"Error deleting vectors: {str(e)}")
+        return False
+
+_pinecone_indexes = {}
+
+def pinecone_index(index_name):
+    """Cached handle on a Pinecone index, or None when the credentials are not set"""
+    if index_name not in _pinecone_indexes:
+        pc = pinecone_client()
+        if pc is None:
+            return None
+        _pinecone_indexes[index_name] = pc.Index(index_name)
+    return _pinecone_indexes[index_name]
+
+def upsert_batch(index_name, rows):
+    """Write one batch of (id, vector, metadata) rows; metadata holds the chunk text under 'text'"""
+    if VECTOR_BACKEND == "local":
+        get_local_index(index_name).add(*map(list, zip(*rows)))
+    else:
+        pinecone_index(index_name).upsert(vectors=[
+            (vector_id, [float(value) for value in vector], metadata) for vector_id, vector, metadata in rows
+        ])
+
+def delete_batch(index_name, filter):
+    if VECTOR_BACKEND == "local":
+        get_local_index(index_name).delete(filter=filter)
+    else:
+        pinecone_index(index_name).delete(filter=filter)
+
+_vector_writer = None
+
+def get_vector_writer():
+    """The process-wide pool that sends vector writes and deletes"""
+    global _vector_writer
+    if _vector_writer is None:
+        with _embeddings_lock:
+            if _vector_writer is None:
+                _vector_writer = VectorWriter(upsert_batch, delete_batch)
+    return _vector_writer
+
+def vector_writer_stats():
+    """Queue depth and batch counts of the vector writer, or None before its first write"""
+    if _vector_writer is None:
+        return None
+    return _vector_writer.stats()
+
+# Pinecone accepts at most this many vectors per upsert or fetch
+PINECONE_BATCH = 100
+PINECONE_DELETE_BATCH = 1000
+
+class ChunkIndex:
+    """One schema's chunk index through the backend's own API"""
+
+    def __init__(self, index_name):
+        self.index_name = index_name
+        if VECTOR_BACKEND == "local":
+            self.local = get_local_index(index_name)
+            self.pinecone = None
+        else:
+            self.local = None
+            self.pinecone = pinecone_index(index_name)
+            if self.pinecone is None:
+                raise RuntimeError("Pinecone API key or environment not set")
+
+    def ids(self):
+        if self.local is not None:
+            return self.local.list_ids()
+        return [vector_id for page in self.pinecone.list() for vector_id in page]
+
+    def pages(self, page_size):
+        """Ids of every vector in pages of at most page_size"""
+        if self.local is not None:
+            ids = self.local.list_ids()
+            for start in range(0, len(ids), page_size):
+                yield ids[start:start + page_size]
+            return
+        for page in self.pinecone.list(limit=page_size):
+            yield list(page)
+
+    def fetch(self, ids):
+        """{id: metadata} of the ids that exist"""
+        if self.local is not None:
+            return self.local.fetch(ids)
+        found = {}
+        for start in range(0, len(ids), PINECONE_BATCH):
+            response = self.pinecone.fetch(ids=list(ids[start:start + PINECONE_BATCH]))
+            found.update((vector_id, dict(vector.metadata or {})) for vector_id, vector in response.vectors.items())
+        return found
+
+    def vectors(self, ids):
+        """{id: stored vector} of the ids that exist"""
+        if self.local is not None:
+            return self.local.vectors(ids)
+        found = {}
+        for start in range(0, len(ids), PINECONE_BATCH):
+            response = self.pinecone.fetch(ids=list(ids[start:start + PINECONE_BATCH]))
+            found.update((vector_id, list(vector.values)) for vector_id, vector in response.vectors.items())
+        return found
+
+    def document(self, prefix):
+        """{id: metadata} of every chunk of one document (see chunk_manifest.py)"""
+        if self.local is not None:
+            ids = self.local.list_ids(prefix=f"{prefix}_")
+        else:
+            ids = [vector_id for page in self.pinecone.list(prefix=f"{prefix}_") for vector_id in page]
+        return self.fetch([vector_id for vector_id in ids if belongs_to(vector_id, prefix)])
+
+    def upsert(self, ids, vectors, metadatas):
+        if self.local is not None:
+            # One call keeps the document in one segment
+            self.local.add(ids, vectors, metadatas)
+            return
+        get_vector_writer().upsert(self.index_name, ids, vectors, metadatas)
+
+    def delete(self, filter):
+        if self.local is not None:
+            self.local.delete(filter=filter)
+        else:
+            self.pinecone.delete(filter=filter)
+
+    def delete_ids(self, ids):
+        if self.local is not None:
+            self.local.delete(ids=ids)
+            return
+        for start in range(0, len(ids), PINECONE_DELETE_BATCH):
+            self.pinecone.delete(ids=list(ids[start:start + PINECONE_DELETE_BATCH]))
+
+class IngestIndex(ChunkIndex):
+    """The active index as seen by ingest: removed chunks are deleted from every
+    live index, like delete_vectors, so a migration does not bring them back"""
+
+    def delete_ids(self, ids):
+        for index_name in live_index_names():
+            ChunkIndex(index_name).delete_ids(ids)
+
+def pinecone_client():
+    """A Pinecone client, or None when the credentials are not set"""
+    pinecone_api_key = os.getenv("PINECONE_API_KEY")
+    pinecone_env = os.getenv("PINECONE_ENVIRONMENT")
+    
+    if not pinecone_api_key or not pinecone_env:
+        logger.warning("Pinecone API key or environment not set")
+        return None
+    
+    import pinecone
+    return pinecone.Pinecone(api_key=pinecone_api_key)
+
+_pinecone_status = (0.0, False)
+_pinecone_status_lock = threading.Lock()
+
+# Check the Pinecone index
+def init_pinecone(force=False):
+    """
+    Whether the vector index is reachable and has the expected dimension.
+    Only checks: creating or recreating the index is done offline with
+    `python fix_index.py provision`, so no request or worker boot waits for it.
+    The result is reused for PINECONE_CHECK_INTERVAL seconds unless force is set.
+    """
+    global _pinecone_status
+    if VECTOR_BACKEND == "local":
+        # Nothing to provision, the local index is created on first write
+        return True
+    
+    checked_at, status = _pinecone_status
+    if not force and time.time() - checked_at < PINECONE_CHECK_INTERVAL:
+        return status
+    
+    with _pinecone_status_lock:
+        checked_at, status = _pinecone_status
+        if not force and time.time() - checked_at < PINECONE_CHECK_INTERVAL:
+            return status
+        status = check_pinecone_index()
+        _pinecone_status = (time.time(), status)
+        return status
+
+def check_pinecone_index():
+    """Look the index up in Pinecone; see init_pinecone for the cached version"""
+    try:
+        pc = pinecone_client()
+        if pc is None:
             return False
-            
-        pc = pinecone.Pinecone(api_key=pinecone_api_key)
-        
-        # Check if index exists
-        index_name = "research-assistant"
         
-        # List all indexes to check if it exists
-        index_list = pc.list_indexes()
-        index_names = [idx['name'] for idx in index_list] if index_list else []
-        
-        logger.info(f"Available Pinecone indexes: {index_names}")
+        schema, index_name = active_schema()
+        index_names = [idx['name'] for idx in pc.list_indexes() or []]
+        if index_name not in index_names:
+            logger.error(f"Pinecone index '{index_name}' does not exist, run `python fix_index.py provision`")
+            return False
         
-        # Check if we need to recreate the index (wrong dimensions)
-        need_recreate = False
-        if index_name in index_names:
-            try:
-                # Try to describe the index
-                index_info = pc.describe_index(index_name)
-                if hasattr(index_info, 'dimension'):
-                    current_dimension = index_info.dimension
-                    if current_dimension != 1024:  # We need 1024 for Mistral-Embed
-                        logger.warning(f"Index has wrong dimension: {current_dimension}, needs 1024. Will recreate.")
-                        need_recreate = True
-                        # Delete the existing index
-                        pc.delete_index(index_name)
-                        logger.info(f"Deleted index {index_name} to recreate with correct dimensions")
-                        # Wait for deletion to complete
-                        time.sleep(15)
-            except Exception as e:
-                logger.error(f"Error checking index dimensions: {str(e)}")
+        dimension = getattr(pc.describe_index(index_name), 'dimension', None)
+        if dimension is not None and dimension != schema.dimension:
+            logger.error(f"Pinecone index '{index_name}' has dimension {dimension}, expected {schema.dimension} "
+                         f"for {schema}; run `python fix_index.py provision --recreate`")
+            return False
         
-        # Create index if it doesn't exist or needs recreation
-        if index_name not in index_names or need_recreate:
-            # Create index if it doesn't exist
-            logger.info(f"Creating Pinecone index '{index_name}'")
-            try:
-                pc.create_index(
-                    name=index_name,
-                    dimension=1024,  # Dimension for Mistral-Embed model
-                    metric="cosine",
-                    spec={"serverless": {"cloud": "aws", "region": "us-east-1"}}
-                )
-                # Wait for index to be initialized
-                time.sleep(10)
-                logger.info(f"Successfully created Pinecone index '{index_name}'")
-            except Exception as e:
-                logger.error(f"Error creating Pinecone index: {str(e)}")
-                # If creation fails, continue anyway - might be permissions
+        logger.info("Successfully connected to Pinecone index")
+        return True
         
-        try:
-            index = pc.Index(index_name)
-            logger.info("Successfully connected to Pinecone index")
-            return True
-        except Exception as e:
-            logger.error(f"Error connecting to Pinecone index: {str(e)}")
-            return False
-            
     except Exception as e:
-        logger.error(f"Error initializing Pinecone: {str(e)}")
+        logger.error(f"Error checking Pinecone: {str(e)}")
         return False
 
 # Check if HuggingFace API is accessible
@@ -113,86 +610,92 @@ def check_huggingface_api():
         return False
 
 # Store embeddings in Pinecone
-def store_embeddings(text_chunks, url, session_id=None):
+# replace="session" drops every earlier vector of the session before storing,
+# replace="source" only drops the session's earlier vectors for this url.
+# Chunk ids are content hashes, so storing a document again only embeds the
+# chunks whose text changed (see chunk_manifest.py). text_chunks may be a
+# generator: chunks are embedded and written in batches as they arrive.
+# Returns the number of chunks stored, 0 on failure.
+def store_embeddings(text_chunks, url, session_id=None, replace="session", title=None, paper_metadata=None):
     try:
-        # Initialize embeddings model - use a powerful model with 768 dimensions
-        embeddings = HuggingFaceEmbeddings(
-            model_name="mistralai/Mistral-Embed",  # High-quality embedding model
-            model_kwargs={'device': 'cpu'}
-        )
+        # Shared embeddings model, queries are batched across requests
+        embeddings = get_query_embeddings()
         
-        # Initialize Pinecone
-        pinecone_api_key = os.getenv("PINECONE_API_KEY")
-        pinecone_env = os.getenv("PINECONE_ENVIRONMENT")
+        if VECTOR_BACKEND != "local" and pinecone_index(active_schema()[1]) is None:
+            return 0
         
-        if not pinecone_api_key or not pinecone_env:
-            logger.warning("Pinecone API key or environment not set")
-            return False
-            
-        pc = pinecone.Pinecone(api_key=pinecone_api_key)
-        index_name = "research-assistant"
-        
-        # Create documents with metadata
-        documents = []
         source_id = f"session:{session_id}" if session_id else url
-        
-        # Generate a unique batch ID to identify this specific upload
-        batch_id = str(uuid.uuid4())
-        logger.info(f"Creating embeddings batch {batch_id} for source {source_id}")
-        
-        for i, chunk in enumerate(text_chunks):
-            # Create a unique ID for each chunk
-            chunk_id = f"{url.replace('/', '_')}_{i}"
-            
-            # Add metadata including session ID if available
-            metadata = {
-                "source": url,
-                "chunk_id": i,
-                "batch_id": batch_id,
-                "source_id": source_id
-            }
-            
-            # Add session identifier to metadata if available
-            if session_id:
-                metadata["session_id"] = session_id
-            
-            documents.append({
-                "id": chunk_id,
-                "text": chunk,
-                "metadata": metadata
-            })
-        
-        # If we have session_id, first try to delete any previous vectors for this session
+        metadata = {"source": url, "source_id": source_id}
+        # Paper fields (title, authors, DOI) so chunks can be filtered and cited
+        if paper_metadata:
+            metadata.update(paper_metadata)
+        # Add session identifier to metadata if available
         if session_id:
+            metadata["session_id"] = session_id
+        
+        # The session's other documents; this one's stale chunks are removed by the diff
+        if session_id and replace != "source":
             try:
-                # Get the index
-                index = pc.Index(index_name)
-                # Delete by session_id
-                index.delete(filter={"session_id": {"$eq": session_id}})
+                delete_vectors({"session_id": {"$eq": session_id}, "source": {"$ne": url}})
                 logger.info(f"Deleted previous embeddings for session: {session_id}")
             except Exception as e:
                 logger.warning(f"Error deleting previous embeddings: {str(e)}")
         
-        # Create vector store
-        texts = [doc["text"] for doc in documents]
-        metadatas = [doc["metadata"] for doc in documents]
-        ids = [doc["id"] for doc in documents]
+        # Chunk ids are scoped to the session so two sessions reading the
+        # same paper do not overwrite each other
+        library = LibraryWriter(url, title) if library_accepts(url) else None
+        report = sync_document(IngestIndex(active_schema()[1]), document_prefix(url, session_id), text_chunks,
+                               metadata, embeddings.embed_documents, on_batch=library)
         
-        # Store in Pinecone
-        vector_store = PineconeVectorStore.from_texts(
-            texts=texts,
-            embedding=embeddings,
-            ids=ids,
-            metadatas=metadatas,
-            index_name=index_name
-        )
+        logger.info(f"Stored {report['chunks']} chunks in {VECTOR_BACKEND} with source_id: {source_id} "
+                    f"({report['added']} added, {report['rewritten']} rewritten, {report['removed']} removed, "
+                    f"{report['embedded']} embedded)")
         
-        logger.info(f"Successfully stored {len(texts)} chunks in Pinecone with source_id: {source_id}")
-        return True
+        if library is not None:
+            library.finish()
+        return report["chunks"]
         
     except Exception as e:
         logger.error(f"Error storing embeddings in Pinecone: {str(e)}")
-        return False
+        return 0
+
+_text_splitters = {}
+
+def text_splitter(chunker=None):
+    """The text splitter of a schema's chunker version ("recursive-<size>-<overlap>"),
+    by default the active schema's, so new documents match the index they go to"""
+    chunker = chunker or active_schema()[0].chunker
+    if chunker not in _text_splitters:
+        # langchain's top-level package is slow to import, so load it on first use
+        from langchain.text_splitter import RecursiveCharacterTextSplitter
+        _, chunk_size, chunk_overlap = chunker.split("-")
+        _text_splitters[chunker] = RecursiveCharacterTextSplitter(
+            chunk_size=int(chunk_size), chunk_overlap=int(chunk_overlap)
+        )
+    return _text_splitters[chunker]
+
+def split_text(data, chunker=None):
+    """Cut a document into the overlapping chunks that get embedded.
+
+    chunker is a schema's chunker version, see text_splitter.
+    Chunks that nearly repeat an earlier one are dropped (see chunk_dedup.py).
+    """
+    chunks = text_splitter(chunker).split_text(data)
+    return _chunk_deduplicator.filter(chunks) if _chunk_deduplicator is not None else chunks
+
+def split_segments(segments, chunker=None):
+    """split_text() for a document given as an iterable of text segments (see
+    Paper.segments), yielding its chunks one segment at a time. Chunks do not
+    span segments, and no more than one segment is held as text at once."""
+    splitter = text_splitter(chunker)
+    chunks = (chunk for segment in segments for chunk in splitter.split_text(segment))
+    return _chunk_deduplicator.stream(chunks) if _chunk_deduplicator is not None else chunks
+
+_chunk_deduplicator = ChunkDeduplicator() if CHUNK_DEDUP else None
+
+def dedup_stats():
+    """Chunks seen and dropped as near-duplicates at ingest, or None when the filter is off"""
+    return _chunk_deduplicator.stats() if _chunk_deduplicator is not None else None
 
 # Simple placeholder to maintain API compatibility
 def collected_data(data, userQuery):
@@ -209,8 +712,7 @@ def embed_response(data, userQuery, url=None, session_id=None):
     logger.info(f"Processing data of length {len(data)} characters")
     
     # Split text into manageable chunks
-    text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=300)
-    chunks = text_splitter.split_text(data)
+    chunks = split_text(data)
     
     if not chunks:
         logger.warning("No documents generated after text splitting")
@@ -220,7 +722,7 @@ def embed_response(data, userQuery, url=None, session_id=None):
     
     # Store embeddings in Pinecone if URL is provided
     if url:
-        store_success = store_embeddings(chunks, url, session_id)
+        store_success = store_embeddings(chunks, url, session_id, title=paper_title(data))
         if store_success:
             logger.info("Successfully stored embeddings in Pinecone")
         else:
@@ -230,39 +732,138 @@ def embed_response(data, userQuery, url=None, session_id=None):
     context = retrieve_from_pinecone(userQuery, url, session_id)
     
     # If no context from Pinecone, use the first few chunks
+    passages = None
     if not context:
         logger.info("Using direct chunks as context")
         context = "\n\n".join(chunks[:5])
+        passages = [(None, i, chunk) for i, chunk in enumerate(chunks[:5])]
     
-    return generate_response(userQuery, context)
+    return generate_response(userQuery, context, passages=passages)
 
-def retrieve_from_pinecone(query, url=None, session_id=None):
-    """Retrieve relevant context from Pinecone"""
+def index_document(data, url, session_id=None, paper=None):
+    """Split a document and store its chunks next to the session's other documents.
+
+    paper is the scraped Paper the text came from, if any; its fields are
+    stored with every chunk, and data may then be None. The document is chunked and embedded one
+    segment at a time, so a long paper is indexed in full without its chunks
+    or vectors being held at once. A summary of the document is then made in the
+    background (see document_summaries.py). Returns the number of chunks stored, 0 if
+    nothing could be stored.
+    """
+    segments = paper.segments() if paper is not None else pack_segments([data])
+    chunks = split_segments(segments)
+    first = next(chunks, None)
+    if first is None:
+        # Nothing to store; an empty diff would delete the document's earlier chunks
+        logger.warning(f"No chunks generated for {url}")
+        return 0
+    
+    if paper is not None:
+        title, paper_metadata = paper.title, paper.metadata()
+    else:
+        title, paper_metadata = paper_title(data), None
+    stored = store_embeddings(itertools.chain([first], chunks), url, session_id, replace="source", title=title,
+                              paper_metadata=paper_metadata)
+    if not stored:
+        return 0
+    logger.info(f"Indexed {stored} chunks for {url}")
+    if DOCUMENT_SUMMARIES:
+        # The summarizer is the only step that needs the paper as one string
+        schedule_summary(url, paper.to_text() if data is None else data, title)
+    return stored
+
+def retrieve_across_documents(query, session_id, sources, per_document_k=PER_DOCUMENT_K, k=MULTI_DOCUMENT_K):
+    """
+    Search every document of a session in parallel and merge the hits by score.
+    The query is embedded once and each document is searched with its own
+    source filter, so a long paper cannot crowd the others out of the results.
+    Returns a list of (score, source, text, chunk id), best first.
+    """
     try:
-        # Initialize embeddings model - use a powerful model with 768 dimensions
-        embeddings = HuggingFaceEmbeddings(
-            model_name="mistralai/Mistral-Embed",  # High-quality embedding model
-            model_kwargs={'device': 'cpu'}
-        )
+        embeddings = get_query_embeddings()
+        vector_store = get_vector_store(embeddings)
+        if vector_store is None:
+            return []
+        query_vector = embeddings.embed_query(query)
         
-        # Initialize Pinecone
-        pinecone_api_key = os.getenv("PINECONE_API_KEY")
-        pinecone_env = os.getenv("PINECONE_ENVIRONMENT")
+        def search(source):
+            try:
+                results = vector_store.similarity_search_by_vector_with_score(
+                    query_vector,
+                    k=per_document_k,
+                    filter={"session_id": session_id, "source": source}
+                )
+                return [(score, source, doc.page_content, doc.metadata.get("chunk_id")) for doc, score in results]
+            except Exception as e:
+                logger.error(f"Error searching document {source}: {str(e)}")
+                return []
         
-        if not pinecone_api_key or not pinecone_env:
-            logger.warning("Pinecone API key or environment not set")
-            return None
+        hits = []
+        with ThreadPoolExecutor(max_workers=min(8, max(1, len(sources)))) as executor:
+            for document_hits in executor.map(search, sources):
+                hits.extend(document_hits)
+        
+        # Cosine scores: higher is better
+        hits.sort(key=lambda hit: hit[0], reverse=True)
+        top = hits[:k]
         
-        # Connect to the index
-        pc = pinecone.Pinecone(api_key=pinecone_api_key)
-        index_name = "research-assistant"
+        # Keep at least the best passage of every document that matched, so
+        # comparison questions see all of the papers
+        represented = {hit[1] for hit in top}
+        for hit in hits[k:]:
+            if hit[1] not in represented:
+                top.append(hit)
+                represented.add(hit[1])
+        
+        logger.info(f"Retrieved {len(top)} passages from {len(represented)} of {len(sources)} documents")
+        return top
+        
+    except Exception as e:
+        logger.error(f"Error in retrieve_across_documents: {str(e)}")
+        return []
+
+def answer_across_documents(userQuery, session_id, documents, fallback=None):
+    """
+    Answer a query from all documents of a session with one retrieval round.
+    documents is a list of (source, label) pairs; fallback is an optional
+    callable returning context to use when nothing could be retrieved.
+    """
+    labels = dict(documents)
+    hits = retrieve_across_documents(userQuery, session_id, list(labels))
+    
+    if not hits:
+        logger.info(f"No stored context found for session {session_id}")
+        context = fallback() if fallback else None
+        return generate_response(userQuery, context, max_context_chars=MULTI_DOCUMENT_CONTEXT_CHARS)
+    
+    # Group passages by document, ordered by each document's best hit
+    grouped = {}
+    for _, source, text, _ in hits:
+        grouped.setdefault(source, []).append(text)
+    passages = [(labels.get(source, source), chunk_id, text) for _, source, text, chunk_id in hits]
+    
+    budget = MULTI_DOCUMENT_CONTEXT_CHARS // len(grouped)
+    context = "\n\n".join(
+        f"[{labels.get(source, source)}]\n" + "\n".join(texts)[:budget]
+        for source, texts in grouped.items()
+    )
+    
+    answer = generate_response(userQuery, context, max_context_chars=MULTI_DOCUMENT_CONTEXT_CHARS, passages=passages)
+    if len(labels) > 1:
+        answer += "\n\nSources: " + "; ".join(labels.get(source, source) for source in grouped)
+    return answer
+
+def retrieve_from_pinecone(query, url=None, session_id=None):
+    """Retrieve relevant context from Pinecone"""
+    try:
+        # Shared embeddings model, queries are batched across requests
+        embeddings = get_query_embeddings()
         
         try:
-            # Create vector store from existing index
-            vector_store = PineconeVectorStore(
-                index_name=index_name,
-                embedding=embeddings
-            )
+            # Vector store for the configured backend
+            vector_store = get_vector_store(embeddings)
+            if vector_store is None:
+                return None
             
             # Query params
             filter_dict = None
@@ -327,20 +928,142 @@ def clean_response(response):
         
     return cleaned
 
-def generate_response(query, context=None):
-    """Generate a response using HuggingFace models"""
+def call_inference_endpoint(prompt, max_new_tokens, timeout):
+    """One call to the hosted Mistral endpoint; raises BackendError when it fails"""
+    hf_api_key = os.getenv("HUGGINGFACE_API_KEY")
+    if not hf_api_key:
+        raise BackendError("HUGGINGFACE_API_KEY is not set", retryable=False)
+    
+    # Direct API call to avoid LangChain issues
+    headers = {"Authorization": f"Bearer {hf_api_key}"}
+    payload = {
+        "inputs": prompt,
+        "parameters": {
+            "max_new_tokens": max_new_tokens,
+            "temperature": 0.3,
+            "top_p": 0.95
+        }
+    }
+    
+    # Never wait on the endpoint past the caller's deadline
+    read_timeout = max(1.0, min(GENERATION_TIMEOUT, timeout))
+    try:
+        response = requests.post(GENERATION_URL, headers=headers, json=payload,
+                                 timeout=(GENERATION_CONNECT_TIMEOUT, read_timeout))
+    except requests.Timeout:
+        raise BackendError(f"HuggingFace API did not answer within {read_timeout:.0f}s")
+    except requests.RequestException as e:
+        raise BackendError(f"Error calling HuggingFace: {str(e)}")
+    if response.status_code != 200:
+        # Overload and server errors trip the breaker, rejected prompts do not
+        raise BackendError(f"HuggingFace API error: {response.status_code}, {response.text[:200]}",
+                           retryable=response.status_code >= 500 or response.status_code == 429)
+    result = response.json()[0]["generated_text"]
+    # Clean up the response - extract just the assistant's reply
+    return result.split("[/INST]")[-1].strip()
+
+_local_generator = None
+_local_generator_lock = threading.Lock()
+
+def generate_locally(prompt, max_new_tokens, timeout):
+    """Fallback generation with GENERATION_LOCAL_MODEL, one call at a time per process"""
+    global _local_generator
+    if not _local_generator_lock.acquire(timeout=timeout):
+        raise BackendError("The local model is busy", retryable=False)
+    try:
+        if _local_generator is None:
+            # Imported on first use, transformers is slow to import
+            from transformers import pipeline
+            _local_generator = pipeline("text-generation", model=GENERATION_LOCAL_MODEL)
+            logger.info(f"Loaded local generation model {GENERATION_LOCAL_MODEL}")
+        output = _local_generator(prompt, max_new_tokens=max_new_tokens, do_sample=False, return_full_text=False)
+        return output[0]["generated_text"].strip()
+    finally:
+        _local_generator_lock.release()
+
+_extractive_answerer = None
+
+def get_extractive_answerer():
+    """The process-wide extractive answerer, sharing the query embeddings"""
+    global _extractive_answerer
+    if _extractive_answerer is None:
+        _extractive_answerer = ExtractiveAnswerer(get_query_embeddings)
+    return _extractive_answerer
+
+def extractive_answer(query, passages):
+    """The best matching sentences of the passages with their chunk ids, or None"""
+    try:
+        answer = get_extractive_answerer().answer(query, passages)
+    except Exception as e:
+        logger.error(f"Error in extractive answer: {str(e)}")
+        return None
+    if answer is not None:
+        logger.info(f"Answered extractively from {len(passages)} passages")
+    return answer
+
+def extractive_stats():
+    """Extractive answer counts and latency, or None before the first one"""
+    return _extractive_answerer.stats() if _extractive_answerer is not None else None
+
+def generation_backends():
+    """(name, call, hedged) of the generation backends, in fallback order"""
+    backends = [("huggingface", call_inference_endpoint, True)]
+    if GENERATION_LOCAL_MODEL:
+        backends.append(("local", generate_locally, False))
+    return backends
+
+_generation_scheduler = GenerationScheduler()
+_generation_client = GenerationClient(generation_backends(), scheduler=_generation_scheduler)
+
+def generation_stats():
+    """Admission queue and per-backend circuit state of text generation in this process"""
+    return {"scheduler": _generation_scheduler.stats(), "client": _generation_client.stats(),
+            "extractive": extractive_stats()}
+
+def complete(prompt, max_new_tokens=150, priority=INTERACTIVE, deadline=None):
+    """
+    Run one Mistral prompt through the generation backends: the HuggingFace
+    inference API first, then the fallbacks while its circuit is open.
+    Returns the generated reply, or None if every backend failed or timed out.
+    The call waits for a slot in the generation scheduler first and raises
+    GenerationBusy if none frees up before the deadline (the one set with
+    generation_scheduler.request_deadline unless given).
+    """
+    if deadline is None:
+        deadline = current_deadline(GENERATION_BACKGROUND_DEADLINE if priority == BACKGROUND else GENERATION_DEADLINE)
+    
+    with _generation_scheduler.slot(deadline, priority) as remaining:
+        return _generation_client.complete(prompt, max_new_tokens, remaining, priority)
+
+def complete_in_background(prompt, max_new_tokens=150):
+    """complete() for background work: yields to chat and returns None when the model stays busy"""
+    try:
+        return complete(prompt, max_new_tokens, priority=BACKGROUND)
+    except GenerationBusy as e:
+        logger.warning(f"Skipped a background generation call: {str(e)}")
+        return None
+
+def generate_response(query, context=None, max_context_chars=1000, passages=None):
+    """
+    Generate a response using HuggingFace models. passages are the retrieved
+    chunks behind context as (label, chunk id, text); when the model cannot
+    be used the answer is quoted from them (or from context) instead.
+    """
     try:
-        # Use HuggingFace's text generation model
-        hf_api_key = os.getenv("HUGGINGFACE_API_KEY")
-        if not hf_api_key:
-            return "API key not configured. Please check your environment settings."
-            
-        # Use a more direct generation approach for simple questions
-        headers = {"Authorization": f"Bearer {hf_api_key}"}
-        
         if context:
             # Allow for more context to improve comprehension
-            limited_context = context[:1000] if len(context) > 1000 else context
+            limited_context = context[:max_context_chars] if len(context) > max_context_chars else context
+            if passages is None:
+                passages = [(None, None, limited_context)]
+            
+            if ANSWER_MODE == "extractive":
+                return (extractive_answer(query, passages) or
+                        "I couldn't find a passage in the paper that answers this. Try rephrasing the question.")
+            
+            # Use HuggingFace's text generation model
+            if not os.getenv("HUGGINGFACE_API_KEY") and not GENERATION_LOCAL_MODEL:
+                return (extractive_answer(query, passages) or
+                        "API key not configured. Please check your environment settings.")
             
             # Format prompt for Mistral model
             prompt = f"""<s>[INST] You are a helpful AI research assistant named Samy. You were developed by Tenzin, Tatwansh and Praveen who are students at NSUT (Netaji Subhas University of Technology).
@@ -351,38 +1074,25 @@ Research paper extract: {limited_context}
 
 Question: {query} [/INST]"""
             
-            # Direct API call with Mistral-7B model
-            payload = {
-                "inputs": prompt,
-                "parameters": {
-                    "max_new_tokens": 150,
-                    "temperature": 0.3,
-                    "top_p": 0.95
-                }
-            }
-            
+            logger.info(f"Sending direct query to HuggingFace API with context (Mistral model)")
             try:
-                logger.info(f"Sending direct query to HuggingFace API with context (Mistral model)")
-                response = requests.post(
-                    "https://api-inference.huggingface.co/models/mistralai/Mistral-7B-Instruct-v0.2",
-                    headers=headers,
-                    json=payload
-                )
-                
-                if response.status_code == 200:
-                    result = response.json()[0]["generated_text"]
-                    # Clean up the response - extract just the assistant's reply
-                    result = result.split("[/INST]")[-1].strip()
-                    return result
-                else:
-                    logger.error(f"HuggingFace API error: {response.status_code}, {response.text}")
-                    return process_query(query)
-            except Exception as e:
-                logger.error(f"Error calling HuggingFace with context: {str(e)}")
-                return process_query(query)
+                result = complete(prompt)
+            except GenerationBusy:
+                # Quoting the paper beats a "busy" error
+                answer = extractive_answer(query, passages)
+                if answer is None:
+                    raise
+                return answer
+            if result is None:
+                # Every backend already failed on this question; asking again without the context would too
+                return (extractive_answer(query, passages) or
+                        "I couldn't reach the language model just now. Please try again in a moment.")
+            return result
         else:
             return process_query(query)
             
+    except GenerationBusy:
+        raise
     except Exception as e:
         logger.error(f"Error in generate_response: {str(e)}")
         return f"I encountered an error processing your request. Please try again with a different question or paper."
@@ -390,13 +1100,9 @@ Question: {query} [/INST]"""
 def process_query(query):
     """Process a query without paper context"""
     try:
-        hf_api_key = os.getenv("HUGGINGFACE_API_KEY")
-        if not hf_api_key:
+        if not os.getenv("HUGGINGFACE_API_KEY") and not GENERATION_LOCAL_MODEL:
             return "API key not configured. Please check your environment settings."
             
-        # Direct API call to avoid LangChain issues
-        headers = {"Authorization": f"Bearer {hf_api_key}"}
-        
         # Format prompt for Mistral model
         prompt = f"""<s>[INST] You are a helpful AI research assistant named Samy. You were developed by Tenzin, Tatwansh and Praveen who are students at NSUT (Netaji Subhas University of Technology).
 
@@ -404,79 +1110,87 @@ Answer this question concisely in 2-3 sentences. If you don't know the answer, s
 
 Question: {query} [/INST]"""
         
-        payload = {
-            "inputs": prompt,
-            "parameters": {
-                "max_new_tokens": 150,
-                "temperature": 0.3,
-                "top_p": 0.95
-            }
-        }
-        
-        try:
-            logger.info("Sending direct query to HuggingFace API (Mistral model)")
-            response = requests.post(
-                "https://api-inference.huggingface.co/models/mistralai/Mistral-7B-Instruct-v0.2",
-                headers=headers,
-                json=payload
-            )
-            
-            if response.status_code == 200:
-                result = response.json()[0]["generated_text"]
-                # Clean up the response - extract just the assistant's reply
-                result = result.split("[/INST]")[-1].strip()
-                return result
-            else:
-                logger.error(f"HuggingFace API error: {response.status_code}, {response.text}")
-                return f"I couldn't process your request. Please try a different question."
-        except Exception as e:
-            logger.error(f"Error calling HuggingFace for general query: {str(e)}")
-            return f"I'm sorry, I couldn't process your request. Please try a different question."
+        logger.info("Sending direct query to HuggingFace API (Mistral model)")
+        result = complete(prompt)
+        if result is None:
+            return f"I couldn't process your request. Please try a different question."
+        return result
     
+    except GenerationBusy:
+        raise
     except Exception as e:
         logger.error(f"Error in process_query: {str(e)}")
         return f"I encountered an error processing your request. Please try again with a different question."
 
 def delete_embeddings(source_identifier):
-    """Delete embeddings from Pinecone based on source identifier"""
+    """Delete embeddings from the vector index based on source identifier"""
     try:
-        # Initialize Pinecone
-        pinecone_api_key = os.getenv("PINECONE_API_KEY")
-        pinecone_env = os.getenv("PINECONE_ENVIRONMENT")
-        
-        if not pinecone_api_key or not pinecone_env:
-            logger.warning("Pinecone API key or environment not set")
-            return False
-            
-        pc = pinecone.Pinecone(api_key=pinecone_api_key)
-        index_name = "research-assistant"
+        # Check if this is a session identifier
+        if source_identifier.startswith("session:"):
+            # Use the session_id field for filtering when it's a session
+            session_id = source_identifier.replace("session:", "")
+            logger.info(f"Deleting by session_id: {session_id}")
+            deleted = delete_embeddings_for_sessions([session_id])
+        else:
+            # Use source field for non-session identifiers
+            logger.info(f"Deleting by source: {source_identifier}")
+            deleted = delete_vectors({"source": {"$eq": source_identifier}})
         
-        try:
-            # Get the index
-            index = pc.Index(index_name)
-            
-            # Check if this is a session identifier
-            if source_identifier.startswith("session:"):
-                # Use the session_id field for filtering when it's a session
-                session_id = source_identifier.replace("session:", "")
-                logger.info(f"Deleting by session_id: {session_id}")
-                index.delete(filter={"session_id": {"$eq": session_id}})
-            else:
-                # Use source field for non-session identifiers
-                logger.info(f"Deleting by source: {source_identifier}")
-                index.delete(filter={"source": {"$eq": source_identifier}})
-            
+        if deleted:
             logger.info(f"Successfully deleted embeddings for identifier: {source_identifier}")
-            return True
-            
-        except Exception as e:
-            logger.error(f"Error deleting from Pinecone index: {str(e)}")
-            return False
-            
+        return deleted
+        
     except Exception as e:
-        logger.error(f"Error connecting to Pinecone: {str(e)}")
+        logger.error(f"Error deleting from the vector index: {str(e)}")
         return False
 
 
 
 
+
+def delete_session_documents(session_id, sources):
+    """Delete the vectors of some documents of a session; returns True on success"""
+    sources = list(sources)
+    if not sources:
+        return True
+    try:
+        return delete_vectors({"session_id": {"$eq": session_id}, "source": {"$in": sources}})
+    except Exception as e:
+        logger.error(f"Error deleting {len(sources)} documents of session {session_id}: {str(e)}")
+        return False
+
+def delete_embeddings_for_sessions(session_ids, batch_size=100):
+    """
+    Delete embeddings for many sessions with one filtered call per batch.
+    With Pinecone the batches run concurrently through the vector writer and
+    are merged with other sessions being deleted at the same time.
+    """
+    session_ids = list(session_ids)
+    if not session_ids:
+        return True
+    
+    if VECTOR_BACKEND != "local":
+        index_names = live_index_names()
+        if pinecone_index(index_names[0]) is None:
+            return False
+        try:
+            success = get_vector_writer().delete_sessions(index_names, session_ids)
+        except Exception as e:
+            logger.error(f"Error deleting embeddings for {len(session_ids)} sessions: {str(e)}")
+            return False
+        if success:
+            logger.info(f"Deleted embeddings for {len(session_ids)} sessions")
+        return success
+    
+    success = True
+    for start in range(0, len(session_ids), batch_size):
+        batch = session_ids[start:start + batch_size]
+        try:
+            if delete_vectors({"session_id": {"$in": batch}}):
+                logger.info(f"Deleted embeddings for {len(batch)} sessions")
+            else:
+                success = False
+        except Exception as e:
+            logger.error(f"Error deleting embeddings batch: {str(e)}")
+            success = False
+    return success
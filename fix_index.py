@@ -1,8 +1,22 @@
-import pinecone
+"""
+Admin command for the Pinecone index of the active schema (see index_schema.py).
+The web app only checks that the index exists (see init_pinecone in
+finalEmbed.py); creating it, or recreating it with a new dimension, happens
+here so worker boot never waits on Pinecone. To change the embedding model
+without downtime use index_migration.py instead of recreating the index.
+
+    python fix_index.py status
+    python fix_index.py provision              # create the index if it is missing
+    python fix_index.py provision --recreate   # also replace an index with the wrong dimension
+    python fix_index.py recreate --yes         # drop and recreate, deleting every vector
+"""
 import os
+import sys
 import time
+import argparse
 import logging
 from dotenv import load_dotenv
+from finalEmbed import pinecone_client, active_schema
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
@@ -11,95 +25,146 @@ logger = logging.getLogger(__name__)
 # Load environment variables
 load_dotenv()
 
-def fix_pinecone_index():
+# Serverless spec of a new index and how long to wait for Pinecone (can be overridden from the environment)
+PINECONE_CLOUD = os.getenv("PINECONE_CLOUD", "aws")
+PINECONE_REGION = os.getenv("PINECONE_REGION", "us-east-1")
+PROVISION_TIMEOUT = int(os.getenv("PROVISION_TIMEOUT", "120"))
+
+def index_names(pc):
+    return [idx['name'] for idx in pc.list_indexes() or []]
+
+def index_ready(pc, index_name):
+    status = pc.describe_index(index_name).status
+    if isinstance(status, dict):
+        return bool(status.get('ready'))
+    return bool(getattr(status, 'ready', False))
+
+def wait_for(condition, what, timeout=PROVISION_TIMEOUT):
+    """Poll condition until it holds; replaces the fixed sleeps after create and delete"""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            if condition():
+                return True
+        except Exception as e:
+            logger.info(f"Still waiting for {what}: {str(e)}")
+        time.sleep(2)
+    logger.error(f"Timed out after {timeout}s waiting for {what}")
+    return False
+
+def index_status(pc, index_name):
+    """{'exists', 'dimension', 'ready'} of the index"""
+    if index_name not in index_names(pc):
+        return {"exists": False, "dimension": None, "ready": False}
+    description = pc.describe_index(index_name)
+    return {
+        "exists": True,
+        "dimension": getattr(description, 'dimension', None),
+        "ready": index_ready(pc, index_name)
+    }
+
+def create_index(pc, index_name, dimension):
+    logger.info(f"Creating Pinecone index '{index_name}' with dimension {dimension}")
+    pc.create_index(
+        name=index_name,
+        dimension=dimension,
+        metric="cosine",
+        spec={"serverless": {"cloud": PINECONE_CLOUD, "region": PINECONE_REGION}}
+    )
+    if not wait_for(lambda: index_ready(pc, index_name), f"index '{index_name}' to be ready"):
+        return False
+    logger.info(f"Successfully created index: {index_name}")
+    return True
+
+def delete_index(pc, index_name):
+    logger.info(f"Deleting existing index: {index_name}")
+    pc.delete_index(index_name)
+    if not wait_for(lambda: index_name not in index_names(pc), f"index '{index_name}' to be deleted"):
+        return False
+    logger.info(f"Successfully deleted index: {index_name}")
+    return True
+
+def provision_index(index_name=None, dimension=None, recreate=False):
+    """
+    Make sure an index exists with the given dimension, the active schema's by default.
+    An index with another dimension is only replaced when recreate is set,
+    since that deletes every stored vector.
+    """
     try:
-        # Get Pinecone credentials
-        pinecone_api_key = os.getenv("PINECONE_API_KEY")
-        pinecone_env = os.getenv("PINECONE_ENVIRONMENT")
-        
-        if not pinecone_api_key or not pinecone_env:
-            logger.error("Pinecone API key or environment not set")
+        if index_name is None:
+            schema, index_name = active_schema()
+            dimension = schema.dimension
+        pc = pinecone_client()
+        if pc is None:
             return False
-        
-        logger.info(f"Initializing Pinecone with environment: {pinecone_env}")
-        pc = pinecone.Pinecone(api_key=pinecone_api_key)
-        
-        # Index name for our application
-        index_name = "research-assistant"
-        
-        # Check if index exists
-        index_list = pc.list_indexes()
-        index_names = [idx['name'] for idx in index_list] if index_list else []
-        
-        logger.info(f"Available Pinecone indexes: {index_names}")
-        
-        # Delete the index if it exists
-        if index_name in index_names:
-            logger.info(f"Deleting existing index: {index_name}")
-            pc.delete_index(index_name)
-            
-            # Wait for deletion to complete
-            logger.info("Waiting for index deletion to complete...")
-            time.sleep(20)
-            
-            # Verify deletion
-            new_index_list = pc.list_indexes()
-            new_index_names = [idx['name'] for idx in new_index_list] if new_index_list else []
-            
-            if index_name in new_index_names:
-                logger.error(f"Failed to delete index: {index_name}")
+
+        status = index_status(pc, index_name)
+        if status["exists"]:
+            if status["dimension"] in (None, dimension):
+                logger.info(f"Index '{index_name}' already exists with dimension {status['dimension']}")
+                return status["ready"] or wait_for(lambda: index_ready(pc, index_name), "index to be ready")
+            if not recreate:
+                logger.error(f"Index has dimension {status['dimension']}, expected {dimension}; "
+                             f"rerun with --recreate to replace it (deletes all vectors)")
                 return False
-            else:
-                logger.info(f"Successfully deleted index: {index_name}")
-        
-        # Create new index with correct dimensions
-        try:
-            logger.info(f"Creating new index: {index_name}")
-            pc.create_index(
-                name=index_name,
-                dimension=384,  # Dimension for all-MiniLM-L6-v2 model
-                metric="cosine",
-                spec={"serverless": {"cloud": "aws", "region": "us-east-1"}}
-            )
-            
-            # Wait for index creation to complete
-            logger.info("Waiting for index creation to complete...")
-            time.sleep(15)
-            
-            # Verify creation
-            verify_index_list = pc.list_indexes()
-            verify_index_names = [idx['name'] for idx in verify_index_list] if verify_index_list else []
-            
-            if index_name in verify_index_names:
-                logger.info(f"Successfully created index: {index_name}")
-                
-                # Test connecting to the index
-                try:
-                    index = pc.Index(index_name)
-                    logger.info("Successfully connected to index")
-                    return True
-                except Exception as e:
-                    logger.error(f"Error connecting to index: {str(e)}")
-                    return False
-            else:
-                logger.error(f"Failed to create index: {index_name}")
+            if not delete_index(pc, index_name):
                 return False
-                
-        except Exception as e:
-            logger.error(f"Error creating index: {str(e)}")
+
+        return create_index(pc, index_name, dimension)
+
+    except Exception as e:
+        logger.error(f"Error provisioning Pinecone index: {str(e)}")
+        return False
+
+def fix_pinecone_index():
+    """Drop the active schema's index if it exists and create it again, empty"""
+    try:
+        schema, index_name = active_schema()
+        pc = pinecone_client()
+        if pc is None:
             return False
-            
+        if index_name in index_names(pc) and not delete_index(pc, index_name):
+            return False
+        return create_index(pc, index_name, schema.dimension)
+
     except Exception as e:
         logger.error(f"Error in fix_pinecone_index: {str(e)}")
         return False
 
-if __name__ == "__main__":
-    logger.info("Starting Pinecone index fix process")
-    success = fix_pinecone_index()
-    
-    if success:
-        logger.info("Successfully fixed Pinecone index")
-        print("✅ Pinecone index fixed successfully!")
+def main():
+    parser = argparse.ArgumentParser(description="Provision the Pinecone index used by the web app")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("status", help="show whether the index exists and its dimension")
+    provision = commands.add_parser("provision", help="create the index if it is missing")
+    provision.add_argument("--recreate", action="store_true",
+                           help="replace an index with the wrong dimension (deletes all vectors)")
+    recreate = commands.add_parser("recreate", help="drop and recreate the index (deletes all vectors)")
+    recreate.add_argument("--yes", action="store_true", help="confirm deleting every stored vector")
+    args = parser.parse_args()
+
+    if args.command == "status":
+        pc = pinecone_client()
+        if pc is None:
+            return 1
+        schema, index_name = active_schema()
+        status = index_status(pc, index_name)
+        print(f"{index_name}: exists={status['exists']} dimension={status['dimension']} "
+              f"ready={status['ready']} (expected dimension {schema.dimension} for {schema})")
+        return 0 if status["exists"] and status["dimension"] in (None, schema.dimension) else 1
+
+    if args.command == "recreate":
+        if not args.yes:
+            print("Refusing to delete the index without --yes")
+            return 1
+        success = fix_pinecone_index()
     else:
-        logger.error("Failed to fix Pinecone index")
-        print("❌ Failed to fix Pinecone index, check logs for details") 
\ No newline at end of file
+        success = provision_index(recreate=args.recreate)
+
+    if success:
+        print("✅ Pinecone index is ready")
+        return 0
+    print("❌ Failed to provision Pinecone index, check logs for details")
+    return 1
+
+if __name__ == "__main__":
+    sys.exit(main())
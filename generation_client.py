@@ -0,0 +1,257 @@
+import os
+import time
+import logging
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from generation_scheduler import INTERACTIVE
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Breaker and hedging configuration (can be overridden from the environment)
+# Consecutive failures that open a backend's breaker, and seconds before it is probed again
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("BREAKER_FAILURE_THRESHOLD", "5"))
+BREAKER_RESET_SECONDS = float(os.getenv("BREAKER_RESET_SECONDS", "30"))
+# A second request is sent when the first is slower than the recent p95 latency,
+# clamped to these bounds, for at most GENERATION_HEDGE_BUDGET of all calls
+GENERATION_HEDGE = os.getenv("GENERATION_HEDGE", "true").lower() == "true"
+GENERATION_HEDGE_MIN_DELAY = float(os.getenv("GENERATION_HEDGE_MIN_DELAY", "1"))
+GENERATION_HEDGE_MAX_DELAY = float(os.getenv("GENERATION_HEDGE_MAX_DELAY", "15"))
+GENERATION_HEDGE_BUDGET = float(os.getenv("GENERATION_HEDGE_BUDGET", "0.1"))
+GENERATION_HEDGE_WORKERS = int(os.getenv("GENERATION_HEDGE_WORKERS", "8"))
+# Successful latencies kept per backend, and how many are needed before hedging
+LATENCY_WINDOW = 200
+LATENCY_MIN_SAMPLES = 20
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+
+class BackendError(Exception):
+    """A generation backend failed; retryable errors count against its breaker"""
+
+    def __init__(self, message, retryable=True):
+        super().__init__(message)
+        self.retryable = retryable
+
+
+class CircuitBreaker:
+    """Stops calling a backend after repeated failures.
+
+    Opens after ``failure_threshold`` consecutive retryable failures. Once
+    ``reset_seconds`` have passed one probe call is let through (half-open):
+    success closes the breaker, failure opens it for another period.
+    """
+
+    def __init__(self, name, failure_threshold=BREAKER_FAILURE_THRESHOLD, reset_seconds=BREAKER_RESET_SECONDS):
+        self.name = name
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_seconds = reset_seconds
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self._metrics = {"opened": 0, "rejected": 0, "probes": 0}
+
+    def allow(self):
+        """Whether a call may go to the backend now; a True in half-open state is the probe"""
+        with self._lock:
+            if self._state == CLOSED:
+                return True
+            if self._state == OPEN and time.time() - self._opened_at >= self.reset_seconds:
+                self._state = HALF_OPEN
+            if self._state == HALF_OPEN and not self._probing:
+                self._probing = True
+                self._metrics["probes"] += 1
+                return True
+            self._metrics["rejected"] += 1
+            return False
+
+    def record_success(self):
+        with self._lock:
+            if self._state != CLOSED:
+                logger.info(f"Circuit for {self.name} closed again")
+            self._state = CLOSED
+            self._failures = 0
+            self._probing = False
+
+    def record_failure(self, retryable=True):
+        with self._lock:
+            probe = self._probing
+            self._probing = False
+            if not retryable:
+                # The backend answered; only a failed probe keeps the circuit open
+                if probe:
+                    self._state = CLOSED
+                    self._failures = 0
+                return
+            self._failures += 1
+            if probe or (self._state == CLOSED and self._failures >= self.failure_threshold):
+                self._state = OPEN
+                self._opened_at = time.time()
+                self._metrics["opened"] += 1
+                logger.warning(f"Circuit for {self.name} opened after {self._failures} failures")
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._metrics)
+            stats.update({"state": self._state, "consecutive_failures": self._failures})
+        return stats
+
+
+class LatencyTracker:
+    """Recent successful call latencies of one backend"""
+
+    def __init__(self, window=LATENCY_WINDOW):
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def add(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, fraction):
+        with self._lock:
+            if len(self._samples) < LATENCY_MIN_SAMPLES:
+                return None
+            ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+class GenerationClient:
+    """Tries text generation backends in order, skipping those whose breaker is open.
+
+    ``backends`` is a list of (name, call, hedged) where
+    ``call(prompt, max_new_tokens, timeout)`` returns the generated text or
+    raises (BackendError for failures it can classify). For hedged backends a
+    duplicate request is sent when the first has taken longer than the
+    backend's recent p95 latency, and whichever succeeds first is used, so
+    one slow replica does not set the latency of the whole call. Returns
+    None when every backend failed or was skipped.
+
+    With a ``scheduler`` (GenerationScheduler) a duplicate request needs a
+    free slot of its own, held until it finishes, and is not sent otherwise.
+    """
+
+    def __init__(self, backends, hedge=GENERATION_HEDGE, hedge_budget=GENERATION_HEDGE_BUDGET,
+                 hedge_workers=GENERATION_HEDGE_WORKERS, scheduler=None):
+        self.backends = backends
+        self.scheduler = scheduler
+        self.hedge = hedge
+        self.hedge_budget = hedge_budget
+        self.hedge_workers = max(2, hedge_workers)
+        self.breakers = {name: CircuitBreaker(name) for name, _, _ in backends}
+        self.latencies = {name: LatencyTracker() for name, _, _ in backends}
+        self._lock = threading.Lock()
+        self._executor = None
+        self._pid = None
+        self._metrics = {"calls": 0, "hedges": 0, "hedge_wins": 0, "hedges_skipped_busy": 0,
+                         "fallbacks": 0, "failures": 0}
+
+    def complete(self, prompt, max_new_tokens, timeout, priority=INTERACTIVE):
+        with self._lock:
+            self._metrics["calls"] += 1
+        deadline = time.time() + timeout
+        for position, (name, call, hedged) in enumerate(self.backends):
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                break
+            breaker = self.breakers[name]
+            if not breaker.allow():
+                continue
+            started = time.time()
+            try:
+                if hedged and self.hedge:
+                    text = self._hedged(name, call, prompt, max_new_tokens, remaining, priority)
+                else:
+                    text = call(prompt, max_new_tokens, remaining)
+            except BackendError as e:
+                breaker.record_failure(e.retryable)
+                logger.warning(f"Generation backend {name} failed: {str(e)}")
+                continue
+            except Exception as e:
+                breaker.record_failure()
+                logger.warning(f"Generation backend {name} failed: {str(e)}")
+                continue
+            breaker.record_success()
+            self.latencies[name].add(time.time() - started)
+            if position > 0:
+                with self._lock:
+                    self._metrics["fallbacks"] += 1
+                logger.info(f"Answered by fallback generation backend {name}")
+            return text
+        with self._lock:
+            self._metrics["failures"] += 1
+        return None
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._metrics)
+        stats["backends"] = {}
+        for name, _, _ in self.backends:
+            p50, p95 = self.latencies[name].percentile(0.5), self.latencies[name].percentile(0.95)
+            stats["backends"][name] = dict(self.breakers[name].stats(), p50_seconds=p50, p95_seconds=p95)
+        return stats
+
+    def _hedged(self, name, call, prompt, max_new_tokens, timeout, priority=INTERACTIVE):
+        p95 = self.latencies[name].percentile(0.95)
+        if p95 is None:
+            return call(prompt, max_new_tokens, timeout)
+        delay = min(max(p95, GENERATION_HEDGE_MIN_DELAY), GENERATION_HEDGE_MAX_DELAY)
+        if delay >= timeout:
+            return call(prompt, max_new_tokens, timeout)
+
+        started = time.time()
+        executor = self._get_executor()
+        first = executor.submit(call, prompt, max_new_tokens, timeout)
+        futures = {first}
+        done, _ = wait(futures, timeout=delay)
+        if not done and self._take_hedge(priority):
+            # The losing request keeps running; its reply is dropped
+            hedge = executor.submit(call, prompt, max_new_tokens, timeout - delay)
+            if self.scheduler is not None:
+                # The slot is held until the duplicate finishes, even when it loses
+                hedge.add_done_callback(lambda _: self.scheduler.release(priority))
+            futures.add(hedge)
+        error = None
+        while futures:
+            done, futures = wait(futures, timeout=max(0.0, timeout - (time.time() - started)),
+                                 return_when=FIRST_COMPLETED)
+            if not done:
+                raise BackendError(f"{name} did not answer within {timeout:.0f}s")
+            for future in done:
+                try:
+                    text = future.result()
+                except Exception as e:
+                    error = e
+                    continue
+                if future is not first:
+                    with self._lock:
+                        self._metrics["hedge_wins"] += 1
+                return text
+        raise error
+
+    def _take_hedge(self, priority=INTERACTIVE):
+        with self._lock:
+            if self._metrics["hedges"] + 1 > self.hedge_budget * self._metrics["calls"] + 1:
+                return False
+        # A duplicate is one more call to the model, so it counts against the scheduler
+        if self.scheduler is not None and not self.scheduler.try_acquire(priority):
+            with self._lock:
+                self._metrics["hedges_skipped_busy"] += 1
+            return False
+        with self._lock:
+            self._metrics["hedges"] += 1
+        return True
+
+    def _get_executor(self):
+        # Threads do not survive a fork, so check the owning pid as well
+        with self._lock:
+            if self._executor is None or self._pid != os.getpid():
+                self._executor = ThreadPoolExecutor(max_workers=self.hedge_workers,
+                                                    thread_name_prefix="generation-hedge")
+                self._pid = os.getpid()
+            return self._executor
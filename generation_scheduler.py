@@ -0,0 +1,222 @@
+import os
+import time
+import heapq
+import logging
+import itertools
+import threading
+from contextlib import contextmanager
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Scheduler configuration (can be overridden from the environment)
+# Text generation calls running at once in this process
+GENERATION_MAX_IN_FLIGHT = int(os.getenv("GENERATION_MAX_IN_FLIGHT", "4"))
+# Calls waiting for a slot before new ones are turned away
+GENERATION_MAX_QUEUE = int(os.getenv("GENERATION_MAX_QUEUE", "16"))
+# Slots background work may never take, so chat always gets through
+GENERATION_RESERVED_INTERACTIVE = int(os.getenv("GENERATION_RESERVED_INTERACTIVE", "1"))
+# Seconds clients are told to wait before retrying a shed request
+GENERATION_RETRY_AFTER = int(os.getenv("GENERATION_RETRY_AFTER", "5"))
+
+# Priorities, lower runs first
+INTERACTIVE = 0
+BACKGROUND = 1
+
+_deadlines = threading.local()
+
+
+class GenerationBusy(Exception):
+    """The model is saturated and the call was not run; retry later"""
+
+    def __init__(self, message, retry_after=GENERATION_RETRY_AFTER):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+@contextmanager
+def request_deadline(seconds):
+    """Give every generation call made by this thread within the block a shared deadline"""
+    previous = getattr(_deadlines, "deadline", None)
+    _deadlines.deadline = time.time() + seconds
+    try:
+        yield _deadlines.deadline
+    finally:
+        _deadlines.deadline = previous
+
+
+def current_deadline(default_seconds):
+    """The deadline set by request_deadline, or default_seconds from now"""
+    deadline = getattr(_deadlines, "deadline", None)
+    return deadline if deadline is not None else time.time() + default_seconds
+
+
+class _Waiter:
+    __slots__ = ("priority", "deadline", "event", "state")
+
+    def __init__(self, priority, deadline):
+        self.priority = priority
+        self.deadline = deadline
+        self.event = threading.Event()
+        self.state = "queued"  # then "granted", "shed" or "expired"
+
+
+class GenerationScheduler:
+    """Admission control for calls to the text generation endpoint.
+
+    At most ``max_in_flight`` calls run at once; background work (document
+    summaries) may use all but ``reserved_interactive`` of them. Callers that
+    cannot start wait in a queue ordered by priority and then deadline, and
+    give up with GenerationBusy once their deadline passes. When
+    ``max_queue`` callers are already waiting, a newcomer either displaces
+    the least urgent waiter or is turned away at once, so a slow endpoint
+    produces quick "busy" answers instead of every request thread hanging.
+    Calls run on the caller's own thread; the scheduler only hands out slots.
+    """
+
+    def __init__(self, max_in_flight=GENERATION_MAX_IN_FLIGHT, max_queue=GENERATION_MAX_QUEUE,
+                 reserved_interactive=GENERATION_RESERVED_INTERACTIVE):
+        self.max_in_flight = max(1, max_in_flight)
+        self.max_queue = max(0, max_queue)
+        self.background_slots = max(1, self.max_in_flight - max(0, reserved_interactive))
+        self._lock = threading.Lock()
+        self._heap = []  # (priority, deadline, sequence, waiter)
+        self._sequence = itertools.count()
+        self._queued = 0
+        self._in_flight = {INTERACTIVE: 0, BACKGROUND: 0}
+        self._metrics = {
+            "admitted": 0,
+            "queued": 0,
+            "shed_queue_full": 0,
+            "shed_deadline": 0,
+            "max_wait_seconds": 0.0,
+            "total_wait_seconds": 0.0,
+        }
+
+    @contextmanager
+    def slot(self, deadline, priority=INTERACTIVE):
+        """Hold one generation slot for the block; yields the seconds left until the deadline"""
+        self._acquire(priority, deadline)
+        try:
+            yield max(0.0, deadline - time.time())
+        finally:
+            self._release(priority)
+
+    def try_acquire(self, priority=INTERACTIVE):
+        """Take a slot only if one is free now and nobody as urgent is waiting; returns
+        whether it was taken. For extra calls that are worth making only when the
+        model is idle (hedged requests); the caller must release() it."""
+        with self._lock:
+            if any(entry[0] <= priority and entry[3].state == "queued" for entry in self._heap):
+                return False
+            if not self._can_run(priority):
+                return False
+            self._in_flight[priority] += 1
+            self._metrics["admitted"] += 1
+            return True
+
+    def release(self, priority=INTERACTIVE):
+        """Give back a slot taken with try_acquire"""
+        self._release(priority)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._metrics)
+            stats.update({
+                "in_flight": sum(self._in_flight.values()),
+                "in_flight_background": self._in_flight[BACKGROUND],
+                "queue_depth": self._queued,
+                "max_in_flight": self.max_in_flight,
+                "max_queue": self.max_queue,
+            })
+        return stats
+
+    def _acquire(self, priority, deadline):
+        started = time.time()
+        if deadline <= started:
+            self._shed("shed_deadline")
+            raise GenerationBusy("The request ran out of time before the model was free")
+
+        with self._lock:
+            ahead = any(entry[0] <= priority and entry[3].state == "queued" for entry in self._heap)
+            if not ahead and self._can_run(priority):
+                self._in_flight[priority] += 1
+                self._metrics["admitted"] += 1
+                return
+            if self._queued >= self.max_queue and not self._displace(priority, deadline):
+                self._metrics["shed_queue_full"] += 1
+                raise GenerationBusy(f"The model is busy ({self._queued} requests waiting)")
+            waiter = _Waiter(priority, deadline)
+            heapq.heappush(self._heap, (priority, deadline, next(self._sequence), waiter))
+            self._queued += 1
+            self._metrics["queued"] += 1
+
+        waiter.event.wait(max(0.0, deadline - time.time()))
+        with self._lock:
+            if waiter.state == "queued":
+                # Timed out; the heap entry is skipped when it comes up
+                waiter.state = "expired"
+                self._queued -= 1
+            state = waiter.state
+            if state == "granted":
+                waited = time.time() - started
+                self._metrics["admitted"] += 1
+                self._metrics["total_wait_seconds"] += waited
+                self._metrics["max_wait_seconds"] = max(self._metrics["max_wait_seconds"], waited)
+                return
+            self._metrics["shed_deadline" if state == "expired" else "shed_queue_full"] += 1
+        if state == "expired":
+            raise GenerationBusy("The model did not become free before the request's deadline")
+        raise GenerationBusy("The model is busy with more urgent requests")
+
+    def _release(self, priority):
+        with self._lock:
+            self._in_flight[priority] -= 1
+            self._dispatch()
+
+    def _can_run(self, priority):
+        if sum(self._in_flight.values()) >= self.max_in_flight:
+            return False
+        return priority == INTERACTIVE or self._in_flight[BACKGROUND] < self.background_slots
+
+    def _dispatch(self):
+        # Caller holds the lock
+        now = time.time()
+        while self._heap:
+            priority, deadline, _, waiter = self._heap[0]
+            if waiter.state != "queued":
+                heapq.heappop(self._heap)
+                continue
+            if deadline <= now:
+                heapq.heappop(self._heap)
+                waiter.state = "expired"
+                self._queued -= 1
+                waiter.event.set()
+                continue
+            # Interactive waiters sort first, so nothing behind a blocked head can run either
+            if not self._can_run(priority):
+                return
+            heapq.heappop(self._heap)
+            waiter.state = "granted"
+            self._queued -= 1
+            self._in_flight[priority] += 1
+            waiter.event.set()
+
+    def _displace(self, priority, deadline):
+        """Turn away the least urgent waiter if it is less urgent than a newcomer"""
+        queued = [entry for entry in self._heap if entry[3].state == "queued"]
+        if not queued:
+            return False
+        worst = max(queued, key=lambda entry: (entry[0], entry[1]))
+        if (worst[0], worst[1]) <= (priority, deadline):
+            return False
+        worst[3].state = "shed"
+        self._queued -= 1
+        worst[3].event.set()
+        logger.info("Generation queue full, displaced a less urgent waiting call")
+        return True
+
+    def _shed(self, counter):
+        with self._lock:
+            self._metrics[counter] += 1
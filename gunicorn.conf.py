@@ -0,0 +1,28 @@
+import gc
+import os
+
+# EMBEDDING_MODE=preload imports the app (and the embedding model) once in the
+# master so forked workers share the weights copy-on-write
+preload_app = os.getenv("EMBEDDING_MODE", "local").lower() == "preload"
+
+# Threaded workers, so a slow chat request does not hold up /health or other
+# requests of the same worker, and so the per-process generation scheduler
+# (generation_scheduler.py) sees concurrent chats it can queue and shed.
+# Every worker has its own scheduler: at most WEB_CONCURRENCY *
+# GENERATION_MAX_IN_FLIGHT generation calls reach the model at once.
+worker_class = "gthread"
+workers = int(os.getenv("WEB_CONCURRENCY", "2"))
+threads = int(os.getenv("GUNICORN_THREADS", "8"))
+# Not a per-request limit: with gthread the worker's main loop sends the
+# heartbeat, so a long request on a pool thread is not killed (chats are bounded
+# by CHAT_DEADLINE_SECONDS instead). The master restarts a worker whose main loop
+# stalls this long, including one still loading the app and the embedding model
+# when preload_app is off.
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "90"))
+
+
+def when_ready(server):
+    if preload_app:
+        # Move everything loaded so far out of the collector's reach, otherwise
+        # gc passes in the workers write to the shared pages and un-share them
+        gc.freeze()
@@ -0,0 +1,315 @@
+"""
+Background re-embedding job that builds the index of a new schema next to the
+active one (see index_schema.py), so an embedding model or chunker change
+never takes search down.
+
+    python index_migration.py status
+    python index_migration.py migrate           # re-embed until the new index has caught up
+    python index_migration.py cutover           # serve from the new index, keep the old one
+    python index_migration.py rollback          # serve from the old index again
+    python index_migration.py drop <id> --yes   # delete a retired index
+
+The web app keeps answering from the active index the whole time. The job
+reads the stored chunks back out of the active index, re-chunks them when the
+chunker changed, embeds them with the new model at a bounded rate and writes
+them to the new index, then does the same for the library index. Chunk ids
+are content hashes (chunk_manifest.py), so only chunks the new index does not
+hold yet are embedded and written, and passes are cheap to repeat: migrate
+runs passes until one finds nothing to do, and cutover runs one more after
+switching to pick up documents that arrived in between. Deletes go to every live index (finalEmbed.delete_vectors).
+"""
+import os
+import sys
+import time
+import shutil
+import argparse
+import logging
+from chunk_manifest import sync_document, VOLATILE_FIELDS
+from finalEmbed import (schema_registry, load_embedding_model, get_library_index, pinecone_client,
+                        ChunkIndex, split_text, VECTOR_BACKEND, LIBRARY_SEARCH, LIBRARY_INCLUDE_UPLOADS, LOCAL_INDEX_DIR,
+                        LIBRARY_INDEX_DIR)
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Migration pacing (can be overridden from the environment)
+# Chunks embedded per call, and the most chunks embedded per second (0 for no limit)
+MIGRATION_BATCH_CHUNKS = int(os.getenv("MIGRATION_BATCH_CHUNKS", "64"))
+MIGRATION_CHUNKS_PER_SECOND = float(os.getenv("MIGRATION_CHUNKS_PER_SECOND", "20"))
+# Documents between progress updates in the schema registry
+MIGRATION_PROGRESS_EVERY = int(os.getenv("MIGRATION_PROGRESS_EVERY", "20"))
+# Passes before migrate gives up on catching up with a busy index
+MIGRATION_MAX_PASSES = int(os.getenv("MIGRATION_MAX_PASSES", "10"))
+
+
+def document_key(vector_id):
+    """Chunk ids are "<document>_<chunk hash>" (see chunk_manifest.py), or "<document>_<chunk number>" before"""
+    return vector_id.rsplit("_", 1)[0]
+
+
+def reassemble(texts, max_overlap):
+    """The text of consecutive chunks joined back together without the chunker's overlap"""
+    if not texts:
+        return ""
+    merged = texts[0]
+    for text in texts[1:]:
+        overlap = 0
+        for size in range(min(max_overlap, len(text), len(merged)), 0, -1):
+            if merged.endswith(text[:size]):
+                overlap = size
+                break
+        merged += text[overlap:] if overlap else "\n\n" + text
+    return merged
+
+
+class Migration:
+    """Copies every document of the migration's source index into its target index"""
+
+    def __init__(self, registry, rate=MIGRATION_CHUNKS_PER_SECOND, batch_chunks=MIGRATION_BATCH_CHUNKS):
+        migration = registry.migration()
+        if not migration:
+            raise RuntimeError("No index migration is pending; change the schema settings first")
+        self.registry = registry
+        self.migration = migration
+        self.source_schema = registry.schema(migration["from"])
+        self.target_schema = registry.schema(migration["to"])
+        self.source_name = registry.index_name(migration["from"])
+        self.target_name = registry.index_name(migration["to"])
+        self.rate = rate
+        self.batch_chunks = max(1, batch_chunks)
+        self._embeddings = None
+        self._next_slot = time.time()
+        self.documents = migration.get("documents", 0)
+        self.chunks = migration.get("chunks", 0)
+
+    @property
+    def embeddings(self):
+        if self._embeddings is None:
+            self._embeddings = load_embedding_model(self.target_schema.model)
+        return self._embeddings
+
+    def embed(self, texts):
+        """Embed with the new model in batches, no faster than the configured rate"""
+        vectors = []
+        for start in range(0, len(texts), self.batch_chunks):
+            batch = texts[start:start + self.batch_chunks]
+            if self.rate > 0:
+                delay = self._next_slot - time.time()
+                if delay > 0:
+                    time.sleep(delay)
+                self._next_slot = max(self._next_slot, time.time()) + len(batch) / self.rate
+            batch_vectors = self.embeddings.embed_documents(batch)
+            if batch_vectors and len(batch_vectors[0]) != self.target_schema.dimension:
+                raise ValueError(f"{self.target_schema.model} returned {len(batch_vectors[0])}-dimensional "
+                                 f"vectors, the schema says {self.target_schema.dimension}")
+            vectors.extend(batch_vectors)
+        return vectors
+
+    def retext(self, texts):
+        """Chunk texts for the new schema; re-chunked only when the chunker changed"""
+        if self.source_schema.chunker == self.target_schema.chunker:
+            return texts
+        overlap = int(self.source_schema.chunker.split("-")[2])
+        return split_text(reassemble(texts, overlap), chunker=self.target_schema.chunker)
+
+    def prepare(self):
+        """Create the target index if it does not exist yet"""
+        if VECTOR_BACKEND == "local":
+            return True
+        from fix_index import provision_index
+        return provision_index(self.target_name, self.target_schema.dimension)
+
+    def run_pass(self):
+        """Migrate every document that is missing or stale in the target; returns how many were"""
+        source, target = ChunkIndex(self.source_name), ChunkIndex(self.target_name)
+        documents = {}
+        for vector_id in source.ids():
+            documents.setdefault(document_key(vector_id), []).append(vector_id)
+        logger.info(f"Found {len(documents)} documents in {self.source_name}")
+
+        migrated = 0
+        for number, key in enumerate(sorted(documents), 1):
+            try:
+                if self.migrate_document(source, target, key, documents[key]):
+                    migrated += 1
+            except Exception as e:
+                logger.error(f"Error migrating {key}: {str(e)}")
+            if number % MIGRATION_PROGRESS_EVERY == 0:
+                self.save_progress(pending=len(documents) - number)
+        migrated += self.migrate_library()
+        self.save_progress(pending=0)
+        return migrated
+
+    def migrate_document(self, source, target, key, ids):
+        records = source.fetch(ids)
+        if not records:
+            # Deleted since the ids were listed
+            return False
+        ordered = sorted(records.values(), key=lambda metadata: metadata.get("chunk_id", 0))
+        base = {name: value for name, value in ordered[0].items() if name not in VOLATILE_FIELDS}
+
+        texts = self.retext([metadata.get("text", "") for metadata in ordered])
+        texts = [text for text in texts if text]
+        if not texts:
+            return False
+        # Chunk ids are content hashes, so only text the target lacks is embedded
+        report = sync_document(target, key, texts, base, self.embed)
+        if not (report["added"] or report["rewritten"] or report["removed"]):
+            return False
+        self.documents += 1
+        self.chunks += report["embedded"]
+        logger.info(f"Migrated {key}: {len(ordered)} chunks -> {report['chunks']}, {report['embedded']} embedded")
+        return True
+
+    def migrate_library(self):
+        """Re-embed the library papers the target library does not have yet"""
+        if not LIBRARY_SEARCH:
+            return 0
+        source, target = get_library_index(self.source_name), get_library_index(self.target_name)
+        missing = {source_id: title for source_id, title in source.documents().items()
+                   if source_id not in target.documents()}
+        migrated = 0
+        for source_id, title in missing.items():
+            if source_id.startswith("pdf:") and not LIBRARY_INCLUDE_UPLOADS:
+                continue
+            try:
+                texts = source.document_texts(source_id)
+                if not texts:
+                    continue
+                texts = self.retext(texts)
+                target.add_document(source_id, self.embed(texts), texts, title=title)
+                migrated += 1
+            except Exception as e:
+                logger.error(f"Error migrating library paper {source_id}: {str(e)}")
+        if migrated:
+            target.save()
+            logger.info(f"Migrated {migrated} library papers")
+        return migrated
+
+    def save_progress(self, **fields):
+        self.registry.update_migration(documents=self.documents, chunks=self.chunks, **fields)
+
+    def run(self, max_passes=MIGRATION_MAX_PASSES):
+        """Run passes until one finds nothing to migrate; returns True once the target is ready"""
+        if not self.prepare():
+            logger.error(f"Could not create index {self.target_name}")
+            return False
+        self.registry.update_migration(state="running", started=self.migration.get("started") or time.time())
+        for number in range(1, max_passes + 1):
+            started = time.time()
+            migrated = self.run_pass()
+            logger.info(f"Pass {number}: migrated {migrated} documents in {time.time() - started:.1f}s")
+            if migrated == 0:
+                self.registry.update_migration(state="ready")
+                logger.info(f"Index {self.target_name} has caught up; run `python index_migration.py cutover`")
+                return True
+        self.registry.update_migration(state="running")
+        logger.warning(f"Still migrating after {max_passes} passes; run migrate again")
+        return False
+
+
+def migration_lock(registry):
+    """Non-blocking lock so only one migration job runs"""
+    import fcntl
+
+    handle = open(f"{registry.path}.migration.lock", "a")
+    try:
+        fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        handle.close()
+        return None
+    return handle
+
+
+def print_status(registry):
+    state = registry.state()
+    if not state:
+        print("No index schemas registered yet")
+        return
+    for schema_id, entry in state["schemas"].items():
+        marker = "*" if schema_id == state["active"] else " "
+        print(f"{marker} {schema_id}  {entry['status']:<9} {entry['index_name']:<32} "
+              f"{entry['model']} {entry['dimension']}d {entry['chunker']}")
+    migration = state.get("migration")
+    if migration:
+        print(f"\nmigration {migration['from']} -> {migration['to']}: {migration['state']}, "
+              f"{migration['documents']} documents / {migration['chunks']} chunks re-embedded")
+
+
+def drop_index(registry, schema_id):
+    index_name = registry.index_name(schema_id)
+    if VECTOR_BACKEND == "local":
+        for base_dir in (LOCAL_INDEX_DIR, LIBRARY_INDEX_DIR):
+            shutil.rmtree(registry.directory(base_dir, index_name), ignore_errors=True)
+    else:
+        from fix_index import delete_index
+        pc = pinecone_client()
+        if pc is None or not delete_index(pc, index_name):
+            return False
+        shutil.rmtree(registry.directory(LIBRARY_INDEX_DIR, index_name), ignore_errors=True)
+    registry.drop(schema_id)
+    logger.info(f"Dropped index {index_name} of schema {schema_id}")
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build a new schema's index next to the active one and switch to it")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("status", help="list the schemas and the migration progress")
+    migrate = commands.add_parser("migrate", help="re-embed into the new index until it has caught up")
+    migrate.add_argument("--rate", type=float, default=MIGRATION_CHUNKS_PER_SECOND,
+                         help="most chunks embedded per second, 0 for no limit")
+    migrate.add_argument("--passes", type=int, default=MIGRATION_MAX_PASSES)
+    cutover = commands.add_parser("cutover", help="serve from the migrated index")
+    cutover.add_argument("--force", action="store_true", help="cut over before the migration has caught up")
+    commands.add_parser("rollback", help="serve from the index the migration started from")
+    drop = commands.add_parser("drop", help="delete the index of a retired schema")
+    drop.add_argument("schema_id")
+    drop.add_argument("--yes", action="store_true", help="confirm deleting the index")
+    args = parser.parse_args()
+
+    registry = schema_registry()
+    if args.command == "status":
+        print_status(registry)
+        return 0
+
+    migration = registry.migration()
+    if args.command == "drop":
+        if not args.yes:
+            print("Refusing to delete the index without --yes")
+            return 1
+        return 0 if drop_index(registry, args.schema_id) else 1
+
+    if not migration:
+        print("No index migration is pending")
+        return 1
+
+    if args.command == "rollback":
+        registry.cut_over(migration["from"])
+        print(f"Serving from {migration['from']} again")
+        return 0
+
+    lock = migration_lock(registry)
+    if lock is None:
+        print("Another migration job is running")
+        return 1
+    try:
+        if args.command == "migrate":
+            return 0 if Migration(registry, rate=args.rate).run(args.passes) else 1
+
+        # cutover
+        if migration["state"] != "ready" and not args.force:
+            print(f"Migration is {migration['state']}, not ready; run migrate first or pass --force")
+            return 1
+        registry.cut_over(migration["to"])
+        # Documents uploaded to the old index between the last pass and the switch
+        migrated = Migration(registry).run_pass()
+        print(f"Serving from {migration['to']}; caught up {migrated} late documents")
+        return 0
+    finally:
+        lock.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
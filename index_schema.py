@@ -0,0 +1,220 @@
+"""
+Versioned vector index schemas.
+
+A schema is the embedding model, its dimension and the chunker that cut the
+stored text; vectors made under one schema are useless under another. Each
+schema gets its own index (a Pinecone index, or a directory for the local and
+library indexes), and INDEX_SCHEMA_FILE records which one serves queries:
+
+    {"active": "<schema id>",
+     "schemas": {"<schema id>": {"model", "dimension", "chunker", "index_name",
+                                 "status": "active" | "building" | "ready" | "retired", ...}},
+     "migration": {"from", "to", "state", "documents", "chunks", ...} or null}
+
+Changing EMBEDDING_MODEL, EMBEDDING_DIMENSION or the chunk settings only
+registers the new schema as "building"; the web app keeps answering from the
+active index while index_migration.py re-embeds into the new one, and switches
+when the migration is cut over. The file must be on storage that every worker
+and deploy sees, like the local indexes.
+"""
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+from contextlib import contextmanager
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Registry location (can be overridden from the environment)
+INDEX_SCHEMA_FILE = os.getenv("INDEX_SCHEMA_FILE", "index_schemas.json")
+
+# Schemas whose index still holds vectors; deletes must reach all of them
+LIVE_STATUSES = ("active", "building", "ready", "retired")
+
+
+class IndexSchema:
+    """What the vectors of one index were made with"""
+
+    __slots__ = ("model", "dimension", "chunker")
+
+    def __init__(self, model, dimension, chunker):
+        self.model = model
+        self.dimension = int(dimension)
+        self.chunker = chunker
+
+    @property
+    def id(self):
+        key = json.dumps([self.model, self.dimension, self.chunker])
+        return hashlib.sha1(key.encode("utf-8")).hexdigest()[:8]
+
+    def to_dict(self):
+        return {"model": self.model, "dimension": self.dimension, "chunker": self.chunker}
+
+    @classmethod
+    def from_dict(cls, fields):
+        return cls(fields["model"], fields["dimension"], fields["chunker"])
+
+    def __repr__(self):
+        return f"IndexSchema({self.id}: {self.model}, {self.dimension}d, {self.chunker})"
+
+
+class SchemaRegistry:
+    """
+    The schemas file, shared by the web workers and the migration job.
+    Reads are cached until the file changes; changes are made under a lock
+    file and written atomically.
+    """
+
+    def __init__(self, path=INDEX_SCHEMA_FILE, base_name="research-assistant"):
+        self.path = path
+        self.base_name = base_name
+        self._lock = threading.Lock()
+        self._stamp = None
+        self._state = None
+
+    def index_name(self, schema_id, state=None):
+        state = state or self.state()
+        return state["schemas"][schema_id]["index_name"]
+
+    def schema(self, schema_id):
+        entry = self.state()["schemas"][schema_id]
+        return IndexSchema.from_dict(entry)
+
+    def schema_of(self, index_name):
+        """The schema whose vectors live in index_name, or None"""
+        for entry in (self.state() or {"schemas": {}})["schemas"].values():
+            if entry["index_name"] == index_name:
+                return IndexSchema.from_dict(entry)
+        return None
+
+    def directory(self, base_dir, index_name):
+        """Directory of a schema's local or library index; the first schema keeps base_dir"""
+        if index_name == self.base_name:
+            return base_dir
+        return f"{base_dir.rstrip(os.sep)}-{index_name[len(self.base_name) + 1:]}"
+
+    def state(self):
+        """The current registry contents (do not modify)"""
+        with self._lock:
+            try:
+                stat = os.stat(self.path)
+                stamp = (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+            except FileNotFoundError:
+                return None
+            if stamp != self._stamp:
+                with open(self.path, encoding="utf-8") as handle:
+                    self._state = json.load(handle)
+                self._stamp = stamp
+            return self._state
+
+    def ensure(self, configured):
+        """
+        Register the configured schema. The first schema ever registered becomes
+        active on the original index; a later, different one is added as
+        "building" and waits for a migration.
+        """
+        state = self.state()
+        if state and configured.id in state["schemas"]:
+            return state
+        with self.edit() as state:
+            if configured.id in state["schemas"]:
+                return state
+            entry = dict(configured.to_dict(), created=time.time())
+            if state["active"] is None:
+                # Adopt the existing index as the first version
+                entry.update(index_name=self.base_name, status="active")
+                state["active"] = configured.id
+                logger.info(f"Registered index schema {configured} as active on '{self.base_name}'")
+            else:
+                entry.update(index_name=f"{self.base_name}-{configured.id}", status="building")
+                # An unfinished migration towards an older configuration is abandoned
+                for schema_id, other in state["schemas"].items():
+                    if other["status"] in ("building", "ready"):
+                        other["status"] = "retired"
+                state["migration"] = {
+                    "from": state["active"], "to": configured.id, "state": "pending",
+                    "documents": 0, "chunks": 0, "started": None, "updated": time.time()
+                }
+                logger.warning(f"Index schema changed to {configured}; still serving "
+                               f"{state['active']} until `python index_migration.py migrate` and `cutover`")
+            state["schemas"][configured.id] = entry
+        return self.state()
+
+    def active(self):
+        """(schema, index name) that serves queries and new documents"""
+        state = self.state()
+        if not state or not state["active"]:
+            return None, self.base_name
+        entry = state["schemas"][state["active"]]
+        return IndexSchema.from_dict(entry), entry["index_name"]
+
+    def live(self):
+        """[(schema id, index name)] of every index that still holds vectors"""
+        state = self.state()
+        if not state:
+            return []
+        return [(schema_id, entry["index_name"]) for schema_id, entry in state["schemas"].items()
+                if entry["status"] in LIVE_STATUSES]
+
+    def migration(self):
+        state = self.state()
+        return state.get("migration") if state else None
+
+    def update_migration(self, **fields):
+        with self.edit() as state:
+            if state.get("migration"):
+                state["migration"].update(fields, updated=time.time())
+                if "state" in fields and fields["state"] == "ready":
+                    state["schemas"][state["migration"]["to"]]["status"] = "ready"
+
+    def cut_over(self, schema_id):
+        """Serve from schema_id; the previous active index is kept as retired for rollback"""
+        with self.edit() as state:
+            if schema_id not in state["schemas"]:
+                raise ValueError(f"Unknown index schema: {schema_id}")
+            previous = state["active"]
+            if previous == schema_id:
+                return previous
+            state["schemas"][previous]["status"] = "retired"
+            state["schemas"][schema_id]["status"] = "active"
+            state["active"] = schema_id
+            migration = state.get("migration")
+            if migration and migration["to"] == schema_id:
+                migration.update(state="cut_over", cut_over=time.time())
+            logger.info(f"Cut over from index schema {previous} to {schema_id}")
+            return previous
+
+    def drop(self, schema_id):
+        """Mark a retired schema's index as deleted"""
+        with self.edit() as state:
+            entry = state["schemas"][schema_id]
+            if entry["status"] != "retired":
+                raise ValueError(f"Only retired schemas can be dropped, {schema_id} is {entry['status']}")
+            entry["status"] = "dropped"
+
+    @contextmanager
+    def edit(self):
+        """Read-modify-write the registry under the lock file"""
+        import fcntl  # Unix only, like the local index locks
+
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        with open(f"{self.path}.lock", "a") as lock_handle:
+            fcntl.flock(lock_handle, fcntl.LOCK_EX)
+            try:
+                try:
+                    with open(self.path, encoding="utf-8") as handle:
+                        state = json.load(handle)
+                except FileNotFoundError:
+                    state = {"active": None, "schemas": {}, "migration": None}
+                yield state
+                tmp_path = f"{self.path}.{os.getpid()}.tmp"
+                with open(tmp_path, "w", encoding="utf-8") as handle:
+                    json.dump(state, handle, indent=2)
+                os.replace(tmp_path, self.path)
+            finally:
+                fcntl.flock(lock_handle, fcntl.LOCK_UN)
@@ -0,0 +1,673 @@
+"""
+Library-wide approximate nearest neighbour search over every ingested paper.
+
+Session retrieval filters the vector store down to one session's documents.
+This index keeps one copy of each paper's chunks, keyed by source, so a query
+can be answered across everything that has been ingested.
+
+Files under LIBRARY_INDEX_DIR:
+
+    library.json    vector dimension
+    vectors.f32     float32 chunk vectors, row number = label
+    passages.bin    chunk text, addressed by offsets stored in the log
+    log.jsonl       append-only add/delete records; a long paper is written as
+                    several "add" records, the later ones with a "start" chunk
+    hnsw.bin/json   last saved HNSW graph and the labels it covers
+    ivf.npz         IVF centroids
+
+The log and vectors.f32 are the source of truth; the ANN structure is rebuilt
+from them. Workers load the last saved graph, insert whatever was logged after
+it, and pick up other workers' additions the same way on their next search.
+
+Backends:
+
+- "hnsw" (hnswlib): graph search, `ef` trades latency for recall
+- "ivf" (numpy only): k-means inverted lists, `nprobe` trades latency for recall
+
+    python library_index.py benchmark --chunks 100000
+"""
+import os
+import sys
+import json
+import math
+import time
+import shutil
+import argparse
+import logging
+import tempfile
+import threading
+import numpy as np
+from local_index import IndexWriteLock, sample_vectors
+
+try:
+    import hnswlib
+except ImportError:
+    hnswlib = None
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Library index configuration (can be overridden from the environment)
+LIBRARY_INDEX_DIR = os.getenv("LIBRARY_INDEX_DIR", "library_index")
+# "hnsw", "ivf" or "auto" (hnsw when hnswlib is installed)
+LIBRARY_INDEX_BACKEND = os.getenv("LIBRARY_INDEX_BACKEND", "auto").lower()
+# HNSW graph degree and build-time beam width
+LIBRARY_HNSW_M = int(os.getenv("LIBRARY_HNSW_M", "16"))
+LIBRARY_HNSW_EF_CONSTRUCTION = int(os.getenv("LIBRARY_HNSW_EF_CONSTRUCTION", "200"))
+# Search beam width: higher is slower with better recall
+LIBRARY_HNSW_EF = int(os.getenv("LIBRARY_HNSW_EF", "64"))
+# Inverted lists probed per query: higher is slower with better recall
+LIBRARY_IVF_NPROBE = int(os.getenv("LIBRARY_IVF_NPROBE", "8"))
+# IVF searches are exact until this many chunks exist, then lists are trained
+LIBRARY_IVF_MIN_TRAIN = int(os.getenv("LIBRARY_IVF_MIN_TRAIN", "10000"))
+# Chunks added between saves of the HNSW graph
+LIBRARY_SAVE_EVERY = int(os.getenv("LIBRARY_SAVE_EVERY", "5000"))
+
+BACKENDS = ("hnsw", "ivf")
+# Retrain IVF centroids each time the library grows by this factor
+IVF_RETRAIN_GROWTH = 4
+IVF_TRAIN_SAMPLE = 50000
+IVF_KMEANS_ITERATIONS = 10
+# Chunks fetched per requested paper and passage, so one long paper cannot fill every slot
+PAPER_OVERFETCH = 4
+# Rows per block for exact scoring and bulk inserts
+BLOCK_ROWS = 10000
+
+
+def _normalize(vectors):
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def _replace_file(path, write):
+    """Write path through a temporary file and rename it into place"""
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as handle:
+        write(handle)
+    os.replace(tmp_path, path)
+
+
+class _HnswBackend:
+    """hnswlib graph; deleted labels are marked so searches skip them"""
+
+    name = "hnsw"
+
+    def __init__(self, dim, directory, m=LIBRARY_HNSW_M, ef_construction=LIBRARY_HNSW_EF_CONSTRUCTION,
+                 ef=LIBRARY_HNSW_EF):
+        self.directory = directory
+        self.m = m
+        self.ef = ef
+        self.graph = hnswlib.Index(space="ip", dim=dim)
+        self.covered = 0  # Labels below this are in the graph
+        self._search_lock = threading.Lock()
+
+        path = os.path.join(directory, "hnsw.bin")
+        try:
+            with open(os.path.join(directory, "hnsw.json"), encoding="utf-8") as handle:
+                covered = json.load(handle)["labels"]
+            self.graph.load_index(path, max_elements=max(1024, covered))
+            self.covered = covered
+        except FileNotFoundError:
+            self.graph.init_index(max_elements=1024, ef_construction=ef_construction, M=m)
+        except Exception as e:
+            logger.warning(f"Could not load saved HNSW graph, rebuilding from the log: {str(e)}")
+            self.graph = hnswlib.Index(space="ip", dim=dim)
+            self.graph.init_index(max_elements=1024, ef_construction=ef_construction, M=m)
+        self.graph.set_ef(ef)
+
+    def add(self, vectors):
+        needed = self.covered + len(vectors)
+        if needed > self.graph.get_max_elements():
+            self.graph.resize_index(max(needed, 2 * self.graph.get_max_elements()))
+        self.graph.add_items(vectors, np.arange(self.covered, needed))
+        self.covered = needed
+
+    def delete(self, labels):
+        for label in labels:
+            if label < self.covered:
+                try:
+                    self.graph.mark_deleted(label)
+                except RuntimeError:
+                    pass  # Already deleted in the saved graph
+
+    def search(self, query, k, alive, vectors, ef=None, nprobe=None):
+        k = min(k, int(alive.sum()))
+        if not k:
+            return []
+        with self._search_lock:
+            # ef is global to the graph, so searches with their own ef run one at a time
+            self.graph.set_ef(max(ef or self.ef, k))
+            labels, distances = self.graph.knn_query(query, k=k)
+        # Inner-product distance is 1 - similarity
+        return [(1.0 - float(d), int(label)) for label, d in zip(labels[0], distances[0])]
+
+    def save(self, rows):
+        path = os.path.join(self.directory, "hnsw.bin")
+        # hnswlib writes by path, so save beside the live file and rename
+        self.graph.save_index(f"{path}.{os.getpid()}.tmp")
+        os.replace(f"{path}.{os.getpid()}.tmp", path)
+        _replace_file(os.path.join(self.directory, "hnsw.json"),
+                      lambda handle: handle.write(json.dumps({"labels": rows}).encode("utf-8")))
+
+    def stats(self):
+        return {"m": self.m, "ef": self.ef, "graph_labels": self.covered}
+
+
+class _IvfBackend:
+    """Inverted lists over k-means centroids, scored against the memory-mapped vectors"""
+
+    name = "ivf"
+
+    def __init__(self, dim, directory, nprobe=LIBRARY_IVF_NPROBE, min_train=LIBRARY_IVF_MIN_TRAIN):
+        self.dim = dim
+        self.directory = directory
+        self.nprobe = nprobe
+        self.min_train = min_train
+        self.centroids = None
+        self.trained_rows = 0
+        self.covered = 0
+        self.lists = []  # label lists per centroid
+        self._arrays = {}  # list number -> label array, dropped when the list grows
+        self._stamp = None
+
+    def add(self, vectors):
+        if self.centroids is not None:
+            assignments = np.argmax(vectors @ self.centroids.T, axis=1)
+            for label, assigned in enumerate(assignments, self.covered):
+                self.lists[assigned].append(label)
+                self._arrays.pop(assigned, None)
+        self.covered += len(vectors)
+
+    def delete(self, labels):
+        pass  # Searches check the alive mask
+
+    def search(self, query, k, alive, vectors, ef=None, nprobe=None):
+        if self.centroids is None:
+            candidates = np.flatnonzero(alive)
+        else:
+            probe = min(nprobe or self.nprobe, len(self.lists))
+            nearest = np.argpartition(-(self.centroids @ query), probe - 1)[:probe]
+            parts = [self._array(number) for number in nearest]
+            candidates = np.concatenate(parts) if parts else np.zeros(0, dtype=np.int64)
+            candidates = candidates[alive[candidates]]
+        if not len(candidates):
+            return []
+        scores = np.concatenate([
+            np.asarray(vectors[candidates[start:start + BLOCK_ROWS]]) @ query
+            for start in range(0, len(candidates), BLOCK_ROWS)
+        ])
+        k = min(k, len(candidates))
+        top = np.argpartition(-scores, k - 1)[:k]
+        return [(float(scores[i]), int(candidates[i])) for i in top]
+
+    def training_due(self, rows):
+        if rows < self.min_train:
+            return False
+        return self.centroids is None or rows >= self.trained_rows * IVF_RETRAIN_GROWTH
+
+    def train(self, vectors, alive):
+        """Fit centroids with k-means on a sample of live vectors and save them"""
+        started = time.time()
+        live = np.flatnonzero(alive)
+        rng = np.random.default_rng(0)
+        sample = np.sort(rng.choice(live, min(len(live), IVF_TRAIN_SAMPLE), replace=False))
+        sample = np.asarray(vectors[sample])
+        lists = max(1, int(2 * math.sqrt(len(live))))
+        centroids = sample[rng.choice(len(sample), min(lists, len(sample)), replace=False)]
+        for _ in range(IVF_KMEANS_ITERATIONS):
+            assignments = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignments, sample)
+            empty = np.bincount(assignments, minlength=len(centroids)) == 0
+            # Reseed empty lists with random vectors
+            sums[empty] = sample[rng.choice(len(sample), int(empty.sum()))]
+            centroids = _normalize(sums).astype(np.float32)
+
+        trained_rows = len(vectors)
+        _replace_file(os.path.join(self.directory, "ivf.npz"),
+                      lambda handle: np.savez(handle, centroids=centroids, trained_rows=trained_rows))
+        logger.info(f"Trained {len(centroids)} IVF lists on {len(sample)} vectors in {time.time() - started:.1f}s")
+
+    def refresh(self, vectors):
+        """Reload centroids saved by any worker and reassign every vector to them"""
+        path = os.path.join(self.directory, "ivf.npz")
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return
+        stamp = (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+        if stamp == self._stamp:
+            return
+        with np.load(path) as saved:
+            self.centroids = saved["centroids"]
+            self.trained_rows = int(saved["trained_rows"])
+        self._stamp = stamp
+        self.lists = [[] for _ in range(len(self.centroids))]
+        self._arrays = {}
+        covered, self.covered = self.covered, 0
+        for start in range(0, covered, BLOCK_ROWS):
+            self.add(np.asarray(vectors[start:min(covered, start + BLOCK_ROWS)]))
+
+    def _array(self, number):
+        array = self._arrays.get(number)
+        if array is None:
+            array = self._arrays[number] = np.asarray(self.lists[number], dtype=np.int64)
+        return array
+
+    def save(self, rows):
+        pass  # Lists are rebuilt from centroids and vectors
+
+    def stats(self):
+        return {"nprobe": self.nprobe, "lists": len(self.lists), "trained_rows": self.trained_rows}
+
+
+class LibraryIndex:
+    """Persistent, incrementally updated ANN index over every paper's chunks"""
+
+    def __init__(self, directory=LIBRARY_INDEX_DIR, backend=LIBRARY_INDEX_BACKEND, ef=LIBRARY_HNSW_EF,
+                 nprobe=LIBRARY_IVF_NPROBE, m=LIBRARY_HNSW_M, ef_construction=LIBRARY_HNSW_EF_CONSTRUCTION,
+                 ivf_min_train=LIBRARY_IVF_MIN_TRAIN, save_every=LIBRARY_SAVE_EVERY):
+        if backend == "auto":
+            backend = "hnsw" if hnswlib is not None else "ivf"
+        elif backend not in BACKENDS:
+            raise ValueError(f"Unknown library index backend: {backend}")
+        if backend == "hnsw" and hnswlib is None:
+            logger.warning("hnswlib is not installed (pip install hnswlib), using the IVF backend")
+            backend = "ivf"
+        self.backend = backend
+        self.directory = directory
+        self.ef = ef
+        self.nprobe = nprobe
+        self.m = m
+        self.ef_construction = ef_construction
+        self.ivf_min_train = ivf_min_train
+        self.save_every = save_every
+        os.makedirs(directory, exist_ok=True)
+
+        self._lock = threading.RLock()
+        self.dim = None
+        self._ann = None
+        self._vectors = None  # memmap over vectors.f32
+        self._rows = 0
+        self._alive = np.zeros(0, dtype=bool)
+        self._log_offset = 0
+        self._sources = []  # label -> source
+        self._passages = []  # label -> (offset, length)
+        self._documents = {}  # source -> {"title": ..., "labels": [range, ...]}
+        self._pending_deletes = []
+        self._unsaved = 0
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    # Writes
+
+    def add_document(self, source, vectors, texts, title=None, start=0):
+        """Add (or replace) one paper's chunks; returns the number stored
+
+        With start > 0 the first start chunks already stored for source are kept
+        and the given ones replace whatever followed them, so a long paper can be
+        written a batch at a time.
+        """
+        vectors = _normalize(np.asarray(vectors, dtype=np.float32))
+        if len(vectors) != len(texts):
+            raise ValueError("vectors and texts must have the same length")
+        if not len(texts):
+            return 0
+        with IndexWriteLock(self):
+            if self.dim is None:
+                _replace_file(self._path("library.json"),
+                              lambda handle: handle.write(json.dumps({"dim": int(vectors.shape[1])}).encode("utf-8")))
+                self._refresh()
+            elif vectors.shape[1] != self.dim:
+                raise ValueError(f"Expected {self.dim}-dimensional vectors, got {vectors.shape[1]}")
+
+            records = []
+            if source in self._documents and not start:
+                records.append({"op": "delete", "source": source})
+
+            passages = []
+            with open(self._path("passages.bin"), "ab") as handle:
+                offset = handle.tell()
+                for text in texts:
+                    data = text.encode("utf-8")
+                    handle.write(data)
+                    passages.append([offset, len(data)])
+                    offset += len(data)
+
+            # Rows past the last logged add belong to a writer that died before logging them
+            vectors_path = self._path("vectors.f32")
+            with open(vectors_path, "ab") as handle:
+                handle.truncate(self._rows * 4 * self.dim)
+                handle.write(vectors.tobytes())
+
+            record = {"op": "add", "source": source, "title": title, "first": self._rows, "passages": passages}
+            if start:
+                record["start"] = start
+            records.append(record)
+            with open(self._path("log.jsonl"), "a", encoding="utf-8") as handle:
+                handle.write("".join(json.dumps(record) + "\n" for record in records))
+            self._refresh()
+
+            self._unsaved += len(texts)
+            self._maintain()
+        return len(texts)
+
+    def truncate_document(self, source, count):
+        """Drop a paper's chunks past the first count; returns the number dropped"""
+        with IndexWriteLock(self):
+            stored = self.document_chunks(source)
+            if stored is None or stored <= count:
+                return 0
+            with open(self._path("log.jsonl"), "a", encoding="utf-8") as handle:
+                handle.write(json.dumps({"op": "truncate", "source": source, "count": count}) + "\n")
+            self._refresh()
+        return stored - count
+
+    def delete_document(self, source):
+        """Remove a paper; returns True if it was in the library"""
+        with IndexWriteLock(self):
+            if source not in self._documents:
+                return False
+            with open(self._path("log.jsonl"), "a", encoding="utf-8") as handle:
+                handle.write(json.dumps({"op": "delete", "source": source}) + "\n")
+            self._refresh()
+        return True
+
+    def save(self):
+        """Persist the ANN structure so new workers do not rebuild it from the log"""
+        with IndexWriteLock(self):
+            self._maintain(force=True)
+
+    def _maintain(self, force=False):
+        # Callers hold the write lock
+        with self._lock:
+            if self._ann is None:
+                return
+            if isinstance(self._ann, _IvfBackend) and self._ann.training_due(int(self._alive.sum())):
+                self._ann.train(self._vectors, self._alive)
+                self._ann.refresh(self._vectors)
+            if force or self._unsaved >= self.save_every:
+                started = time.time()
+                self._ann.save(self._rows)
+                self._unsaved = 0
+                logger.info(f"Saved {self.backend} library index of {self._rows} chunks in {time.time() - started:.1f}s")
+
+    # Reads
+
+    def search_chunks(self, query_vector, k=10, ef=None, nprobe=None):
+        """Top-k (score, label) over every live chunk, best first"""
+        with self._lock:
+            self._refresh()
+            if self._ann is None:
+                return []
+            query = _normalize(np.asarray(query_vector, dtype=np.float32))
+            hits = self._ann.search(query, k, self._alive, self._vectors, ef=ef, nprobe=nprobe)
+            hits = [hit for hit in hits if self._alive[hit[1]]]
+            hits.sort(reverse=True)
+            return hits
+
+    def search(self, query_vector, k=10, passages=3, ef=None, nprobe=None):
+        """Top-k papers for a query, each with its best passages.
+
+        Returns [{"source", "title", "score", "passages": [{"chunk", "score", "text"}]}],
+        papers ranked by their best passage.
+        """
+        hits = self.search_chunks(query_vector, k * passages * PAPER_OVERFETCH, ef=ef, nprobe=nprobe)
+        papers = {}
+        with self._lock:
+            for score, label in hits:
+                source = self._sources[label]
+                paper = papers.get(source)
+                if paper is None:
+                    if len(papers) == k:
+                        continue
+                    paper = papers[source] = {
+                        "source": source,
+                        "title": self._documents[source]["title"],
+                        "score": score,
+                        "passages": [],
+                    }
+                if len(paper["passages"]) < passages:
+                    paper["passages"].append({
+                        "chunk": _chunk_number(self._documents[source]["labels"], label),
+                        "score": score,
+                        "text": self._passage(label),
+                    })
+        return list(papers.values())
+
+    def __len__(self):
+        with self._lock:
+            self._refresh()
+            return int(self._alive.sum())
+
+    def documents(self):
+        """{source: title} of every paper in the library"""
+        with self._lock:
+            self._refresh()
+            return {source: document["title"] for source, document in self._documents.items()}
+
+    def document_texts(self, source, start=0, stop=None):
+        """The chunk texts of one paper in order (chunks start to stop), or None
+        if it is not in the library"""
+        with self._lock:
+            self._refresh()
+            document = self._documents.get(source)
+            if document is None:
+                return None
+            labels = [label for labels in document["labels"] for label in labels]
+            return [self._passage(label) for label in labels[start:stop]]
+
+    def document_chunks(self, source):
+        """Number of chunks stored for one paper, or None if it is not in the library"""
+        with self._lock:
+            self._refresh()
+            document = self._documents.get(source)
+            if document is None:
+                return None
+            return sum(len(labels) for labels in document["labels"])
+
+    def stats(self):
+        with self._lock:
+            self._refresh()
+            files = ("vectors.f32", "passages.bin", "log.jsonl", "hnsw.bin", "ivf.npz")
+            stats = {
+                "backend": self.backend,
+                "dim": self.dim,
+                "papers": len(self._documents),
+                "chunks": int(self._alive.sum()),
+                "deleted_chunks": self._rows - int(self._alive.sum()),
+                "disk_bytes": sum(os.path.getsize(self._path(name)) for name in files if os.path.exists(self._path(name))),
+            }
+            if self._ann is not None:
+                stats.update(self._ann.stats())
+            return stats
+
+    # Process-local view of the files
+
+    def _refresh(self):
+        """Catch up with documents logged by this or any other worker"""
+        with self._lock:
+            if self.dim is None:
+                try:
+                    with open(self._path("library.json"), encoding="utf-8") as handle:
+                        self.dim = json.load(handle)["dim"]
+                except FileNotFoundError:
+                    return
+                if self.backend == "hnsw":
+                    self._ann = _HnswBackend(self.dim, self.directory, self.m, self.ef_construction, self.ef)
+                else:
+                    self._ann = _IvfBackend(self.dim, self.directory, self.nprobe, self.ivf_min_train)
+
+            try:
+                with open(self._path("log.jsonl"), "rb") as handle:
+                    handle.seek(self._log_offset)
+                    data = handle.read()
+            except FileNotFoundError:
+                data = b""
+            end = data.rfind(b"\n") + 1  # Only complete lines
+            if end:
+                self._log_offset += end
+                for line in data[:end].decode("utf-8").splitlines():
+                    self._apply(json.loads(line))
+
+            if self._vectors is None or len(self._vectors) != self._rows:
+                self._vectors = np.memmap(self._path("vectors.f32"), dtype=np.float32, mode="r",
+                                          shape=(self._rows, self.dim)) if self._rows else None
+            if self._vectors is not None:
+                if isinstance(self._ann, _IvfBackend):
+                    self._ann.refresh(self._vectors)
+                for start in range(self._ann.covered, self._rows, BLOCK_ROWS):
+                    self._ann.add(np.asarray(self._vectors[start:min(self._rows, start + BLOCK_ROWS)]))
+            if self._pending_deletes:
+                self._ann.delete(self._pending_deletes)
+                self._pending_deletes = []
+
+    def _apply(self, record):
+        if record["op"] == "delete":
+            document = self._documents.pop(record["source"], None)
+            if document is not None:
+                self._drop(document, 0)
+            return
+        if record["op"] == "truncate":
+            document = self._documents.get(record["source"])
+            if document is not None:
+                self._drop(document, record["count"])
+            return
+        first, count = record["first"], len(record["passages"])
+        if first + count > len(self._alive):
+            grown = np.zeros(max(first + count, 2 * len(self._alive), 1024), dtype=bool)
+            grown[:len(self._alive)] = self._alive
+            self._alive = grown
+        self._alive[first:first + count] = True
+        self._sources.extend([record["source"]] * count)
+        self._passages.extend(tuple(passage) for passage in record["passages"])
+        document = self._documents.get(record["source"]) if record.get("start") else None
+        if document is None:
+            self._documents[record["source"]] = {"title": record.get("title"), "labels": [range(first, first + count)]}
+        else:
+            self._drop(document, record["start"])
+            document["labels"].append(range(first, first + count))
+        self._rows = first + count
+
+    def _drop(self, document, keep):
+        """Mark a document's chunks past the first keep deleted"""
+        parts = []
+        for labels in document["labels"]:
+            if keep < len(labels):
+                dropped = labels[keep:]
+                self._alive[dropped.start:dropped.stop] = False
+                self._pending_deletes.extend(dropped)
+                labels = labels[:keep]
+            keep -= len(labels)
+            if labels:
+                parts.append(labels)
+        document["labels"] = parts
+
+    def _passage(self, label):
+        offset, length = self._passages[label]
+        with open(self._path("passages.bin"), "rb") as handle:
+            handle.seek(offset)
+            return handle.read(length).decode("utf-8")
+
+
+def _chunk_number(parts, label):
+    """Position of label within a paper stored as one or more label ranges"""
+    number = 0
+    for labels in parts:
+        if label in labels:
+            return number + label - labels.start
+        number += len(labels)
+    return None
+
+
+# Recall and latency benchmark
+
+
+def exact_neighbours(vectors, queries, k):
+    """Ground-truth top-k labels by brute force"""
+    results = []
+    for query in queries:
+        scores = np.concatenate([vectors[start:start + BLOCK_ROWS] @ query for start in range(0, len(vectors), BLOCK_ROWS)])
+        results.append(set(np.argpartition(-scores, k - 1)[:k].tolist()))
+    return results
+
+
+def benchmark(vectors, queries, k, backend, settings, chunks_per_paper=50):
+    """Build a library from vectors, then measure recall@k and latency for each ef/nprobe"""
+    directory = tempfile.mkdtemp()
+    try:
+        index = LibraryIndex(directory=directory, backend=backend, save_every=len(vectors) + 1)
+        started = time.time()
+        for number, start in enumerate(range(0, len(vectors), chunks_per_paper)):
+            block = vectors[start:start + chunks_per_paper]
+            index.add_document(f"paper-{number}", block, [""] * len(block))
+        build_seconds = time.time() - started
+        index.save()
+
+        started = time.time()
+        reopened = LibraryIndex(directory=directory, backend=index.backend)
+        len(reopened)
+        open_seconds = time.time() - started
+
+        queries = _normalize(queries.astype(np.float32))
+        truth = exact_neighbours(_normalize(vectors.astype(np.float32)), queries, k)
+        results = []
+        for setting in settings:
+            latencies, found = [], 0
+            for query, expected in zip(queries, truth):
+                started = time.perf_counter()
+                hits = index.search_chunks(query, k, **setting)
+                latencies.append(time.perf_counter() - started)
+                found += len(expected & {label for _, label in hits})
+            latencies.sort()
+            results.append({
+                "backend": index.backend,
+                "setting": ", ".join(f"{key}={value}" for key, value in setting.items()),
+                "recall": found / (len(queries) * k),
+                "p50_ms": 1000 * latencies[len(latencies) // 2],
+                "p95_ms": 1000 * latencies[int(len(latencies) * 0.95)],
+                "build_seconds": build_seconds,
+                "open_seconds": open_seconds,
+                "disk_mb": index.stats()["disk_bytes"] / 2**20,
+            })
+        return results
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the library-wide ANN index")
+    parser.add_argument("command", choices=("benchmark",))
+    parser.add_argument("--vectors-file", help=".npy matrix of real embeddings (e.g. from onnx_embeddings.py run)")
+    parser.add_argument("--chunks", type=int, default=100000, help="Synthetic chunks when no file is given")
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--backends", nargs="+", choices=BACKENDS,
+                        default=["hnsw", "ivf"] if hnswlib is not None else ["ivf"])
+    args = parser.parse_args()
+
+    if args.vectors_file:
+        vectors = np.load(args.vectors_file).astype(np.float32)
+    else:
+        vectors = sample_vectors(args.chunks + args.queries, args.dim)
+    # Held-out queries so no query finds itself
+    queries, vectors = vectors[:args.queries], vectors[args.queries:]
+
+    settings = {
+        "hnsw": [{"ef": ef} for ef in (16, 32, 64, 128, 256)],
+        "ivf": [{"nprobe": nprobe} for nprobe in (1, 4, 8, 16, 32)],
+    }
+    print(f"{len(vectors)} chunks x {vectors.shape[1]} dims, {len(queries)} queries, recall@{args.k}")
+    print(f"{'backend':<8}{'setting':<14}{'recall':>8}{'p50 ms':>9}{'p95 ms':>9}{'build s':>9}{'open s':>8}{'disk MB':>9}")
+    for backend in args.backends:
+        for row in benchmark(vectors, queries, args.k, backend, settings[backend]):
+            print(f"{row['backend']:<8}{row['setting']:<14}{row['recall']:>8.3f}{row['p50_ms']:>9.2f}"
+                  f"{row['p95_ms']:>9.2f}{row['build_seconds']:>9.1f}{row['open_seconds']:>8.2f}{row['disk_mb']:>9.0f}")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
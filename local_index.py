@@ -0,0 +1,908 @@
+"""
+On-disk vector index used when VECTOR_BACKEND=local.
+
+Vectors are written to immutable segments under LOCAL_INDEX_DIR:
+
+    manifest.json              live segments, PCA projection, tombstone log
+    segments/<id>/full.npy     float32 vectors, read only to rescore
+    segments/<id>/codes.npy    compact search codes (see below)
+    segments/<id>/scales.npy   per-row scales for int8 codes
+    segments/<id>/keys.json    ids plus the filterable metadata fields
+    segments/<id>/meta.jsonl   remaining metadata (chunk text), one row per line
+    tombstones-<n>.log         "<segment> <row>" for deleted rows
+
+Every worker opens the segments with np.memmap, so vectors are shared through
+the page cache instead of being copied into each process, and opening the
+index only reads the manifest and the small key sidecars. Writes add a new
+segment and deletes append tombstones, both under a lock file, and other
+workers pick them up on their next call. Compaction runs in the background
+and merges small segments, drops deleted rows and re-encodes segments whose
+codec is stale.
+
+Codes can be made smaller:
+
+- reduction: "none", "matryoshka" (keep the leading dimensions, for models
+  trained that way) or "pca" (projection fitted per model on the first
+  LOCAL_INDEX_PCA_SAMPLES vectors, applied from the next compaction on)
+- quantization: "float32", "float16" or "int8" (symmetric, one scale per row)
+
+The best compressed candidates are rescored against full.npy.
+
+    python local_index.py report --vectors-file vectors.npy
+    python local_index.py compact
+"""
+import os
+import re
+import sys
+import json
+import time
+import uuid
+import shutil
+import argparse
+import logging
+import tempfile
+import threading
+import numpy as np
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Index configuration (can be overridden from the environment)
+LOCAL_INDEX_DIR = os.getenv("LOCAL_INDEX_DIR", "vector_index")
+LOCAL_INDEX_REDUCTION = os.getenv("LOCAL_INDEX_REDUCTION", "none").lower()
+# Stored dimension after reduction, 0 keeps the model's dimension
+LOCAL_INDEX_DIM = int(os.getenv("LOCAL_INDEX_DIM", "0"))
+LOCAL_INDEX_QUANTIZATION = os.getenv("LOCAL_INDEX_QUANTIZATION", "int8").lower()
+# Compressed candidates rescored at full precision per requested result
+LOCAL_INDEX_RESCORE_FACTOR = int(os.getenv("LOCAL_INDEX_RESCORE_FACTOR", "4"))
+LOCAL_INDEX_PCA_SAMPLES = int(os.getenv("LOCAL_INDEX_PCA_SAMPLES", "1024"))
+# Compaction: merge small segments once there are more than this many ...
+LOCAL_INDEX_MAX_SEGMENTS = int(os.getenv("LOCAL_INDEX_MAX_SEGMENTS", "16"))
+# ... and rewrite any segment with a larger share of deleted rows than this
+LOCAL_INDEX_MAX_DEAD_RATIO = float(os.getenv("LOCAL_INDEX_MAX_DEAD_RATIO", "0.3"))
+# Largest segment compaction writes
+LOCAL_INDEX_SEGMENT_ROWS = int(os.getenv("LOCAL_INDEX_SEGMENT_ROWS", "100000"))
+
+REDUCTIONS = ("none", "matryoshka", "pca")
+QUANTIZATIONS = ("float32", "float16", "int8")
+CODE_DTYPES = {"float32": np.float32, "float16": np.float16, "int8": np.int8}
+# Times a reader re-reads the manifest when a compaction removes segments under it
+MANIFEST_RETRIES = 5
+# Metadata fields kept in memory for filtered search and deletes
+FILTER_FIELDS = ("session_id", "source")
+# Rows scored per block, bounds the float32 scratch used for float16/int8 codes
+SCORE_BLOCK_ROWS = 4096
+
+
+def _normalize(vectors):
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def _write_json(path, payload):
+    """Write JSON beside path and rename it into place, so readers never see half a file"""
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as handle:
+        json.dump(payload, handle)
+        handle.flush()
+        os.fsync(handle.fileno())
+    os.replace(tmp_path, path)
+
+
+class Reducer:
+    """Maps full vectors to the stored dimension"""
+
+    def __init__(self, method, dim, full_dim):
+        if method not in REDUCTIONS:
+            raise ValueError(f"Unknown reduction: {method}")
+        self.method = method if dim and dim < full_dim else "none"
+        self.full_dim = full_dim
+        self.dim = dim if self.method != "none" else full_dim
+        self.mean = None
+        self.components = None
+
+    def fit(self, vectors):
+        """Fit the PCA projection on a sample of full vectors"""
+        self.mean = vectors.mean(axis=0).astype(np.float32)
+        _, _, vt = np.linalg.svd(vectors - self.mean, full_matrices=False)
+        self.components = vt[:self.dim].T.astype(np.float32)
+
+    def load(self, path):
+        saved = np.load(path)
+        if saved["components"].shape != (self.full_dim, self.dim):
+            raise ValueError(f"PCA projection {path} was fitted for other dimensions")
+        self.mean, self.components = saved["mean"], saved["components"]
+
+    def save(self, path):
+        np.savez(path, mean=self.mean, components=self.components)
+
+    def transform(self, vectors):
+        if self.method == "matryoshka":
+            return _normalize(vectors[..., :self.dim])
+        if self.method == "pca":
+            return _normalize((vectors - self.mean) @ self.components)
+        return vectors
+
+
+class Segment:
+    """One immutable on-disk segment, memory-mapped read-only"""
+
+    def __init__(self, segment_id, path):
+        self.id = segment_id
+        self.path = path
+        with open(os.path.join(path, "keys.json"), encoding="utf-8") as handle:
+            keys = json.load(handle)
+        self.ids = keys["ids"]
+        self.fields = keys["fields"]
+        self.codec = keys["codec"]
+        self.rows = len(self.ids)
+        self.full = np.load(os.path.join(path, "full.npy"), mmap_mode="r")
+        self.codes = None
+        self.scales = None
+        if self.codec is not None:
+            self.codes = np.load(os.path.join(path, "codes.npy"), mmap_mode="r")
+            if self.codec["quantization"] == "int8":
+                self.scales = np.load(os.path.join(path, "scales.npy"), mmap_mode="r")
+        self.meta_offsets = np.load(os.path.join(path, "meta_offsets.npy"), mmap_mode="r")
+        self._meta_fd = os.open(os.path.join(path, "meta.jsonl"), os.O_RDONLY)
+        # Tombstones are per process state, the files never change
+        self.alive = np.ones(self.rows, dtype=bool)
+
+    @classmethod
+    def write(cls, directory, segment_id, ids, vectors, metadatas, reducer=None, codec=None):
+        """Write a segment into a temporary directory and rename it into place"""
+        final_path = os.path.join(directory, segment_id)
+        tmp_path = f"{final_path}.tmp"
+        os.makedirs(tmp_path)
+
+        np.save(os.path.join(tmp_path, "full.npy"), np.ascontiguousarray(vectors, dtype=np.float32))
+        if codec is not None:
+            reduced = reducer.transform(vectors)
+            if codec["quantization"] == "int8":
+                scales = np.abs(reduced).max(axis=1) / 127.0
+                scales[scales == 0] = 1.0
+                np.save(os.path.join(tmp_path, "scales.npy"), scales.astype(np.float32))
+                reduced = np.round(reduced / scales[:, None])
+            np.save(os.path.join(tmp_path, "codes.npy"), reduced.astype(CODE_DTYPES[codec["quantization"]]))
+
+        fields = {field: [] for field in FILTER_FIELDS}
+        offsets = [0]
+        with open(os.path.join(tmp_path, "meta.jsonl"), "wb") as handle:
+            for metadata in metadatas:
+                rest = {key: value for key, value in metadata.items() if key not in FILTER_FIELDS}
+                line = json.dumps(rest).encode("utf-8") + b"\n"
+                handle.write(line)
+                offsets.append(offsets[-1] + len(line))
+                for field in FILTER_FIELDS:
+                    fields[field].append(metadata.get(field))
+        np.save(os.path.join(tmp_path, "meta_offsets.npy"), np.asarray(offsets, dtype=np.int64))
+        with open(os.path.join(tmp_path, "keys.json"), "w", encoding="utf-8") as handle:
+            json.dump({"ids": list(ids), "fields": fields, "codec": codec}, handle)
+
+        os.rename(tmp_path, final_path)
+        return final_path
+
+    def metadata(self, row):
+        start, end = int(self.meta_offsets[row]), int(self.meta_offsets[row + 1])
+        metadata = json.loads(os.pread(self._meta_fd, end - start, start))
+        for field in FILTER_FIELDS:
+            if self.fields[field][row] is not None:
+                metadata[field] = self.fields[field][row]
+        return metadata
+
+    def disk_bytes(self):
+        sizes = {"full": 0, "codes": 0, "metadata": 0}
+        for name in os.listdir(self.path):
+            size = os.path.getsize(os.path.join(self.path, name))
+            if name == "full.npy":
+                sizes["full"] += size
+            elif name in ("codes.npy", "scales.npy"):
+                sizes["codes"] += size
+            else:
+                sizes["metadata"] += size
+        return sizes
+
+    def close(self):
+        try:
+            os.close(self._meta_fd)
+        except OSError:
+            pass
+
+
+class LocalVectorIndex:
+    """Filterable cosine-similarity index over memory-mapped immutable segments"""
+
+    def __init__(self, model_name="default", reduction=LOCAL_INDEX_REDUCTION, dim=LOCAL_INDEX_DIM,
+                 quantization=LOCAL_INDEX_QUANTIZATION, rescore_factor=LOCAL_INDEX_RESCORE_FACTOR,
+                 directory=LOCAL_INDEX_DIR, pca_samples=LOCAL_INDEX_PCA_SAMPLES,
+                 max_segments=LOCAL_INDEX_MAX_SEGMENTS, max_dead_ratio=LOCAL_INDEX_MAX_DEAD_RATIO,
+                 segment_rows=LOCAL_INDEX_SEGMENT_ROWS, background_compaction=True):
+        if quantization not in QUANTIZATIONS:
+            raise ValueError(f"Unknown quantization: {quantization}")
+        if reduction not in REDUCTIONS:
+            raise ValueError(f"Unknown reduction: {reduction}")
+        self.model_name = model_name
+        self.reduction = reduction
+        self.target_dim = dim
+        self.quantization = quantization
+        self.rescore_factor = max(1, rescore_factor)
+        self.directory = directory
+        self.pca_samples = pca_samples
+        self.max_segments = max_segments
+        self.max_dead_ratio = max_dead_ratio
+        self.segment_rows = segment_rows
+        self.background_compaction = background_compaction
+
+        self.segments_dir = os.path.join(directory, "segments")
+        os.makedirs(self.segments_dir, exist_ok=True)
+        self._manifest_path = os.path.join(directory, "manifest.json")
+        self._lock = threading.RLock()
+        self._compacting = False
+
+        # This process's view of the files, brought up to date by _refresh
+        self._manifest = {"generation": 0, "segments": [], "full_dim": None, "pca": None, "tombstones": None}
+        self._manifest_stamp = None
+        self._segments = {}  # segment id -> Segment, in manifest order
+        self._pending_dead = {}  # tombstones for segments not opened yet
+        self._tombstone_offset = 0
+        self._locations = {}  # vector id -> (segment id, row)
+        self._postings = {field: {} for field in FILTER_FIELDS}  # value -> {(segment id, row)}
+        self._reducers = {}
+
+    # Writes
+
+    def add(self, ids, vectors, metadatas):
+        """Insert or replace vectors; metadata must include the chunk text under 'text'"""
+        vectors = _normalize(np.asarray(vectors, dtype=np.float32))
+        if len(ids) != len(vectors) or len(ids) != len(metadatas):
+            raise ValueError("ids, vectors and metadatas must have the same length")
+        if not len(ids):
+            return 0
+        with IndexWriteLock(self):
+            with self._lock:
+                manifest = dict(self._manifest)
+                replaced = [self._locations[i] for i in ids if i in self._locations]
+            if manifest["full_dim"] is None:
+                manifest["full_dim"] = int(vectors.shape[1])
+            elif vectors.shape[1] != manifest["full_dim"]:
+                raise ValueError(f"Expected {manifest['full_dim']}-dimensional vectors, got {vectors.shape[1]}")
+
+            codec = self._target_codec(manifest)
+            segment_id = self._new_segment_id(manifest)
+            Segment.write(self.segments_dir, segment_id, ids, vectors, metadatas,
+                          self._reducer(codec, manifest["full_dim"]), codec)
+            manifest["segments"] = manifest["segments"] + [segment_id]
+            self._publish(manifest)
+            self._refresh()
+            # The new rows are visible before the old ones are retired; search drops the duplicates
+            self._append_tombstones(replaced)
+            self._refresh()
+        self._maybe_compact()
+        return len(ids)
+
+    def delete(self, ids=None, filter=None):
+        """Delete by ids and/or a metadata filter; returns the number of rows removed"""
+        with IndexWriteLock(self):
+            with self._lock:
+                locations = set()
+                if ids:
+                    locations.update(self._locations[i] for i in ids if i in self._locations)
+                if filter:
+                    locations.update(self._match(filter))
+            self._append_tombstones(locations)
+            self._refresh()
+        self._maybe_compact()
+        return len(locations)
+
+    def compact(self, force=False):
+        """Merge small, stale or mostly deleted segments; returns how many were merged.
+
+        Holds the write lock, so other writers wait, but searches keep using
+        the old segments until the new manifest is published.
+        """
+        with IndexWriteLock(self):
+            with self._lock:
+                manifest = dict(self._manifest)
+                segments = dict(self._segments)
+            if manifest["full_dim"] is None:
+                return 0
+            if self._pca_due(manifest):
+                self._fit_pca(manifest, segments)
+            merge = self._compaction_plan(manifest, segments, force)
+            if not merge:
+                return 0
+
+            started = time.time()
+            codec = self._target_codec(manifest)
+            reducer = self._reducer(codec, manifest["full_dim"])
+            written = []
+            batch = {"ids": [], "vectors": [], "metadatas": []}
+
+            def flush():
+                if batch["ids"]:
+                    segment_id = self._new_segment_id(manifest, len(written))
+                    Segment.write(self.segments_dir, segment_id, batch["ids"], np.concatenate(batch["vectors"]),
+                                  batch["metadatas"], reducer, codec)
+                    written.append(segment_id)
+                    batch.update(ids=[], vectors=[], metadatas=[])
+
+            for segment_id in merge:
+                segment = segments[segment_id]
+                rows = np.flatnonzero(segment.alive)
+                if len(rows):
+                    batch["ids"].extend(segment.ids[row] for row in rows)
+                    batch["vectors"].append(np.asarray(segment.full[rows]))
+                    batch["metadatas"].extend(segment.metadata(row) for row in rows)
+                if len(batch["ids"]) >= self.segment_rows:
+                    flush()
+            flush()
+
+            # Merged output takes the place of the first segment it replaces
+            merged = set(merge)
+            position = manifest["segments"].index(merge[0])
+            before = [s for s in manifest["segments"][:position] if s not in merged]
+            after = [s for s in manifest["segments"][position:] if s not in merged]
+            manifest["segments"] = before + written + after
+            old_tombstones = self._tombstone_path(manifest)
+            manifest["tombstones"] = self._rewrite_tombstones(manifest, segments, before + after)
+            self._publish(manifest)
+            self._refresh()
+
+            # Workers that still map the old files keep reading them until they refresh;
+            # one that read the old manifest but had not opened them yet retries (see _refresh)
+            if old_tombstones and os.path.exists(old_tombstones):
+                os.remove(old_tombstones)
+            for segment_id in merge:
+                shutil.rmtree(os.path.join(self.segments_dir, segment_id), ignore_errors=True)
+            logger.info(f"Compacted {len(merge)} segments into {len(written)} in {time.time() - started:.1f}s")
+            return len(merge)
+
+    # Reads
+
+    def search(self, query_vector, k=10, filter=None, rescore=True):
+        """Top-k (score, id, metadata) by cosine similarity, best first"""
+        with self._lock:
+            self._refresh()
+            if not self._segments or not k:
+                return []
+            if filter:
+                candidates = {}
+                for segment_id, row in self._match(filter):
+                    candidates.setdefault(segment_id, []).append(row)
+                targets = [(self._segments[s], np.asarray(sorted(rows), dtype=np.int64)) for s, rows in candidates.items()]
+            else:
+                targets = [(segment, np.flatnonzero(segment.alive)) for segment in self._segments.values()]
+
+            query = _normalize(np.asarray(query_vector, dtype=np.float32))
+            shortlist = k * self.rescore_factor if rescore else k
+            pool = []  # [score, segment, row, exact]
+            for segment, rows in targets:
+                if not len(rows):
+                    continue
+                scores, exact = self._segment_scores(segment, rows, query)
+                keep = min(len(rows), k if exact else shortlist)
+                top = np.argpartition(-scores, keep - 1)[:keep] if keep < len(rows) else np.arange(len(rows))
+                pool.extend([float(scores[i]), segment, int(rows[i]), exact] for i in top)
+
+            pool.sort(key=lambda hit: hit[0], reverse=True)
+            pool = pool[:shortlist]
+            if rescore:
+                by_segment = {}
+                for hit in pool:
+                    if not hit[3]:
+                        by_segment.setdefault(hit[1].id, []).append(hit)
+                for hits in by_segment.values():
+                    segment = hits[0][1]
+                    rows = np.asarray([hit[2] for hit in hits])
+                    for hit, score in zip(hits, np.asarray(segment.full[rows]) @ query):
+                        hit[0] = float(score)
+                pool.sort(key=lambda hit: hit[0], reverse=True)
+
+            results, seen = [], set()
+            for score, segment, row, _ in pool:
+                vector_id = segment.ids[row]
+                if vector_id in seen:
+                    continue
+                seen.add(vector_id)
+                results.append((score, vector_id, segment.metadata(row)))
+                if len(results) == k:
+                    break
+            return results
+
+    def __len__(self):
+        with self._lock:
+            self._refresh()
+            return len(self._locations)
+
+    def list_ids(self, prefix=None):
+        """Ids of every live vector (starting with prefix, if given), sorted"""
+        with self._lock:
+            self._refresh()
+            if prefix is None:
+                return sorted(self._locations)
+            return sorted(i for i in self._locations if i.startswith(prefix))
+
+    def fetch(self, ids):
+        """{id: metadata} for those of the ids that exist"""
+        with self._lock:
+            self._refresh()
+            found = {i: self._locations[i] for i in ids if i in self._locations}
+            return {i: self._segments[segment_id].metadata(row) for i, (segment_id, row) in found.items()}
+
+    def vectors(self, ids):
+        """{id: full (normalized) vector} for those of the ids that exist"""
+        with self._lock:
+            self._refresh()
+            found = {i: self._locations[i] for i in ids if i in self._locations}
+            return {i: np.array(self._segments[segment_id].full[row]) for i, (segment_id, row) in found.items()}
+
+    def stats(self):
+        """Segment layout and storage footprint of the index"""
+        with self._lock:
+            self._refresh()
+            rows = sum(segment.rows for segment in self._segments.values())
+            disk = {"full": 0, "codes": 0, "metadata": 0}
+            for segment in self._segments.values():
+                for key, size in segment.disk_bytes().items():
+                    disk[key] += size
+            full_dim = self._manifest["full_dim"] or 0
+            codec = self._target_codec(self._manifest) if full_dim else None
+            return {
+                "segments": len(self._segments),
+                "generation": self._manifest["generation"],
+                "vectors": len(self._locations),
+                "deleted_rows": rows - len(self._locations),
+                "full_dim": full_dim,
+                "stored_dim": codec["dim"] if codec else full_dim,
+                "reduction": codec["reduction"] if codec else self.reduction,
+                "pca_fitted": self._manifest["pca"] is not None,
+                "quantization": self.quantization,
+                "code_bytes": disk["codes"],
+                "full_precision_bytes": disk["full"],
+                "metadata_bytes": disk["metadata"],
+                "bytes_per_vector": disk["codes"] / rows if rows else 0.0,
+                "float32_bytes_per_vector": full_dim * 4,
+                "compression_ratio": (rows * full_dim * 4) / disk["codes"] if disk["codes"] else 0.0,
+                "compacting": self._compacting,
+            }
+
+    def evaluate_recall(self, queries, k=10):
+        """Recall@k of compressed search, with and without rescoring, against exact search"""
+        with self._lock:
+            self._refresh()
+            ids, blocks = [], []
+            for segment in self._segments.values():
+                rows = np.flatnonzero(segment.alive)
+                ids.extend(segment.ids[row] for row in rows)
+                blocks.append(np.asarray(segment.full[rows]))
+            if not ids:
+                return {"queries": 0, "k": k}
+            full = np.concatenate(blocks)
+            found = {"approximate": 0, "rescored": 0}
+            for query in np.asarray(queries, dtype=np.float32):
+                exact = {ids[i] for i in np.argsort(-(full @ _normalize(query)))[:k]}
+                for name, rescore in (("approximate", False), ("rescored", True)):
+                    hits = self.search(query, k, rescore=rescore)
+                    found[name] += len(exact & {vector_id for _, vector_id, _ in hits})
+            total = len(queries) * min(k, len(ids))
+            return {
+                "queries": len(queries),
+                "k": k,
+                "recall_approximate": found["approximate"] / total,
+                "recall_rescored": found["rescored"] / total,
+            }
+
+    # Manifest, codecs and compaction (writers hold the write lock)
+
+    def _new_segment_id(self, manifest, n=0):
+        return f"{manifest['generation'] + 1:08d}-{n:03d}-{uuid.uuid4().hex[:8]}"
+
+    def _publish(self, manifest):
+        manifest["generation"] += 1
+        if manifest["tombstones"] is None:
+            manifest["tombstones"] = f"tombstones-{manifest['generation']:08d}.log"
+        _write_json(self._manifest_path, manifest)
+
+    def _target_codec(self, manifest):
+        """Codec for new segments; None (full vectors only) until a PCA projection is fitted"""
+        reducer = Reducer(self.reduction, self.target_dim, manifest["full_dim"])
+        if reducer.method == "pca" and manifest["pca"] is None:
+            return None
+        return {
+            "reduction": reducer.method,
+            "dim": reducer.dim,
+            "quantization": self.quantization,
+            "pca": manifest["pca"] if reducer.method == "pca" else None,
+        }
+
+    def _reducer(self, codec, full_dim):
+        if codec is None:
+            return None
+        key = (codec["reduction"], codec["dim"], codec["pca"], full_dim)
+        reducer = self._reducers.get(key)
+        if reducer is None:
+            reducer = Reducer(codec["reduction"], codec["dim"], full_dim)
+            if codec["pca"]:
+                reducer.load(os.path.join(self.directory, codec["pca"]))
+            self._reducers[key] = reducer
+        return reducer
+
+    def _pca_due(self, manifest):
+        reducer = Reducer(self.reduction, self.target_dim, manifest["full_dim"])
+        return reducer.method == "pca" and manifest["pca"] is None and len(self._locations) >= self.pca_samples
+
+    def _fit_pca(self, manifest, segments):
+        started = time.time()
+        blocks, collected = [], 0
+        for segment in segments.values():
+            rows = np.flatnonzero(segment.alive)[:self.pca_samples - collected]
+            blocks.append(np.asarray(segment.full[rows]))
+            collected += len(rows)
+            if collected >= self.pca_samples:
+                break
+        reducer = Reducer(self.reduction, self.target_dim, manifest["full_dim"])
+        reducer.fit(np.concatenate(blocks))
+        slug = re.sub(r'[^A-Za-z0-9_.-]+', '--', self.model_name)
+        name = f"pca-{slug}-{reducer.full_dim}x{reducer.dim}-{manifest['generation'] + 1:08d}.npz"
+        reducer.save(os.path.join(self.directory, name))
+        manifest["pca"] = name
+        logger.info(f"Fitted PCA on {collected} vectors in {time.time() - started:.1f}s")
+
+    def _compaction_plan(self, manifest, segments, force=False):
+        codec = self._target_codec(manifest)
+        live = [segments[s] for s in manifest["segments"] if s in segments]
+        merge = {s.id for s in live if s.codec != codec}
+        merge |= {s.id for s in live if s.rows and 1 - s.alive.sum() / s.rows > self.max_dead_ratio}
+        small = {s.id for s in live if s.rows < self.segment_rows}
+        if len(small) > 1 and (force or len(live) > self.max_segments):
+            merge |= small
+        return [s for s in manifest["segments"] if s in merge]
+
+    def _maybe_compact(self):
+        if not self.background_compaction:
+            return
+        with self._lock:
+            if self._compacting or not self._segments:
+                return
+            if not (self._pca_due(self._manifest) or self._compaction_plan(self._manifest, self._segments)):
+                return
+            self._compacting = True
+
+        def run():
+            try:
+                self.compact()
+            except Exception as e:
+                logger.error(f"Local index compaction failed: {str(e)}")
+            finally:
+                self._compacting = False
+
+        threading.Thread(target=run, name="local-index-compaction", daemon=True).start()
+
+    def _tombstone_path(self, manifest=None):
+        name = (manifest or self._manifest)["tombstones"]
+        return os.path.join(self.directory, name) if name else None
+
+    def _append_tombstones(self, locations):
+        path = self._tombstone_path()
+        # No manifest yet means there is nothing to delete either
+        if not locations or not path:
+            return
+        with open(path, "a", encoding="utf-8") as handle:
+            handle.write("".join(f"{segment_id} {row}\n" for segment_id, row in locations))
+
+    def _rewrite_tombstones(self, manifest, segments, kept):
+        """Start a new tombstone log with only the entries of segments that survive compaction"""
+        name = f"tombstones-{manifest['generation'] + 1:08d}.log"
+        lines = []
+        for segment_id in kept:
+            segment = segments.get(segment_id)
+            if segment is not None:
+                lines.extend(f"{segment_id} {row}\n" for row in np.flatnonzero(~segment.alive))
+        with open(os.path.join(self.directory, name), "w", encoding="utf-8") as handle:
+            handle.write("".join(lines))
+        return name
+
+    # Process-local view of the files
+
+    def _refresh(self):
+        """Bring this process's view up to date with the manifest and tombstone log"""
+        with self._lock:
+            try:
+                stat = os.stat(self._manifest_path)
+                stamp = (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+            except FileNotFoundError:
+                stamp = None
+            for attempt in range(MANIFEST_RETRIES):
+                if stamp is None or stamp == self._manifest_stamp:
+                    break
+                with open(self._manifest_path, encoding="utf-8") as handle:
+                    manifest = json.load(handle)
+                try:
+                    self._load_segments(manifest)
+                except FileNotFoundError:
+                    # A compaction published after this manifest was read and removed the
+                    # segments it merged; the newer manifest lists what replaced them
+                    if attempt == MANIFEST_RETRIES - 1:
+                        raise
+                    stat = os.stat(self._manifest_path)
+                    stamp = (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+                    continue
+                if manifest["tombstones"] != self._manifest["tombstones"]:
+                    # Compaction started a new log; replay it from the start
+                    self._tombstone_offset = 0
+                self._manifest = manifest
+                self._manifest_stamp = stamp
+                break
+            self._read_tombstones()
+
+    def _load_segments(self, manifest):
+        """Switch to the manifest's segments; raises FileNotFoundError, leaving the
+        view as it was, if one of them has already been removed"""
+        wanted = manifest["segments"]
+        opened = {}
+        try:
+            for segment_id in wanted:
+                if segment_id not in self._segments:
+                    opened[segment_id] = Segment(segment_id, os.path.join(self.segments_dir, segment_id))
+        except FileNotFoundError:
+            for segment in opened.values():
+                segment.close()
+            raise
+        for segment_id in [s for s in self._segments if s not in wanted]:
+            segment = self._segments.pop(segment_id)
+            self._unindex(segment, np.flatnonzero(segment.alive))
+            segment.close()
+        ordered = {}
+        for segment_id in wanted:
+            segment = self._segments.get(segment_id)
+            if segment is None:
+                segment = opened[segment_id]
+                for row in self._pending_dead.pop(segment_id, ()):
+                    segment.alive[row] = False
+                self._index(segment)
+            ordered[segment_id] = segment
+        self._segments = ordered
+        # Tombstones of segments that were compacted away before this process opened them
+        self._pending_dead = {segment_id: rows for segment_id, rows in self._pending_dead.items() if segment_id in ordered}
+
+    def _read_tombstones(self):
+        path = self._tombstone_path()
+        if not path:
+            return
+        try:
+            with open(path, "rb") as handle:
+                handle.seek(self._tombstone_offset)
+                data = handle.read()
+        except FileNotFoundError:
+            return
+        end = data.rfind(b"\n") + 1  # Only complete lines
+        if not end:
+            return
+        self._tombstone_offset += end
+        for line in data[:end].decode("utf-8").splitlines():
+            segment_id, row = line.split()
+            row = int(row)
+            segment = self._segments.get(segment_id)
+            if segment is None:
+                self._pending_dead.setdefault(segment_id, set()).add(row)
+            elif segment.alive[row]:
+                segment.alive[row] = False
+                self._unindex(segment, [row])
+
+    def _index(self, segment):
+        for row in np.flatnonzero(segment.alive):
+            row = int(row)
+            location = (segment.id, row)
+            self._locations[segment.ids[row]] = location
+            for field in FILTER_FIELDS:
+                value = segment.fields[field][row]
+                if value is not None:
+                    self._postings[field].setdefault(value, set()).add(location)
+
+    def _unindex(self, segment, rows):
+        for row in rows:
+            row = int(row)
+            location = (segment.id, row)
+            if self._locations.get(segment.ids[row]) == location:
+                del self._locations[segment.ids[row]]
+            for field in FILTER_FIELDS:
+                value = segment.fields[field][row]
+                posting = self._postings[field].get(value)
+                if posting is not None:
+                    posting.discard(location)
+                    if not posting:
+                        del self._postings[field][value]
+
+    def _segment_scores(self, segment, rows, query):
+        """Scores for some rows of a segment, and whether they are already exact"""
+        if segment.codes is None:
+            return np.asarray(segment.full[rows]) @ query, True
+        reducer = self._reducer(segment.codec, self._manifest["full_dim"])
+        reduced_query = reducer.transform(query[None, :])[0].astype(np.float32)
+        parts = []
+        for start in range(0, len(rows), SCORE_BLOCK_ROWS):
+            block = rows[start:start + SCORE_BLOCK_ROWS]
+            if block[-1] - block[0] + 1 == len(block):
+                # Contiguous rows (the unfiltered case): slice the memmap instead of gathering
+                block = slice(int(block[0]), int(block[-1]) + 1)
+            codes = segment.codes[block]
+            part = (codes if codes.dtype == np.float32 else codes.astype(np.float32)) @ reduced_query
+            if segment.scales is not None:
+                part *= segment.scales[block]
+            parts.append(part)
+        exact = segment.codec["reduction"] == "none" and segment.codec["quantization"] == "float32"
+        return np.concatenate(parts), exact
+
+    def _match(self, filter):
+        """Locations matching a Pinecone-style filter ({field: value | {"$eq" | "$ne": v} | {"$in" | "$nin": [...]}})"""
+        locations = None
+        for field, condition in filter.items():
+            if isinstance(condition, dict) and ("$ne" in condition or "$nin" in condition):
+                excluded = condition.get("$nin", [condition.get("$ne")])
+                pool = locations if locations is not None else set(self._locations.values())
+                if field in self._postings:
+                    matched = set(pool)
+                    for value in excluded:
+                        matched -= self._postings[field].get(value, set())
+                else:
+                    matched = {(s, row) for s, row in pool if self._segments[s].metadata(row).get(field) not in excluded}
+                locations = matched
+                if not locations:
+                    return set()
+                continue
+            if isinstance(condition, dict):
+                values = condition.get("$in", [condition["$eq"]] if "$eq" in condition else [])
+            else:
+                values = [condition]
+            if field in self._postings:
+                matched = set()
+                for value in values:
+                    matched |= self._postings[field].get(value, set())
+            else:
+                pool = locations if locations is not None else self._locations.values()
+                matched = {(s, row) for s, row in pool if self._segments[s].metadata(row).get(field) in values}
+            locations = matched if locations is None else locations & matched
+            if not locations:
+                return set()
+        return locations
+
+
+class IndexWriteLock:
+    """Exclusive lock file so one writer at a time changes an index, across threads and workers.
+
+    Works with any index that has a ``directory`` and a ``_refresh()`` that
+    catches up with changes made by other processes.
+    """
+
+    def __init__(self, index):
+        self.index = index
+        self._handle = None
+
+    def __enter__(self):
+        import fcntl  # Unix only, like the page cache sharing this index relies on
+
+        # A separate open file per holder, so threads of one process exclude each other too
+        self._handle = open(os.path.join(self.index.directory, ".write.lock"), "w")
+        fcntl.flock(self._handle, fcntl.LOCK_EX)
+        self.index._refresh()
+        return self
+
+    def __exit__(self, *exc):
+        import fcntl
+
+        fcntl.flock(self._handle, fcntl.LOCK_UN)
+        self._handle.close()
+        return False
+
+
+class LocalVectorStore:
+    """The slice of the LangChain vector store API that finalEmbed uses, over a LocalVectorIndex"""
+
+    def __init__(self, index, embedding):
+        self.index = index
+        self.embedding = embedding
+
+    def add_texts(self, texts, metadatas=None, ids=None):
+        texts = list(texts)
+        metadatas = metadatas or [{} for _ in texts]
+        ids = ids or [f"{time.time_ns()}_{i}" for i in range(len(texts))]
+        vectors = self.embedding.embed_documents(texts)
+        self.index.add(ids, vectors, [dict(m, text=t) for m, t in zip(metadatas, texts)])
+        return ids
+
+    def similarity_search_by_vector_with_score(self, embedding, k=4, filter=None):
+        from langchain_core.documents import Document
+
+        results = []
+        for score, _, metadata in self.index.search(embedding, k, filter):
+            metadata = dict(metadata)
+            text = metadata.pop("text", "")
+            results.append((Document(page_content=text, metadata=metadata), score))
+        return results
+
+    def similarity_search(self, query, k=4, filter=None):
+        query_vector = self.embedding.embed_query(query)
+        return [doc for doc, _ in self.similarity_search_by_vector_with_score(query_vector, k, filter)]
+
+    def delete(self, ids=None, filter=None):
+        self.index.delete(ids=ids, filter=filter)
+        return True
+
+
+# Memory and recall report
+
+
+def sample_vectors(count, dim, seed=0):
+    """Clustered, anisotropic vectors that resemble sentence embeddings more than noise does"""
+    rng = np.random.default_rng(seed)
+    basis = rng.standard_normal((dim // 4, dim)) * np.linspace(2.0, 0.1, dim // 4)[:, None]
+    centers = rng.standard_normal((max(8, count // 200), dim // 4))
+    latent = centers[rng.integers(0, len(centers), count)] + 0.5 * rng.standard_normal((count, dim // 4))
+    return (latent @ basis + 0.05 * rng.standard_normal((count, dim))).astype(np.float32)
+
+
+def report(vectors, queries, k, configurations):
+    results = []
+    for reduction, dim, quantization in configurations:
+        directory = tempfile.mkdtemp()
+        index = LocalVectorIndex(reduction=reduction, dim=dim, quantization=quantization, directory=directory,
+                                 pca_samples=min(len(vectors), LOCAL_INDEX_PCA_SAMPLES), background_compaction=False)
+        index.add([str(i) for i in range(len(vectors))], vectors, [{"text": ""} for _ in range(len(vectors))])
+        # Fits the PCA projection where configured and re-encodes with it
+        index.compact(force=True)
+        started = time.time()
+        for query in queries:
+            index.search(query, k)
+        latency = (time.time() - started) / len(queries)
+        stats = index.stats()
+        stats.update(index.evaluate_recall(queries, k))
+        stats["search_ms"] = latency * 1000
+        results.append(stats)
+        shutil.rmtree(directory, ignore_errors=True)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Maintain and evaluate the local vector index")
+    parser.add_argument("command", choices=("report", "compact"))
+    parser.add_argument("--vectors-file", help=".npy matrix of real embeddings (e.g. from onnx_embeddings.py run)")
+    parser.add_argument("--vectors", type=int, default=20000, help="Synthetic vectors when no file is given")
+    parser.add_argument("--dim", type=int, default=1024)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--k", type=int, default=10)
+    args = parser.parse_args()
+
+    if args.command == "compact":
+        index = LocalVectorIndex(background_compaction=False)
+        merged = index.compact(force=True)
+        print(json.dumps(dict(index.stats(), merged_segments=merged), indent=2))
+        return
+
+    if args.vectors_file:
+        vectors = np.load(args.vectors_file).astype(np.float32)
+    else:
+        vectors = sample_vectors(args.vectors + args.queries, args.dim)
+    # Held-out queries so no query finds itself
+    queries, vectors = vectors[:args.queries], vectors[args.queries:]
+    full_dim = vectors.shape[1]
+
+    configurations = [
+        ("none", 0, "float32"),
+        ("none", 0, "float16"),
+        ("none", 0, "int8"),
+        ("matryoshka", full_dim // 2, "int8"),
+        ("pca", full_dim // 4, "float16"),
+        ("pca", full_dim // 4, "int8"),
+    ]
+    print(f"{len(vectors)} vectors x {full_dim} dims, {len(queries)} queries, recall@{args.k}")
+    print(f"{'reduction':<12}{'dim':>6}{'quant':>9}{'B/vector':>10}{'ratio':>7}{'recall':>8}{'rescored':>10}{'ms/query':>10}")
+    for row in report(vectors, queries, args.k, configurations):
+        print(f"{row['reduction']:<12}{row['stored_dim']:>6}{row['quantization']:>9}{row['bytes_per_vector']:>10.0f}"
+              f"{row['compression_ratio']:>7.1f}{row['recall_approximate']:>8.3f}{row['recall_rescored']:>10.3f}"
+              f"{row['search_ms']:>10.2f}")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
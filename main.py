@@ -1,6 +1,12 @@
 from flask import Flask, render_template, jsonify, request, redirect, url_for, send_from_directory
-from store_index import store_data
-from finalEmbed import embed_response, collected_data, init_pinecone, delete_embeddings
+from store_index import store_data, store_many, is_failed_scrape, canonical_url
+from scrapers.paper import ScrapeError, Paper
+from finalEmbed import embed_response, collected_data, init_pinecone, delete_embeddings_for_sessions, delete_session_documents, index_document, answer_across_documents, embedding_batcher_stats, preload_embeddings, local_index_stats, search_library, library_index_stats, LIBRARY_SEARCH, answer_from_summaries, summary_stats, vector_writer_stats, generation_stats, dedup_stats
+from generation_scheduler import GenerationBusy, request_deadline
+from session_cache import SessionCache
+from session_reaper import SessionReaper
+from session_registry import SessionRegistry
+import metadata_router
 import os
 import logging
 from dotenv import load_dotenv
@@ -8,7 +14,7 @@ import uuid
 from werkzeug.utils import secure_filename
 from pypdf import PdfReader
 import shutil
-from datetime import datetime, timedelta
+from datetime import datetime
 import time
 
 # Set up logging
@@ -22,6 +28,17 @@ load_dotenv()
 UPLOAD_FOLDER = 'uploads'
 ALLOWED_EXTENSIONS = {'pdf'}
 
+# Upper bound on the number of URLs accepted by one bulk ingest request
+BULK_INGEST_MAX_URLS = int(os.getenv("BULK_INGEST_MAX_URLS", "200"))
+
+# Upper bounds for one library search request
+LIBRARY_MAX_RESULTS = int(os.getenv("LIBRARY_MAX_RESULTS", "50"))
+LIBRARY_MAX_PASSAGES = int(os.getenv("LIBRARY_MAX_PASSAGES", "10"))
+
+# Seconds one chat request may spend waiting for and running text generation;
+# must stay below the worker timeout in gunicorn.conf.py
+CHAT_DEADLINE_SECONDS = float(os.getenv("CHAT_DEADLINE_SECONDS", "45"))
+
 # Create uploads folder if it doesn't exist
 if not os.path.exists(UPLOAD_FOLDER):
     os.makedirs(UPLOAD_FOLDER)
@@ -34,91 +51,139 @@ app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # Limit file size to 16MB
 
 # Session data storage
-# Structure: {session_id: {'url': url, 'pdf_filename': pdf_filename, 'data': data, 'last_active': timestamp, 'pdf_list': [list of pdf files]}}
-session_data = {}
+# Each session holds {'url': active url, 'pdf_filename': active pdf, 'pdf_list': [list of pdf files],
+# 'documents': [source of every indexed document], 'papers': {source: bibliographic
+# fields of each scraped paper}}. The text of each document is
+# stored compressed under its source ('pdf:<filename>' or the URL). Sessions are
+# evicted least-recently-used first once the cache exceeds its byte budget.
+SESSION_MAX_IDLE_SECONDS = int(os.getenv("SESSION_MAX_IDLE_SECONDS", str(2 * 60 * 60)))
 
-# Function to clean up old sessions (older than 2 hours)
-def cleanup_old_sessions():
-    now = datetime.now()
-    expired_sessions = []
-    
-    # First, check for expired sessions (older than 2 hours)
-    for session_id, data in session_data.items():
-        last_active = data.get('last_active')
-        if last_active and (now - last_active) > timedelta(hours=2):
-            expired_sessions.append(session_id)
-    
-    # Also, limit the total number of sessions to prevent memory issues
-    # Keep only the 10 most recent sessions if we have more
-    if len(session_data) > 10:
-        # Sort sessions by last_active (oldest first)
-        all_sessions = [(sid, data.get('last_active', datetime.min)) 
-                        for sid, data in session_data.items()]
-        all_sessions.sort(key=lambda x: x[1])
-        
-        # Add older sessions to the expired list (except the 10 newest)
-        for session_id, _ in all_sessions[:-10]:
-            if session_id not in expired_sessions:
-                expired_sessions.append(session_id)
-                logger.info(f"Adding session {session_id} to cleanup (exceeds session limit)")
-    
-    # Process all expired sessions
-    for session_id in expired_sessions:
-        logger.info(f"Cleaning up expired session: {session_id}")
-        # Delete associated PDFs
-        pdf_list = session_data[session_id].get('pdf_list', [])
-        for pdf_filename in pdf_list:
-            try:
-                pdf_path = os.path.join(app.config['UPLOAD_FOLDER'], pdf_filename)
-                if os.path.exists(pdf_path):
-                    os.remove(pdf_path)
-                    logger.info(f"Deleted PDF file: {pdf_path}")
-            except Exception as e:
-                logger.error(f"Error deleting PDF file: {str(e)}")
-        
-        # Clean up Pinecone data
-        try:
-            delete_embeddings(f"session:{session_id}")
-            logger.info(f"Deleted Pinecone data for session: {session_id}")
-        except Exception as e:
-            logger.error(f"Error deleting Pinecone data: {str(e)}")
-        
-        # Remove session data
-        del session_data[session_id]
-    
-    # Clean up orphaned PDFs in the uploads folder
-    try:
-        # Get all PDF files in the uploads folder
-        pdf_files = [f for f in os.listdir(app.config['UPLOAD_FOLDER']) if f.endswith('.pdf')]
-        
-        # Get all PDFs tracked in sessions
-        tracked_pdfs = []
-        for session in session_data.values():
-            tracked_pdfs.extend(session.get('pdf_list', []))
-        
-        # Delete PDFs that aren't tracked in any session
-        for pdf_file in pdf_files:
-            if pdf_file not in tracked_pdfs:
-                try:
-                    pdf_path = os.path.join(app.config['UPLOAD_FOLDER'], pdf_file)
-                    if os.path.exists(pdf_path) and os.path.getmtime(pdf_path) < (time.time() - 7200):  # 2 hours
-                        os.remove(pdf_path)
-                        logger.info(f"Deleted orphaned PDF file: {pdf_path}")
-                except Exception as e:
-                    logger.error(f"Error deleting orphaned PDF file: {str(e)}")
-    except Exception as e:
-        logger.error(f"Error cleaning up orphaned PDFs: {str(e)}")
+def on_session_evicted(session_id, session):
+    logger.info(f"Cleaning up evicted session: {session_id}")
+    session_reaper.release(session_id, session)
+
+def on_session_created(session_id, last_active):
+    session_registry.touch(session_id, last_active)
+    session_reaper.schedule(session_id, last_active)
+
+# Live sessions shared with the other workers, so reconcile_vectors.py can
+# delete the vectors of sessions lost in a restart
+session_registry = SessionRegistry()
+
+session_data = SessionCache(on_evict=on_session_evicted, on_create=on_session_created)
+
+# Expiry, PDF deletion and vector cleanup run on a background thread so
+# request latency never includes garbage collection
+session_reaper = SessionReaper(
+    session_data,
+    UPLOAD_FOLDER,
+    SESSION_MAX_IDLE_SECONDS,
+    delete_embeddings_for_sessions,
+    registry=session_registry,
+    delete_documents=delete_session_documents
+)
+
+@app.before_request
+def start_background_workers():
+    # Started lazily so each gunicorn worker runs its own reaper after forking
+    session_reaper.ensure_started()
 
 # Function to check if file has an allowed extension
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
-# Initialize Pinecone on startup
-PINECONE_INITIALIZED = init_pinecone()
-if PINECONE_INITIALIZED:
-    logger.info("Successfully initialized Pinecone connection on startup")
-else:
-    logger.warning("Failed to initialize Pinecone connection on startup")
+def pdf_source(filename):
+    """Source identifier used for an uploaded PDF's vectors"""
+    return f"pdf:{filename}"
+
+def document_label(session_id, source):
+    """Human readable name of a session document"""
+    if source.startswith("pdf:"):
+        filename = source[len("pdf:"):]
+        if filename.startswith(f"{session_id}_"):
+            filename = filename[len(session_id) + 1:]
+        return filename
+    return source
+
+def session_sources(session):
+    """Sources of every document a session has vectors for"""
+    sources = set(session.get('documents', []))
+    if session.get('url'):
+        sources.add(session['url'])
+    if session.get('pdf_filename'):
+        sources.add(pdf_source(session['pdf_filename']))
+    return sources
+
+def metadata_papers(session_id, session):
+    """
+    The session's papers as (label, Paper) for the metadata router, or None
+    when a question about "this paper" may be about a document without scraped
+    fields, such as an uploaded PDF. If only some documents were scraped, the
+    active one is used alone, provided it is one of them.
+    """
+    papers = session.get('papers') or {}
+    if not papers:
+        return None
+    if all(source in papers for source in session.get('documents', [])):
+        sources = list(papers)
+    else:
+        active = pdf_source(session['pdf_filename']) if session.get('pdf_filename') else session.get('url')
+        if active not in papers:
+            return None
+        sources = [active]
+    return [(document_label(session_id, source), Paper.from_dict(papers[source])) for source in sources]
+
+def add_document(session_id, source, text=None, paper=None, **fields):
+    """
+    Index a document next to the session's other documents and remember it.
+    paper is the scraped Paper for URL documents, given instead of text so the
+    paper is never held as one string. Extra fields (such as the active url or
+    pdf) are stored on the session.
+    Returns the number of chunks stored in the vector index. The document is
+    only recorded on the session once chunks were stored.
+    """
+    session = session_data.get(session_id)
+    known = bool(session) and source in session.get('documents', [])
+    # Registered first so the reconciliation job never sees the vectors without an owner
+    session_registry.add_document(session_id, source)
+    chunk_count = 0
+    try:
+        chunk_count = index_document(text, source, session_id, paper=paper)
+    finally:
+        if not chunk_count and not known:
+            # Nothing stored; chunks a failed write left behind go to reconcile_vectors.py
+            session_registry.remove_documents(session_id, [source])
+    
+    session = session_data.get(session_id)
+    if not session:
+        session_data.create(session_id, url='', pdf_filename='', pdf_list=[], documents=[])
+        session = session_data.get(session_id)
+    
+    if not chunk_count:
+        # The active url or pdf is still set for the answers that do not use the index
+        if fields:
+            session_data.update(session_id, **fields)
+        return 0
+    
+    documents = session.get('documents', [])
+    if source not in documents:
+        documents.append(source)
+    if paper is not None:
+        # Kept without the body text so metadata questions skip the LLM
+        papers = dict(session.get('papers', {}))
+        papers[source] = paper.to_dict(sections=False)
+        fields['papers'] = papers
+    session_data.update(session_id, documents=documents, **fields)
+    session_data.set_text(session_id, paper.parts() if text is None else text, name=source)
+    return chunk_count
+
+# With EMBEDDING_MODE=preload and gunicorn --preload the model is loaded here,
+# in the master, and shared copy-on-write by every forked worker
+preload_embeddings()
+
+# Pinecone is checked on the first request rather than at import, so workers
+# boot without network calls; provisioning is done with `python fix_index.py provision`
+PINECONE_INITIALIZED = False
 
 # Direct routes to static files
 @app.route('/static/<path:filename>')
@@ -149,9 +214,6 @@ def check_status():
     
     has_api_keys = bool(hf_api_key and pinecone_api_key and pinecone_env)
     
-    # Run cleanup of old sessions
-    cleanup_old_sessions()
-    
     status = {
         "internet_connection": True,
         "api_keys_configured": has_api_keys,
@@ -170,7 +232,7 @@ def check_status():
 def process_url():
     try:
         data = request.get_json()
-        url = data.get('url')
+        url = canonical_url(data.get('url'))
         session_id = data.get('session_id')
         
         if not session_id:
@@ -184,42 +246,96 @@ def process_url():
             PINECONE_INITIALIZED = init_pinecone()
             logger.info(f"Pinecone initialization attempt: {PINECONE_INITIALIZED}")
         
-        # Clear any previous session data
-        if session_id in session_data:
-            # Delete associated PDF if exists
-            pdf_list = session_data[session_id].get('pdf_list', [])
-            for pdf_filename in pdf_list:
-                try:
-                    pdf_path = os.path.join(app.config['UPLOAD_FOLDER'], pdf_filename)
-                    if os.path.exists(pdf_path):
-                        os.remove(pdf_path)
-                        logger.info(f"Deleted previous PDF file: {pdf_path}")
-                except Exception as e:
-                    logger.error(f"Error deleting previous PDF file: {str(e)}")
-            
-            # Clean up Pinecone data
-            try:
-                delete_embeddings(f"session:{session_id}")
-                logger.info(f"Deleted Pinecone data for session: {session_id}")
-            except Exception as e:
-                logger.error(f"Error deleting Pinecone data: {str(e)}")
-        
         # Store URL data for this session
-        scraped_data = store_data(url)
+        try:
+            paper = store_data(url)
+        except ScrapeError as e:
+            # Scraped before anything is replaced, so a failure leaves the session as it was
+            logger.warning(f"Could not extract content from {url}: {str(e)}")
+            return jsonify({"status": "error", "message": str(e)}), 422
+        
+        # By default the paper is added next to the session's other documents;
+        # "replace": true starts the session over with just this paper
+        if data.get('replace'):
+            previous_session = session_data.pop(session_id)
+            if previous_session:
+                # The old documents' vectors are deleted in the background; the
+                # session's id lives on, so only those documents are deleted
+                session_reaper.release(session_id, previous_session, sources=session_sources(previous_session) - {url})
         
-        session_data[session_id] = {
-            'url': url,
-            'pdf_filename': '',  # Empty as we're using a URL
-            'pdf_list': [],  # Empty list of PDFs
-            'data': scraped_data,
-            'last_active': datetime.now()
-        }
+        chunk_count = add_document(session_id, url, paper=paper, url=url, pdf_filename='')
         
-        return jsonify({"status": "success", "pinecone_connected": PINECONE_INITIALIZED})
+        return jsonify({
+            "status": "success",
+            "session_id": session_id,
+            "chunks": chunk_count,
+            "pinecone_connected": PINECONE_INITIALIZED
+        })
     except Exception as e:
         logger.error(f"Error processing URL: {str(e)}")
         return jsonify({"status": "error", "message": str(e)}), 500
 
+@app.route("/process_urls", methods=["POST"])
+def process_urls():
+    """Ingest a reading list of URLs into one session"""
+    try:
+        data = request.get_json() or {}
+        urls = [url.strip() for url in data.get('urls', []) if isinstance(url, str) and url.strip()]
+        session_id = data.get('session_id')
+        
+        if not session_id:
+            session_id = str(uuid.uuid4())
+        
+        if not urls:
+            return jsonify({"status": "error", "message": "No URLs provided"}), 400
+        if len(urls) > BULK_INGEST_MAX_URLS:
+            return jsonify({"status": "error", "message": f"At most {BULK_INGEST_MAX_URLS} URLs can be ingested at once"}), 400
+        
+        logger.info(f"Bulk processing {len(urls)} URLs for session: {session_id}")
+        
+        # Try to ensure Pinecone is initialized
+        global PINECONE_INITIALIZED
+        if not PINECONE_INITIALIZED:
+            PINECONE_INITIALIZED = init_pinecone()
+            logger.info(f"Pinecone initialization attempt: {PINECONE_INITIALIZED}")
+        
+        results = []
+        # Fetches run concurrently; each paper is chunked and embedded as soon as it arrives
+        for url, paper, fetch_seconds in store_many(urls):
+            result = {"url": url, "fetch_seconds": round(fetch_seconds, 3)}
+            if is_failed_scrape(paper):
+                result.update({"status": "failed", "message": str(paper)})
+                results.append(result)
+                continue
+            
+            try:
+                chunk_count = add_document(session_id, url, paper=paper)
+            except Exception as e:
+                # One document failing must not lose the results of the others
+                logger.error(f"Error indexing {url}: {str(e)}")
+                result.update({"status": "failed", "message": f"Could not index this document: {str(e)}"})
+                results.append(result)
+                continue
+            if not chunk_count:
+                result.update({"status": "failed", "message": "Could not store embeddings for this document"})
+            else:
+                result.update({"status": "indexed", "chunks": chunk_count})
+            results.append(result)
+        
+        indexed = sum(1 for result in results if result["status"] == "indexed")
+        logger.info(f"Bulk ingest for session {session_id}: {indexed}/{len(results)} URLs indexed")
+        return jsonify({
+            "status": "success" if indexed else "error",
+            "session_id": session_id,
+            "indexed": indexed,
+            "failed": len(results) - indexed,
+            "results": results,
+            "pinecone_connected": PINECONE_INITIALIZED
+        })
+    except Exception as e:
+        logger.error(f"Error processing URLs: {str(e)}")
+        return jsonify({"status": "error", "message": str(e)}), 500
+
 @app.route("/upload_pdf", methods=["POST"])
 def upload_pdf():
     """Handle PDF file upload"""
@@ -247,17 +363,6 @@ def upload_pdf():
             filename = f"{session_id}_{original_filename}"
             file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
             
-            # If session already has a PDF, delete the old one
-            if session_id in session_data and session_data[session_id].get('pdf_filename'):
-                old_filename = session_data[session_id]['pdf_filename']
-                old_file_path = os.path.join(app.config['UPLOAD_FOLDER'], old_filename)
-                if os.path.exists(old_file_path):
-                    try:
-                        os.remove(old_file_path)
-                        logger.info(f"Removed previous PDF: {old_file_path}")
-                    except Exception as e:
-                        logger.error(f"Error removing previous PDF: {str(e)}")
-            
             # Save the file
             file.save(file_path)
             logger.info(f"Saved PDF to: {file_path}")
@@ -266,30 +371,14 @@ def upload_pdf():
             try:
                 pdf_text = extract_text_from_pdf(file_path)
                 
-                # Store in session data
-                if session_id in session_data:
-                    # Update existing session
-                    session_data[session_id]['pdf_filename'] = filename
-                    session_data[session_id]['data'] = pdf_text
-                    
-                    # Add to PDF list if not already present
-                    pdf_list = session_data[session_id].get('pdf_list', [])
-                    if filename not in pdf_list:
-                        pdf_list.append(filename)
-                    session_data[session_id]['pdf_list'] = pdf_list
-                    
-                    session_data[session_id]['last_active'] = datetime.now()
-                else:
-                    # Create new session
-                    session_data[session_id] = {
-                        'url': '',
-                        'pdf_filename': filename,
-                        'data': pdf_text,
-                        'pdf_list': [filename],
-                        'last_active': datetime.now()
-                    }
+                # Index the PDF next to the session's other documents
+                session = session_data.get(session_id)
+                pdf_list = session.get('pdf_list', []) if session else []
+                if filename not in pdf_list:
+                    pdf_list.append(filename)
+                add_document(session_id, pdf_source(filename), pdf_text, pdf_filename=filename, pdf_list=pdf_list)
                 
-                return jsonify({"status": "success", "message": "PDF uploaded successfully"})
+                return jsonify({"status": "success", "message": "PDF uploaded successfully", "filename": filename})
             except Exception as e:
                 logger.error(f"Error processing PDF: {str(e)}")
                 return jsonify({"status": "error", "message": f"Error processing PDF: {str(e)}"}), 500
@@ -306,11 +395,12 @@ def get_pdfs():
         data = request.get_json()
         session_id = data.get('session_id')
         
-        if not session_id or session_id not in session_data:
+        session = session_data.get(session_id) if session_id else None
+        if not session:
             return jsonify({"status": "error", "message": "Invalid session ID"}), 400
         
         # Get PDFs associated with this session
-        pdf_list = session_data[session_id].get('pdf_list', [])
+        pdf_list = session.get('pdf_list', [])
         
         # Format PDF list for display
         formatted_pdfs = []
@@ -323,7 +413,7 @@ def get_pdfs():
             formatted_pdfs.append({
                 "filename": pdf_name,
                 "display_name": display_name,
-                "is_active": pdf_name == session_data[session_id].get('pdf_filename', '')
+                "is_active": pdf_name == session.get('pdf_filename', '')
             })
         
         return jsonify({"status": "success", "pdfs": formatted_pdfs})
@@ -331,6 +421,70 @@ def get_pdfs():
         logger.error(f"Error getting PDFs: {str(e)}")
         return jsonify({"status": "error", "message": str(e)}), 500
 
+@app.route("/get_documents", methods=["POST"])
+def get_documents():
+    """List every document (PDFs and URLs) of a session"""
+    try:
+        data = request.get_json()
+        session_id = data.get('session_id')
+        
+        session = session_data.get(session_id) if session_id else None
+        if not session:
+            return jsonify({"status": "error", "message": "Invalid session ID"}), 400
+        
+        active_sources = {pdf_source(session['pdf_filename']) if session.get('pdf_filename') else '', session.get('url', '')}
+        documents = [{
+            "source": source,
+            "display_name": document_label(session_id, source),
+            "type": "pdf" if source.startswith("pdf:") else "url",
+            "is_active": source in active_sources
+        } for source in session.get('documents', [])]
+        
+        return jsonify({"status": "success", "documents": documents})
+    except Exception as e:
+        logger.error(f"Error getting documents: {str(e)}")
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+@app.route("/search_library", methods=["GET", "POST"])
+def search_library_route():
+    """
+    Rank every ingested paper for a query, with each paper's best passages.
+    Accepts q, k, passages and the ANN tuning knobs ef (HNSW) or nprobe (IVF)
+    as query parameters or JSON.
+    """
+    try:
+        data = request.get_json(silent=True) or request.values
+        query = (data.get('q') or data.get('query') or '').strip()
+        if not query:
+            return jsonify({"status": "error", "message": "No query provided"}), 400
+        if not LIBRARY_SEARCH:
+            return jsonify({"status": "error", "message": "Library search is disabled"}), 404
+        
+        try:
+            k = min(int(data.get('k', 10)), LIBRARY_MAX_RESULTS)
+            passages = min(int(data.get('passages', 3)), LIBRARY_MAX_PASSAGES)
+            ef = int(data['ef']) if data.get('ef') else None
+            nprobe = int(data['nprobe']) if data.get('nprobe') else None
+        except (TypeError, ValueError):
+            return jsonify({"status": "error", "message": "k, passages, ef and nprobe must be integers"}), 400
+        if k < 1 or passages < 1:
+            return jsonify({"status": "error", "message": "k and passages must be positive"}), 400
+        
+        started = time.time()
+        papers = search_library(query, k=k, passages=passages, ef=ef, nprobe=nprobe)
+        if papers is None:
+            return jsonify({"status": "error", "message": "Library search failed"}), 500
+        
+        return jsonify({
+            "status": "success",
+            "query": query,
+            "papers": papers,
+            "took_ms": round(1000 * (time.time() - started), 1)
+        })
+    except Exception as e:
+        logger.error(f"Error searching the library: {str(e)}")
+        return jsonify({"status": "error", "message": str(e)}), 500
+
 @app.route("/select_pdf", methods=["POST"])
 def select_pdf():
     """Select a PDF from those already uploaded"""
@@ -339,14 +493,15 @@ def select_pdf():
         session_id = data.get('session_id')
         filename = data.get('filename')
         
-        if not session_id or session_id not in session_data:
+        session = session_data.get(session_id) if session_id else None
+        if not session:
             return jsonify({"status": "error", "message": "Invalid session ID"}), 400
         
         if not filename:
             return jsonify({"status": "error", "message": "No filename provided"}), 400
         
         # Check if the PDF exists in the session's list
-        pdf_list = session_data[session_id].get('pdf_list', [])
+        pdf_list = session.get('pdf_list', [])
         if filename not in pdf_list:
             return jsonify({"status": "error", "message": "PDF not found in session"}), 404
         
@@ -355,15 +510,14 @@ def select_pdf():
         if not os.path.exists(file_path):
             return jsonify({"status": "error", "message": "PDF file not found on server"}), 404
         
-        # Set as active PDF and extract text if needed
-        session_data[session_id]['pdf_filename'] = filename
-        session_data[session_id]['last_active'] = datetime.now()
+        # Set as active PDF; every document of the session stays searchable
+        session_data.update(session_id, pdf_filename=filename)
         
-        # Extract text if not already in session data
-        if not session_data[session_id].get('data'):
+        # Index it if it is not part of the session's documents yet
+        if pdf_source(filename) not in session.get('documents', []):
             try:
                 pdf_text = extract_text_from_pdf(file_path)
-                session_data[session_id]['data'] = pdf_text
+                add_document(session_id, pdf_source(filename), pdf_text)
             except Exception as e:
                 logger.error(f"Error extracting text from PDF: {str(e)}")
                 return jsonify({"status": "error", "message": f"Error processing PDF: {str(e)}"}), 500
@@ -380,29 +534,12 @@ def clear_session():
         data = request.get_json()
         session_id = data.get('session_id')
         
-        if not session_id or session_id not in session_data:
+        session = session_data.pop(session_id) if session_id else None
+        if not session:
             return jsonify({"status": "success", "message": "No session to clear"}), 200
         
-        # Delete associated PDFs
-        pdf_list = session_data[session_id].get('pdf_list', [])
-        for pdf_filename in pdf_list:
-            try:
-                pdf_path = os.path.join(app.config['UPLOAD_FOLDER'], pdf_filename)
-                if os.path.exists(pdf_path):
-                    os.remove(pdf_path)
-                    logger.info(f"Deleted PDF file during session clear: {pdf_path}")
-            except Exception as e:
-                logger.error(f"Error deleting PDF file: {str(e)}")
-        
-        # Clean up Pinecone data
-        try:
-            delete_embeddings(f"session:{session_id}")
-            logger.info(f"Deleted Pinecone data for session: {session_id}")
-        except Exception as e:
-            logger.error(f"Error deleting Pinecone data: {str(e)}")
-        
-        # Remove session data
-        del session_data[session_id]
+        # Delete associated PDFs and Pinecone data in the background
+        session_reaper.release(session_id, session)
         logger.info(f"Cleared session: {session_id}")
         
         return jsonify({"status": "success", "message": "Session cleared successfully"})
@@ -426,19 +563,30 @@ def extract_text_from_pdf(pdf_path):
 
 @app.route("/get", methods=["GET", "POST"])
 def chat():
+    try:
+        # Every model call of this request shares one deadline
+        with request_deadline(CHAT_DEADLINE_SECONDS):
+            return answer_chat()
+    except GenerationBusy as e:
+        # Shed quickly so a slow model endpoint does not tie up every worker
+        logger.warning(f"Chat request shed: {str(e)}")
+        return ("The assistant is busy right now. Please try again in a few seconds.", 503,
+                {"Retry-After": str(e.retry_after)})
+
+def answer_chat():
+    """Answer the chat message of the current request"""
     try:
         userQuery = request.form["msg"]  # User's question
         session_id = request.form.get("session_id", "")
         logger.info(f'User query: {userQuery} for session: {session_id}')
 
         # Update the session's last active timestamp if it exists
-        if session_id and session_id in session_data:
-            session_data[session_id]['last_active'] = datetime.now()
-            
+        session = session_data.get(session_id, touch=True) if session_id else None
+        if session:
             # Get session data
-            userUrl = session_data[session_id].get('url', '')
-            pdfFilename = session_data[session_id].get('pdf_filename', '')
-            sessionStoredData = session_data[session_id].get('data', '')
+            userUrl = session.get('url', '')
+            pdfFilename = session.get('pdf_filename', '')
+            sessionStoredData = session_data.get_text(session_id)
         else:
             # Fall back to form data if no session found
             userUrl = request.form.get("url", "")
@@ -452,12 +600,39 @@ def chat():
             logger.info("Detected greeting, sending welcome message")
             return "Hello! I'm connected and ready to help analyze research papers. What would you like to know about this paper?"
 
+        # Title, author, DOI and abstract questions are answered from the scraped fields
+        papers = metadata_papers(session_id, session) if session else None
+        if papers:
+            metadata_answer = metadata_router.answer(userQuery, papers)
+            if metadata_answer is not None:
+                return metadata_answer
+
         # Ensure Pinecone connection
         global PINECONE_INITIALIZED
         if not PINECONE_INITIALIZED:
             PINECONE_INITIALIZED = init_pinecone()
             logger.info(f"Re-initialized Pinecone connection: {PINECONE_INITIALIZED}")
 
+        # Documents are indexed at ingest, so answer from all of them at once
+        if session and session.get('documents'):
+            documents = [(source, document_label(session_id, source)) for source in session['documents']]
+            
+            # Summaries are made in the background after ingest
+            summary_answer = answer_from_summaries(userQuery, documents)
+            if summary_answer is not None:
+                return summary_answer
+            
+            logger.info(f"Answering across {len(documents)} documents of session {session_id}")
+            
+            def stored_context():
+                # Used when the vector index returns nothing
+                return "\n\n".join(
+                    f"[{label}]\n" + session_data.get_text(session_id, name=source)[:1000]
+                    for source, label in documents
+                )
+            
+            return answer_across_documents(userQuery, session_id, documents, fallback=stored_context)
+
         # Process based on source type (URL or PDF)
         if pdfFilename:
             # Process PDF file - use cached data if available
@@ -484,14 +659,8 @@ def chat():
                 # Store in session data if we have a session ID
                 if session_id:
                     if session_id not in session_data:
-                        session_data[session_id] = {
-                            'url': '',
-                            'pdf_filename': pdfFilename,
-                            'data': pdf_text,
-                            'last_active': datetime.now()
-                        }
-                    else:
-                        session_data[session_id]['data'] = pdf_text
+                        session_data.create(session_id, url='', pdf_filename=pdfFilename)
+                    session_data.set_text(session_id, pdf_text)
                 
                 # Generate response using the extracted text
                 result = embed_response(pdf_text, userQuery, f"pdf:{pdfFilename}", session_id)
@@ -508,24 +677,18 @@ def chat():
                 return result
 
             # Otherwise fetch data
-            data = store_data(userUrl)
-            logger.info(f"Scraped data length: {len(data) if data else 0}")
-            
-            if not data:
-                logger.warning(f"No data returned from scraper for URL: {userUrl}")
+            try:
+                data = store_data(userUrl).to_text()
+            except ScrapeError as e:
+                logger.warning(f"No data returned from scraper for URL: {userUrl}: {str(e)}")
                 return "I couldn't extract content from this URL. Please check if it's a valid research paper or try a different URL."
+            logger.info(f"Scraped data length: {len(data)}")
             
             # Store in session data if we have a session ID
             if session_id:
                 if session_id not in session_data:
-                    session_data[session_id] = {
-                        'url': userUrl,
-                        'pdf_filename': '',
-                        'data': data,
-                        'last_active': datetime.now()
-                    }
-                else:
-                    session_data[session_id]['data'] = data
+                    session_data.create(session_id, url=userUrl, pdf_filename='')
+                session_data.set_text(session_id, data)
             
             # Filter out offline mode messages from the data
             if isinstance(data, str) and "offline mode" in data.lower():
@@ -547,6 +710,8 @@ def chat():
 
             return result
 
+    except GenerationBusy:
+        raise
     except Exception as e:
         logger.error(f"Error in chat endpoint: {str(e)}")
         return "I'm sorry, I encountered an error processing your request. Please try again with a different question or URL."
@@ -554,19 +719,37 @@ def chat():
 # Add a cleanup endpoint that can be called manually or on a schedule
 @app.route("/cleanup", methods=["GET"])
 def cleanup():
-    """Clean up old sessions and files"""
+    """Ask the background reaper to clean up old sessions and files"""
     try:
-        before_count = len(session_data)
-        cleanup_old_sessions()
-        after_count = len(session_data)
+        session_reaper.wake()
+        reaper_stats = session_reaper.stats()
         return jsonify({
             "status": "success",
-            "message": f"Cleaned up {before_count - after_count} sessions. {after_count} active sessions remain."
+            "message": f"Cleanup scheduled. {len(session_data)} active sessions, {reaper_stats['pending_releases']} pending releases.",
+            "reaper": reaper_stats
         })
     except Exception as e:
         logger.error(f"Error during cleanup: {str(e)}")
         return jsonify({"status": "error", "message": str(e)}), 500
 
+# Expose internal counters for monitoring
+@app.route("/metrics", methods=["GET"])
+def metrics():
+    """Runtime metrics for caches and background workers"""
+    return jsonify({
+        "session_cache": session_data.stats(),
+        "session_reaper": session_reaper.stats(),
+        "embedding_batcher": embedding_batcher_stats(),
+        "local_index": local_index_stats(),
+        "library_index": library_index_stats(),
+        "metadata_router": metadata_router.stats(),
+        "document_summaries": summary_stats(),
+        "vector_writer": vector_writer_stats(),
+        "session_registry": session_registry.stats(),
+        "generation": generation_stats(),
+        "chunk_dedup": dedup_stats()
+    })
+
 # Add a health check endpoint for Render
 @app.route('/health')
 def health_check():
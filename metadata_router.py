@@ -0,0 +1,163 @@
+"""
+Answers bibliographic questions ("who wrote this?", "what's the DOI?") straight
+from the fields the scrapers extracted, without embedding, retrieval or an LLM
+call. Anything that is not clearly a metadata lookup is left to the normal
+pipeline, as is any question whose field was not found on the page.
+"""
+import os
+import re
+import time
+import logging
+import threading
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Router configuration (can be overridden from the environment)
+METADATA_ROUTER = os.getenv("METADATA_ROUTER", "true").lower() == "true"
+# Longer questions are about the content even when they mention authors or the abstract
+METADATA_MAX_WORDS = int(os.getenv("METADATA_MAX_WORDS", "12"))
+
+# Politeness wrappers stripped before matching
+_PREFIX = re.compile(r'^(?:(?:please|hey|hi|ok|okay|so)\s*,?\s+)*'
+                     r'(?:(?:can|could|would) you (?:please )?(?:tell me|say|give me|show me|list)\s+'
+                     r'|(?:do you know|i want to know|i\'d like to know|tell me|show me|give me)\s+)?')
+# "... of this paper", "... for the article"
+_PAPER = r'(?:\s+(?:of|for|in|on)\s+(?:this|the|that|it|its)(?:\s+(?:paper|article|work|document|study|publication))?)?'
+_IT = r'(?:it|this|that|this paper|the paper|this article|the article|this work|the work|this study)'
+
+# Intent -> whole-question patterns, checked in order
+INTENT_PATTERNS = [
+    ("first_author", rf"(?:who(?: is|'s| was)|name) the (?:first|lead|main|primary) author{_PAPER}"),
+    ("authors", rf"who (?:wrote|authored|published|are the authors of|were the authors of|is the author of) {_IT}"
+                rf"|who (?:are|were) (?:the|its) authors{_PAPER}"
+                rf"|(?:what are |list |name )?(?:the |all )?(?:names of the )?authors?(?: names)?{_PAPER}"
+                rf"|(?:the )?authors? list{_PAPER}"),
+    ("title", rf"(?:what(?: is|'s)|whats) (?:the|its) (?:title|name){_PAPER}"
+              rf"|what is {_IT} (?:called|titled)"
+              rf"|(?:the )?(?:paper |article )?title{_PAPER}"),
+    ("doi", rf"(?:what(?: is|'s)|whats) (?:the|its) doi(?: number| link)?{_PAPER}"
+            rf"|(?:the )?doi(?: number| link)?{_PAPER}"
+            rf"|(?:does|do) {_IT} have a doi"),
+    ("abstract", rf"(?:what(?: is|'s)|whats) (?:the|its) abstract{_PAPER}"
+                 rf"|(?:show|print|display|read)(?: me)? (?:the|its) abstract{_PAPER}"
+                 rf"|(?:the )?abstract{_PAPER}"),
+    ("arxiv_id", rf"(?:what(?: is|'s)|whats) (?:the|its) arxiv (?:id|number|identifier){_PAPER}"
+                 rf"|(?:the )?arxiv (?:id|number|identifier){_PAPER}"),
+    ("subjects", rf"(?:what|which) (?:are the |is the )?(?:arxiv )?(?:subjects?|categor(?:y|ies)){_PAPER}"
+                 rf"|(?:what|which) (?:arxiv )?(?:subjects?|categor(?:y|ies)) (?:is|does) {_IT} (?:in|belong to|fall under|listed under)"
+                 rf"|(?:the )?(?:arxiv )?(?:subjects|categories){_PAPER}"),
+    ("keywords", rf"(?:what are )?(?:the |its )?(?:index )?keywords{_PAPER}"),
+    ("journal", rf"(?:where|in which journal|which journal|what journal|which venue|what venue) (?:was|is) {_IT} published"
+                rf"|(?:the )?journal(?: reference| ref)?{_PAPER}"),
+]
+_COMPILED = [(intent, re.compile(pattern)) for intent, pattern in INTENT_PATTERNS]
+
+# Paper.extra keys holding the site-specific fields
+EXTRA_FIELDS = {
+    "arxiv_id": ("arXiv ID",),
+    "subjects": ("Subjects",),
+    "keywords": ("Keywords",),
+    "journal": ("Journal reference",),
+}
+
+FIELD_NAMES = {
+    "first_author": "first author",
+    "authors": "authors",
+    "title": "title",
+    "doi": "DOI",
+    "abstract": "abstract",
+    "arxiv_id": "arXiv ID",
+    "subjects": "subjects",
+    "keywords": "keywords",
+    "journal": "journal reference",
+}
+
+_stats_lock = threading.Lock()
+_stats = {"answered": 0, "missing_field": 0, "by_intent": {}}
+
+
+def classify(query):
+    """The metadata intent of a question, or None if it is about anything else"""
+    text = " ".join(query.lower().split()).rstrip("?.! ")
+    text = _PREFIX.sub("", text)
+    if not text or len(text.split()) > METADATA_MAX_WORDS:
+        return None
+    for intent, pattern in _COMPILED:
+        if pattern.fullmatch(text):
+            return intent
+    return None
+
+
+def field_value(paper, intent):
+    """The text answering an intent for one Paper, or None if the field is empty"""
+    if intent == "first_author":
+        return paper.authors[0] if paper.authors else None
+    if intent == "authors":
+        if not paper.authors:
+            return None
+        if len(paper.authors) == 1:
+            return paper.authors[0]
+        return ", ".join(paper.authors[:-1]) + f" and {paper.authors[-1]}"
+    if intent in EXTRA_FIELDS:
+        for key in EXTRA_FIELDS[intent]:
+            if paper.extra.get(key):
+                return paper.extra[key]
+        return None
+    return getattr(paper, intent) or None
+
+
+def _sentence(intent, value):
+    if intent == "authors":
+        return f"The paper was written by {value}."
+    if intent == "title":
+        return f'The paper is titled "{value}".'
+    if intent == "abstract":
+        return f"Abstract: {value}"
+    verb = "are" if intent in ("subjects", "keywords") else "is"
+    return f"The {FIELD_NAMES[intent]} {verb} {value}."
+
+
+def answer(query, papers):
+    """
+    Answer a metadata question from a session's papers.
+    papers is a list of (label, Paper). Returns the answer text, or None when
+    the question is not a metadata lookup or none of the papers has the field.
+    """
+    if not METADATA_ROUTER or not papers:
+        return None
+    intent = classify(query)
+    if intent is None:
+        return None
+
+    started = time.time()
+    values = [(label, field_value(paper, intent)) for label, paper in papers]
+    if not any(value for _, value in values):
+        with _stats_lock:
+            _stats["missing_field"] += 1
+        logger.info(f"Metadata question ({intent}) but no paper has that field, using the full pipeline")
+        return None
+
+    if len(values) == 1:
+        text = _sentence(intent, values[0][1])
+    else:
+        lines = [f"- {label}: {value or 'not available'}" for label, value in values]
+        text = f"The {FIELD_NAMES[intent]} of each paper:\n" + "\n".join(lines)
+
+    with _stats_lock:
+        _stats["answered"] += 1
+        _stats["by_intent"][intent] = _stats["by_intent"].get(intent, 0) + 1
+    logger.info(f"Answered {intent} question from paper metadata in {1000 * (time.time() - started):.2f}ms")
+    return text
+
+
+def stats():
+    """How many questions the router answered, by intent"""
+    with _stats_lock:
+        return {
+            "enabled": METADATA_ROUTER,
+            "answered": _stats["answered"],
+            "missing_field": _stats["missing_field"],
+            "by_intent": dict(_stats["by_intent"]),
+        }
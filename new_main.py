@@ -1,5 +1,6 @@
 from flask import Flask, render_template, jsonify, request, redirect, url_for, send_from_directory
 from store_index import store_data
+from scrapers.paper import ScrapeError
 from finalEmbed import embed_response, collected_data, init_pinecone, delete_embeddings
 import os
 import logging
@@ -113,12 +114,9 @@ def cleanup_old_sessions():
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
-# Initialize Pinecone on startup
-PINECONE_INITIALIZED = init_pinecone()
-if PINECONE_INITIALIZED:
-    logger.info("Successfully initialized Pinecone connection on startup")
-else:
-    logger.warning("Failed to initialize Pinecone connection on startup")
+# Pinecone is checked on the first request rather than at import, so workers
+# boot without network calls; provisioning is done with `python fix_index.py provision`
+PINECONE_INITIALIZED = False
 
 # Direct routes to static files
 @app.route('/static/<path:filename>')
@@ -205,7 +203,11 @@ def process_url():
                 logger.error(f"Error deleting Pinecone data: {str(e)}")
         
         # Store URL data for this session
-        scraped_data = store_data(url)
+        try:
+            scraped_data = store_data(url).to_text()
+        except ScrapeError as e:
+            logger.warning(f"Could not extract content from {url}: {str(e)}")
+            return jsonify({"status": "error", "message": str(e)}), 422
         
         session_data[session_id] = {
             'url': url,
@@ -508,12 +510,12 @@ def chat():
                 return result
 
             # Otherwise fetch data
-            data = store_data(userUrl)
-            logger.info(f"Scraped data length: {len(data) if data else 0}")
-            
-            if not data:
-                logger.warning(f"No data returned from scraper for URL: {userUrl}")
+            try:
+                data = store_data(userUrl).to_text()
+            except ScrapeError as e:
+                logger.warning(f"No data returned from scraper for URL: {userUrl}: {str(e)}")
                 return "I couldn't extract content from this URL. Please check if it's a valid research paper or try a different URL."
+            logger.info(f"Scraped data length: {len(data)}")
             
             # Store in session data if we have a session ID
             if session_id:
@@ -0,0 +1,232 @@
+"""
+ONNX Runtime embedding backend with dynamic int8 quantization.
+
+The configured sentence-transformers model is exported to ONNX once, the
+weights are quantized to int8 and the result is cached under ONNX_MODEL_DIR.
+Pooling and normalization still come from the model's own sentence-transformers
+config, so vectors stay comparable with the PyTorch backend.
+
+    python onnx_embeddings.py build      # export and quantize ahead of deploys
+    python onnx_embeddings.py compare    # parity, startup, memory and latency
+"""
+import os
+import re
+import sys
+import json
+import time
+import argparse
+import logging
+import tempfile
+import subprocess
+import xml.etree.ElementTree as ET
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Backend configuration (can be overridden from the environment)
+ONNX_MODEL_ROOT = os.getenv("ONNX_MODEL_DIR", os.path.join("models", "onnx"))
+# Instruction set the quantized kernels are tuned for: arm64, avx2, avx512 or avx512_vnni
+ONNX_QUANTIZATION = os.getenv("ONNX_QUANTIZATION", "avx2")
+# Lowest mean cosine similarity to the fp32 model that counts as parity
+ONNX_PARITY_MIN_COSINE = float(os.getenv("ONNX_PARITY_MIN_COSINE", "0.99"))
+
+BACKENDS = ("torch", "onnx", "onnx-int8")
+SAMPLE_FIXTURE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "scrapers", "fixtures", "arxiv")
+
+
+def model_dir(model_name, root=ONNX_MODEL_ROOT):
+    """Local directory holding the exported copy of a model"""
+    return os.path.join(root, re.sub(r'[^A-Za-z0-9_.-]+', '--', model_name))
+
+
+def quantized_file_name(quantization=ONNX_QUANTIZATION):
+    # Name used by sentence-transformers' export_dynamic_quantized_onnx_model
+    return f"model_qint8_{quantization}.onnx"
+
+
+def build_onnx_model(model_name, quantization=ONNX_QUANTIZATION, root=ONNX_MODEL_ROOT):
+    """Export a model to ONNX and quantize it, reusing a previous export.
+
+    Workers that start together serialize on a lock file so the export runs
+    once. Returns the local model directory.
+    """
+    output_dir = model_dir(model_name, root)
+    quantized_path = os.path.join(output_dir, "onnx", quantized_file_name(quantization))
+    if os.path.exists(quantized_path):
+        return output_dir
+
+    os.makedirs(output_dir, exist_ok=True)
+    import fcntl
+
+    with open(os.path.join(output_dir, ".build.lock"), "w") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            if os.path.exists(quantized_path):
+                return output_dir
+            from sentence_transformers import SentenceTransformer, export_dynamic_quantized_onnx_model
+
+            started = time.time()
+            logger.info(f"Exporting {model_name} to ONNX in {output_dir}")
+            # backend="onnx" exports the fp32 graph when the model has none
+            model = SentenceTransformer(model_name, device="cpu", backend="onnx")
+            model.save_pretrained(output_dir)
+            export_dynamic_quantized_onnx_model(model, quantization, output_dir)
+            logger.info(f"Built int8 ONNX model ({quantization}) in {time.time() - started:.1f}s")
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+    return output_dir
+
+
+def load_backend(model_name, backend):
+    """HuggingFaceEmbeddings for the given backend ('torch', 'onnx' or 'onnx-int8')"""
+    from langchain_huggingface import HuggingFaceEmbeddings
+
+    if backend == "torch":
+        return HuggingFaceEmbeddings(model_name=model_name, model_kwargs={'device': 'cpu'})
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown embedding backend: {backend}")
+
+    try:
+        import optimum.onnxruntime  # noqa: F401
+    except ImportError:
+        logger.warning("onnxruntime is not installed (pip install 'optimum[onnxruntime]'), using the torch backend")
+        return load_backend(model_name, "torch")
+
+    local_dir = build_onnx_model(model_name)
+    file_name = quantized_file_name() if backend == "onnx-int8" else "model.onnx"
+    return HuggingFaceEmbeddings(
+        model_name=local_dir,
+        model_kwargs={
+            'device': 'cpu',
+            'backend': 'onnx',
+            'model_kwargs': {'file_name': f"onnx/{file_name}", 'provider': 'CPUExecutionProvider'}
+        }
+    )
+
+
+# Benchmark and parity check
+
+
+def sample_chunks(count, text_file=None):
+    """Document-sized chunks, split the way index_document splits papers"""
+    if text_file:
+        with open(text_file, encoding="utf-8") as handle:
+            text = handle.read()
+    else:
+        # Abstracts from the bundled arXiv fixtures
+        texts = []
+        for name in sorted(os.listdir(SAMPLE_FIXTURE)):
+            root = ET.parse(os.path.join(SAMPLE_FIXTURE, name)).getroot()
+            texts.extend(" ".join(node.text.split()) for node in root.iter("{http://www.w3.org/2005/Atom}summary"))
+        text = "\n\n".join(texts)
+
+    from langchain.text_splitter import RecursiveCharacterTextSplitter
+    chunks = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=300).split_text(text)
+    if not chunks:
+        raise ValueError("No sample text to embed")
+    # Cycle through short samples so latency is measured over enough chunks
+    return [chunks[i % len(chunks)] for i in range(count)]
+
+
+def _rss_mb():
+    with open("/proc/self/status") as status:
+        for line in status:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def run_backend(model_name, backend, chunks, vectors_path, batch_size=32):
+    """Measure one backend in this process and save its vectors for the parity check"""
+    import numpy as np
+
+    baseline = _rss_mb()
+    started = time.time()
+    embeddings = load_backend(model_name, backend)
+    embeddings.embed_documents(chunks[:1])  # First call initializes the session or graph
+    startup = time.time() - started
+
+    started = time.time()
+    vectors = []
+    for start in range(0, len(chunks), batch_size):
+        vectors.extend(embeddings.embed_documents(chunks[start:start + batch_size]))
+    elapsed = time.time() - started
+
+    np.save(vectors_path, np.asarray(vectors, dtype=np.float32))
+    return {
+        "backend": backend,
+        "startup_seconds": round(startup, 2),
+        "memory_mb": round(_rss_mb() - baseline, 1),
+        "ms_per_chunk": round(1000 * elapsed / len(chunks), 2),
+    }
+
+
+def cosine_agreement(reference, candidate):
+    """Per-row cosine similarity between two embedding matrices"""
+    import numpy as np
+
+    reference = reference / np.linalg.norm(reference, axis=1, keepdims=True)
+    candidate = candidate / np.linalg.norm(candidate, axis=1, keepdims=True)
+    return np.sum(reference * candidate, axis=1)
+
+
+def compare(model_name, backends, count, text_file=None):
+    import numpy as np
+
+    workdir = tempfile.mkdtemp()
+    results = []
+    for backend in backends:
+        vectors_path = os.path.join(workdir, f"{backend}.npy")
+        # A fresh interpreter per backend so startup and memory are not shared
+        output = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "run", "--model", model_name, "--backend", backend,
+             "--chunks", str(count), "--vectors", vectors_path] + (["--text-file", text_file] if text_file else []),
+            check=True, capture_output=True, text=True
+        ).stdout
+        results.append(json.loads(output.strip().splitlines()[-1]))
+
+    reference = np.load(os.path.join(workdir, f"{backends[0]}.npy"))
+    for result in results:
+        cosines = cosine_agreement(reference, np.load(os.path.join(workdir, f"{result['backend']}.npy")))
+        result["mean_cosine"] = round(float(cosines.mean()), 5)
+        result["min_cosine"] = round(float(cosines.min()), 5)
+        result["parity"] = bool(cosines.mean() >= ONNX_PARITY_MIN_COSINE)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build and evaluate the ONNX embedding backend")
+    parser.add_argument("command", choices=("build", "compare", "run"))
+    parser.add_argument("--model", default=None, help="Model to use (defaults to finalEmbed.EMBEDDING_MODEL)")
+    parser.add_argument("--backend", choices=BACKENDS, default="torch", help=argparse.SUPPRESS)
+    parser.add_argument("--backends", nargs="+", choices=BACKENDS, default=list(BACKENDS),
+                        help="Backends to compare; the first is the parity reference")
+    parser.add_argument("--chunks", type=int, default=256, help="Number of chunks to embed")
+    parser.add_argument("--text-file", help="Plain text document to chunk instead of the bundled abstracts")
+    parser.add_argument("--vectors", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    model_name = args.model
+    if model_name is None:
+        from finalEmbed import EMBEDDING_MODEL
+        model_name = EMBEDDING_MODEL
+
+    if args.command == "build":
+        print(build_onnx_model(model_name))
+        return
+    if args.command == "run":
+        chunks = sample_chunks(args.chunks, args.text_file)
+        print(json.dumps(run_backend(model_name, args.backend, chunks, args.vectors)))
+        return
+
+    results = compare(model_name, args.backends, args.chunks, args.text_file)
+    print(f"{'backend':<12}{'startup s':>11}{'memory MB':>11}{'ms/chunk':>10}{'mean cos':>10}{'min cos':>10}  parity")
+    for result in results:
+        print(f"{result['backend']:<12}{result['startup_seconds']:>11}{result['memory_mb']:>11}"
+              f"{result['ms_per_chunk']:>10}{result['mean_cosine']:>10}{result['min_cosine']:>10}  "
+              f"{'yes' if result['parity'] else 'NO'}")
+
+
+if __name__ == "__main__":
+    main()
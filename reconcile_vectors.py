@@ -0,0 +1,156 @@
+"""
+Deletes vectors that no live session owns anymore.
+
+    python reconcile_vectors.py --dry-run   # report what would be deleted
+    python reconcile_vectors.py             # delete it
+
+Sessions live in worker memory, so when a worker restarts or crashes the
+reaper never deletes their vectors. This job pages through every live index
+(see index_schema.py), reads each vector's metadata and compares it with the
+shared session registry (session_registry.py). A vector is an orphan when its
+session is not registered, when the session has not been seen by any worker
+for longer than SESSION_MAX_IDLE_SECONDS plus the grace period, or when its
+session is alive but no longer holds that document. Vectors written less than
+the grace period ago are left alone, their session may not be registered yet,
+and so are vectors without a session (shared URL-level chunks). Orphans are
+deleted by id in batches; the report is printed and kept in the registry for
+/metrics. Run it from cron on one machine.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import logging
+from finalEmbed import live_index_names, ChunkIndex
+from session_registry import SessionRegistry
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Reconciliation settings (can be overridden from the environment)
+RECONCILE_PAGE_SIZE = int(os.getenv("RECONCILE_PAGE_SIZE", "100"))
+RECONCILE_DELETE_BATCH = int(os.getenv("RECONCILE_DELETE_BATCH", "1000"))
+# Must exceed the reaper heartbeat interval and the longest ingest
+RECONCILE_GRACE_SECONDS = float(os.getenv("RECONCILE_GRACE_SECONDS", "3600"))
+# Same setting as the web app's session expiry
+SESSION_MAX_IDLE_SECONDS = int(os.getenv("SESSION_MAX_IDLE_SECONDS", str(2 * 60 * 60)))
+
+# Verdicts on one vector
+LIVE, RECENT, UNSCOPED = "live", "recent", "unscoped"
+UNKNOWN_SESSION, EXPIRED_SESSION, REMOVED_DOCUMENT = "unknown_session", "expired_session", "removed_document"
+ORPHAN_VERDICTS = (UNKNOWN_SESSION, EXPIRED_SESSION, REMOVED_DOCUMENT)
+
+
+def verdict(metadata, sessions, documents, stale_before, recent_after):
+    """Whether a vector with this metadata belongs to a live session"""
+    session_id = metadata.get("session_id")
+    if not session_id:
+        return UNSCOPED
+    created = metadata.get("created")
+    if created is not None and float(created) > recent_after:
+        return RECENT
+    last_active = sessions.get(session_id)
+    if last_active is None:
+        return UNKNOWN_SESSION
+    if last_active < stale_before:
+        return EXPIRED_SESSION
+    sources = documents.get(session_id)
+    # Sessions without registered documents hold the chunks of a single URL or PDF
+    if sources and metadata.get("source") not in sources:
+        return REMOVED_DOCUMENT
+    return LIVE
+
+
+class Reconciler:
+    """One pass over the live indexes against a snapshot of the session registry"""
+
+    def __init__(self, registry, index_names=None, dry_run=False, page_size=RECONCILE_PAGE_SIZE,
+                 delete_batch=RECONCILE_DELETE_BATCH, grace_seconds=RECONCILE_GRACE_SECONDS,
+                 max_idle_seconds=SESSION_MAX_IDLE_SECONDS):
+        self.registry = registry
+        self.index_names = index_names or live_index_names()
+        self.dry_run = dry_run
+        self.page_size = max(1, page_size)
+        self.delete_batch = max(1, delete_batch)
+        self.grace_seconds = grace_seconds
+        self.max_idle_seconds = max_idle_seconds
+
+    def run(self):
+        started = time.time()
+        sessions = self.registry.sessions()
+        documents = self.registry.documents()
+        stale_before = started - self.max_idle_seconds - self.grace_seconds
+        recent_after = started - self.grace_seconds
+        report = {
+            "indexes": self.index_names,
+            "registered_sessions": len(sessions),
+            "scanned": 0,
+            "orphan_vectors": 0,
+            "reclaimed_vectors": 0,
+            "orphaned_sessions": 0,
+            "verdicts": {},
+        }
+        orphaned_sessions = set()
+        for index_name in self.index_names:
+            index = ChunkIndex(index_name)
+            pending = []
+            for page in index.pages(self.page_size):
+                for vector_id, metadata in index.fetch(page).items():
+                    kind = verdict(metadata, sessions, documents, stale_before, recent_after)
+                    report["verdicts"][kind] = report["verdicts"].get(kind, 0) + 1
+                    if kind in ORPHAN_VERDICTS:
+                        pending.append(vector_id)
+                        if kind != REMOVED_DOCUMENT:
+                            orphaned_sessions.add(metadata["session_id"])
+                report["scanned"] += len(page)
+                if len(pending) >= self.delete_batch:
+                    report["reclaimed_vectors"] += self._delete(index, pending)
+                    report["orphan_vectors"] += len(pending)
+                    pending = []
+            if pending:
+                report["reclaimed_vectors"] += self._delete(index, pending)
+                report["orphan_vectors"] += len(pending)
+            logger.info(f"Reconciled {index_name}: {report['scanned']} vectors scanned so far, "
+                        f"{report['orphan_vectors']} orphaned")
+
+        report["orphaned_sessions"] = len(orphaned_sessions)
+        if orphaned_sessions:
+            sample = ", ".join(sorted(orphaned_sessions)[:5])
+            logger.info(f"Orphaned sessions include: {sample}")
+        if not self.dry_run:
+            # Their vectors are gone from every live index now
+            report["stale_sessions_forgotten"] = self.registry.remove_stale(stale_before)
+        report["seconds"] = round(time.time() - started, 3)
+        self.registry.record_run(report, self.dry_run)
+        return report
+
+    def _delete(self, index, ids):
+        if self.dry_run:
+            return 0
+        for start in range(0, len(ids), self.delete_batch):
+            index.delete_ids(ids[start:start + self.delete_batch])
+        return len(ids)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Delete vectors whose session is gone")
+    parser.add_argument("--dry-run", action="store_true", help="only report what would be deleted")
+    parser.add_argument("--index", action="append", help="index to check (default: every live index)")
+    parser.add_argument("--page-size", type=int, default=RECONCILE_PAGE_SIZE)
+    parser.add_argument("--grace-seconds", type=float, default=RECONCILE_GRACE_SECONDS)
+    args = parser.parse_args()
+
+    try:
+        report = Reconciler(SessionRegistry(), index_names=args.index, dry_run=args.dry_run,
+                            page_size=args.page_size, grace_seconds=args.grace_seconds).run()
+    except Exception as e:
+        logger.error(f"Vector reconciliation failed: {str(e)}")
+        return 1
+    print(json.dumps(report, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,104 +1,297 @@
 import requests
-from bs4 import BeautifulSoup
+from scrapers.UniversalScraper import make_soup
+from scrapers.paper import Paper, ScrapeError, FetchError, ExtractionError
+import xml.etree.ElementTree as ET
+from collections import OrderedDict
+import urllib.parse
+import threading
 import logging
 import time
+import os
+import re
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-def extract_tags_data_with_sections(url: str, tags_info: dict) -> str:
+# arXiv export API settings (can be overridden from the environment)
+ARXIV_API_URL = os.getenv("ARXIV_API_URL", "https://export.arxiv.org/api/query")
+# Directory of recorded API responses (<arxiv id>.xml) to replay instead of calling the API
+ARXIV_API_FIXTURES = os.getenv("ARXIV_API_FIXTURES", "")
+# arXiv asks clients to wait about 3 seconds between API calls
+ARXIV_API_MIN_INTERVAL = float(os.getenv("ARXIV_API_MIN_INTERVAL", "3"))
+ARXIV_API_BATCH_SIZE = 100
+ARXIV_CACHE_SIZE = int(os.getenv("ARXIV_CACHE_SIZE", "1024"))
+ARXIV_CACHE_TTL_SECONDS = int(os.getenv("ARXIV_CACHE_TTL_SECONDS", str(6 * 60 * 60)))
+
+ATOM_NS = "{http://www.w3.org/2005/Atom}"
+ARXIV_NS = "{http://arxiv.org/schemas/atom}"
+
+# New-style ids (2412.04447) and old-style ids (hep-th/9901001), each with an optional version
+NEW_STYLE_ID = re.compile(r'(\d{4}\.\d{4,5})(v\d+)?')
+OLD_STYLE_ID = re.compile(r'([a-z\-]+(?:\.[A-Z]{2})?/\d{7})(v\d+)?')
+ARXIV_PATH = re.compile(r'/(?:abs|pdf|html|format|ps)/(.+?)(?:\.pdf)?/?$')
+ARXIV_DOI_PREFIX = "10.48550/arxiv."
+
+_metadata_cache = OrderedDict()  # arxiv id -> (expires_at, record)
+_cache_lock = threading.Lock()
+_api_lock = threading.Lock()
+_last_api_call = 0.0
+
+
+def normalize_arxiv_id(value):
+    """
+    Return the versionless arXiv id for a bare id, an 'arXiv:' reference, an
+    arXiv DOI or any arxiv.org abs/pdf/html URL. Returns None for anything else.
+    """
+    if not value:
+        return None
+    text = value.strip()
+    if text.lower().startswith("doi:"):
+        text = text[len("doi:"):].strip()
+    if text.lower().startswith(ARXIV_DOI_PREFIX):
+        # A bare DOI, 10.48550/arXiv.<id>
+        text = text[len(ARXIV_DOI_PREFIX):]
+    elif text.lower().startswith("arxiv:"):
+        text = text[len("arxiv:"):]
+    elif "://" in text or "arxiv.org/" in text.lower() or "doi.org/" in text.lower():
+        parsed = urllib.parse.urlparse(text if "://" in text else "https://" + text)
+        host = parsed.netloc.lower()
+        path = urllib.parse.unquote(parsed.path)
+        if host.endswith("doi.org") and path.lower().startswith("/" + ARXIV_DOI_PREFIX):
+            text = path[len(ARXIV_DOI_PREFIX) + 1:]
+        elif host == "arxiv.org" or host.endswith(".arxiv.org"):
+            match = ARXIV_PATH.match(path)
+            if not match:
+                return None
+            text = match.group(1)
+        else:
+            return None
+    for pattern in (NEW_STYLE_ID, OLD_STYLE_ID):
+        match = pattern.fullmatch(text)
+        if match:
+            return match.group(1)
+    return None
+
+
+def arxiv_cache_key(arxiv_id):
+    """Cache key shared by every URL variant of a paper"""
+    return f"arxiv:{arxiv_id}"
+
+
+def canonical_arxiv_url(arxiv_id):
+    return f"https://arxiv.org/abs/{arxiv_id}"
+
+
+def _parse_entry(entry):
+    """Turn one Atom <entry> into a metadata record, or None for API error entries"""
+    entry_id = entry.findtext(f"{ATOM_NS}id", "").strip()
+    match = re.search(r'arxiv\.org/abs/(.+?)(v\d+)?$', entry_id)
+    if not match:
+        # The API reports unknown ids as an entry titled "Error"
+        return None
+    arxiv_id, version = match.group(1), match.group(2)
+
+    pdf_url = ""
+    for link in entry.findall(f"{ATOM_NS}link"):
+        if link.get("title") == "pdf":
+            pdf_url = link.get("href", "")
+
+    primary = entry.find(f"{ARXIV_NS}primary_category")
+    return {
+        "id": arxiv_id,
+        "version": version or "",
+        "title": " ".join(entry.findtext(f"{ATOM_NS}title", "").split()),
+        "authors": [" ".join(author.findtext(f"{ATOM_NS}name", "").split())
+                    for author in entry.findall(f"{ATOM_NS}author")],
+        "abstract": " ".join(entry.findtext(f"{ATOM_NS}summary", "").split()),
+        "subjects": [category.get("term") for category in entry.findall(f"{ATOM_NS}category") if category.get("term")],
+        "primary_subject": primary.get("term", "") if primary is not None else "",
+        "doi": entry.findtext(f"{ARXIV_NS}doi", "").strip(),
+        "arxiv_doi": f"10.48550/arXiv.{arxiv_id}",
+        "journal_ref": " ".join(entry.findtext(f"{ARXIV_NS}journal_ref", "").split()),
+        "published": entry.findtext(f"{ATOM_NS}published", "").strip(),
+        "updated": entry.findtext(f"{ATOM_NS}updated", "").strip(),
+        "pdf_url": pdf_url,
+        "url": canonical_arxiv_url(arxiv_id),
+    }
+
+
+def _fetch_entries(arxiv_ids):
+    """Fetch Atom entries for a batch of ids from fixtures or the export API"""
+    global _last_api_call
+    if ARXIV_API_FIXTURES:
+        entries = []
+        for arxiv_id in arxiv_ids:
+            path = os.path.join(ARXIV_API_FIXTURES, arxiv_id.replace("/", "_") + ".xml")
+            if os.path.exists(path):
+                entries.extend(ET.parse(path).getroot().findall(f"{ATOM_NS}entry"))
+        return entries
+
+    with _api_lock:
+        wait = ARXIV_API_MIN_INTERVAL - (time.time() - _last_api_call)
+        if wait > 0:
+            time.sleep(wait)
+        try:
+            response = requests.get(
+                ARXIV_API_URL,
+                params={"id_list": ",".join(arxiv_ids), "max_results": len(arxiv_ids)},
+                timeout=20
+            )
+        finally:
+            _last_api_call = time.time()
+    if response.status_code != 200:
+        raise Exception(f"arXiv API returned status code {response.status_code}")
+    return ET.fromstring(response.content).findall(f"{ATOM_NS}entry")
+
+
+def fetch_arxiv_metadata(arxiv_ids):
+    """
+    Look up metadata for many arXiv ids, serving repeats from an in-process
+    cache and fetching the rest in batched export API calls.
+    Returns {arxiv_id: record} for the ids that were found.
+    """
+    wanted = [arxiv_id for arxiv_id in dict.fromkeys(arxiv_ids) if arxiv_id]
+    found = {}
+    missing = []
+    now = time.time()
+    with _cache_lock:
+        for arxiv_id in wanted:
+            cached = _metadata_cache.get(arxiv_id)
+            if cached and cached[0] > now:
+                _metadata_cache.move_to_end(arxiv_id)
+                found[arxiv_id] = cached[1]
+            else:
+                missing.append(arxiv_id)
+
+    for start in range(0, len(missing), ARXIV_API_BATCH_SIZE):
+        batch = missing[start:start + ARXIV_API_BATCH_SIZE]
+        logger.info(f"Fetching arXiv metadata for {len(batch)} ids")
+        for entry in _fetch_entries(batch):
+            record = _parse_entry(entry)
+            if record and record["id"] in batch:
+                found[record["id"]] = record
+                with _cache_lock:
+                    _metadata_cache[record["id"]] = (time.time() + ARXIV_CACHE_TTL_SECONDS, record)
+                    _metadata_cache.move_to_end(record["id"])
+                    while len(_metadata_cache) > ARXIV_CACHE_SIZE:
+                        _metadata_cache.popitem(last=False)
+    return found
+
+
+def arxiv_paper(record):
+    """Paper built from an export API metadata record"""
+    extra = {}
+    if record["subjects"]:
+        extra["Subjects"] = "; ".join(record["subjects"])
+    extra["arXiv ID"] = f"{record['id']}{record['version']}"
+    if record["journal_ref"]:
+        extra["Journal reference"] = record["journal_ref"]
+    return Paper(
+        title=record["title"],
+        authors=list(record["authors"]),
+        abstract=record["abstract"],
+        doi=record["doi"] or record["arxiv_doi"],
+        source=record["url"],
+        extra=extra
+    )
+
+
+def arxiv_fast_path(url):
+    """Resolve an arXiv URL or id straight through the export API; None if unavailable"""
+    arxiv_id = normalize_arxiv_id(url)
+    if not arxiv_id:
+        return None
+    try:
+        record = fetch_arxiv_metadata([arxiv_id]).get(arxiv_id)
+    except Exception as e:
+        logger.warning(f"arXiv API lookup failed for {arxiv_id}: {str(e)}")
+        return None
+    if not record or not record["abstract"]:
+        return None
+    logger.info(f"Resolved {url} through the arXiv API as {arxiv_cache_key(arxiv_id)}")
+    return arxiv_paper(record)
+
+def extract_tags_data_with_sections(url: str, tags_info: dict) -> Paper:
+    """
+    Scrape a paper page into a Paper. tags_info maps element ids ("id") and
+    class names ("class") to the Paper field their text fills; names that are
+    not Paper fields are kept in Paper.extra.
+    """
     logger.info(f"Extracting data from Arxiv URL: {url}")
     
-    try:
-        # Set a user agent to mimic a browser
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-        }
-        
-        # Make the request
-        response = requests.get(url, headers=headers, timeout=15)
-        
-        # Check if the request was successful
-        if response.status_code != 200:
-            logger.error(f"Failed to load URL: {url}, Status code: {response.status_code}")
-            return f"Failed to load URL: {url}, Status code: {response.status_code}"
-        
-        # Parse HTML content
-        soup = BeautifulSoup(response.text, 'html.parser')
-        logger.info("Successfully loaded and parsed the page")
-        
-        # String to store extracted information
-        extracted_data = ""
-        
-        # Extract page title
-        title = soup.title.text if soup.title else "No title found"
-        extracted_data += f"Title: {title}\n\n"
-        
-        # Extract elements by IDs
-        for element_id in tags_info.get("id", []):
-            element = soup.find(id=element_id)
-            if element:
-                extracted_data += f"ID '{element_id}': {element.get_text(strip=True)}\n"
-                logger.info(f"Successfully extracted ID '{element_id}'")
-            else:
-                logger.warning(f"Failed to find element with ID '{element_id}'")
-                extracted_data += f"ID '{element_id}': Not found\n"
-        
-        # Extract elements by Classes
-        for class_name in tags_info.get("class", []):
-            elements = soup.find_all(class_=class_name)
-            if elements:
-                class_data = " ".join([el.get_text(strip=True) for el in elements])
-                extracted_data += f"Class '{class_name}': {class_data}\n"
-                logger.info(f"Successfully extracted Class '{class_name}'")
-            else:
-                logger.warning(f"Failed to find elements with Class '{class_name}'")
-                extracted_data += f"Class '{class_name}': Not found\n"
-        
-        # Extract sections
-        sections = soup.find_all('section')
-        section_data = ""
-        
-        for section in sections:
-            section_id = section.get('id', '')
-            if section_id and section_id.startswith("sec"):
-                section_data += f"Section ID '{section_id}': {section.get_text(strip=True)}\n"
-        
-        if section_data:
-            extracted_data += section_data
-            logger.info(f"Successfully extracted {len(sections)} sections")
-        
-        # Extract abstract specifically for arXiv
-        abstract = soup.find(class_="abstract")
-        if abstract:
-            extracted_data += f"Abstract: {abstract.get_text(strip=True)}\n"
-            logger.info("Successfully extracted abstract")
-        
-        # Extract authors
-        authors = soup.find(class_="authors")
-        if authors:
-            extracted_data += f"Authors: {authors.get_text(strip=True)}\n"
-            logger.info("Successfully extracted authors")
-        
-        if not extracted_data.strip():
-            # Fallback extraction if nothing found with the specified classes/IDs
-            logger.warning("No data extracted with specified selectors. Using fallback extraction.")
-            body_text = soup.body.get_text(strip=True) if soup.body else "No body content found"
-            extracted_data = f"Title: {title}\n\nContent: {body_text[:5000]}"
-        
-        logger.info(f"Extraction completed. Extracted {len(extracted_data)} characters")
-        return extracted_data.strip()
+    # Set a user agent to mimic a browser
+    headers = {
+        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+    }
     
-    except Exception as e:
-        logger.error(f"Error during extraction: {str(e)}")
-        return f"Error extracting data: {str(e)}"
+    # Make the request
+    response = requests.get(url, headers=headers, timeout=15)
+    
+    # Check if the request was successful
+    if response.status_code != 200:
+        logger.error(f"Failed to load URL: {url}, Status code: {response.status_code}")
+        raise FetchError(f"Failed to load URL: {url}, Status code: {response.status_code}", url, response.status_code)
+    
+    # Parse HTML content
+    soup = make_soup(response.text)
+    logger.info("Successfully loaded and parsed the page")
+    
+    paper = Paper(source=url)
+    
+    # Extract elements by IDs
+    for element_id, field in tags_info.get("id", {}).items():
+        element = soup.find(id=element_id)
+        if element:
+            paper.assign(field, element.get_text(" ", strip=True))
+            logger.info(f"Successfully extracted ID '{element_id}'")
+        else:
+            logger.warning(f"Failed to find element with ID '{element_id}'")
+    
+    # Extract elements by Classes
+    for class_name, field in tags_info.get("class", {}).items():
+        elements = soup.find_all(class_=class_name)
+        if elements:
+            paper.assign(field, " ".join([el.get_text(" ", strip=True) for el in elements]))
+            logger.info(f"Successfully extracted Class '{class_name}'")
+        else:
+            logger.warning(f"Failed to find elements with Class '{class_name}'")
+    
+    # Page title when the selectors found none
+    if not paper.title and soup.title:
+        paper.assign("title", soup.title.text)
+    
+    # Extract sections
+    sections = soup.find_all('section')
+    for section in sections:
+        section_id = section.get('id', '')
+        if section_id and section_id.startswith("sec"):
+            paper.add_segments(section_id, [section.get_text(strip=True)])
+    
+    if paper.sections:
+        logger.info(f"Successfully extracted {len(paper.sections)} sections")
+    
+    if not paper.has_content():
+        # Fallback extraction if nothing found with the specified classes/IDs
+        logger.warning("No data extracted with specified selectors. Using fallback extraction.")
+        if soup.body:
+            paper.add_segments("Content", soup.body.stripped_strings, separator=" ")
+    
+    logger.info(f"Extraction completed. Extracted {len(paper.sections)} sections for {paper.title!r}")
+    return paper
 
 def arxiv_scrap(url):
     logger.info(f"Starting Arxiv scraping for URL: {url}")
     tags_info = {
-        "id": [],
-        "class": ["subheader", "title", "authors", "arxivdoi", "abstract", "subjects"]
+        "id": {},
+        "class": {
+            "subheader": "Subheader",
+            "title": "title",
+            "authors": "authors",
+            "arxivdoi": "doi",
+            "abstract": "abstract",
+            "subjects": "Subjects"
+        }
     }
     
     try:
@@ -108,26 +301,35 @@ def arxiv_scrap(url):
         
         for attempt in range(attempts):
             try:
-                data = extract_tags_data_with_sections(url, tags_info)
-                if data and len(data) >= 50:
-                    logger.info(f"Successfully scraped Arxiv URL. Data length: {len(data)}")
-                    return data
+                paper = extract_tags_data_with_sections(url, tags_info)
+                if paper.has_content():
+                    logger.info(f"Successfully scraped Arxiv URL: {paper!r}")
+                    return paper
                 else:
                     logger.warning(f"Attempt {attempt+1}: Extracted data too short or empty")
                     if attempt < attempts - 1:
                         time.sleep(delay)
                         delay *= 2  # Exponential backoff
+            except FetchError as e:
+                logger.error(f"Attempt {attempt+1} failed: {str(e)}")
+                if not e.retryable:
+                    raise
+                if attempt < attempts - 1:
+                    time.sleep(delay)
+                    delay *= 2
             except Exception as e:
                 logger.error(f"Attempt {attempt+1} failed: {str(e)}")
                 if attempt < attempts - 1:
                     time.sleep(delay)
                     delay *= 2
         
-        return f"Failed to extract meaningful content from {url} after {attempts} attempts"
+        raise ExtractionError(f"Failed to extract meaningful content from {url} after {attempts} attempts", url)
     
+    except ScrapeError:
+        raise
     except Exception as e:
         logger.error(f"Error in arxiv_scrap: {str(e)}")
-        return f"Error scraping Arxiv URL: {str(e)}"
+        raise ExtractionError(f"Error scraping Arxiv URL: {str(e)}", url)
 
 # Example Usage
 # url = "https://arxiv.org/abs/2412.04454"  # Replace with the actual URL
@@ -1,14 +1,150 @@
 import requests
-from bs4 import BeautifulSoup
+from bs4 import BeautifulSoup, NavigableString, Tag
+from bs4.builder import builder_registry
+import os
 import re
 import logging
 import time
 import urllib.parse
+from scrapers.paper import Paper, FetchError, ExtractionError, split_authors, SEGMENT_MAX_CHARS
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# BeautifulSoup tree builder to use: "auto" picks the fastest one installed.
+# lxml is several times faster than the pure-Python 'html.parser'.
+HTML_PARSER = os.getenv("SCRAPER_HTML_PARSER", "auto")
+HTML_PARSER_PREFERENCE = ['lxml', 'html5lib', 'html.parser']
+
+_parser_backend = None
+
+def get_parser_backend():
+    """Resolve the configured HTML parser to a tree builder that is installed"""
+    global _parser_backend
+    if _parser_backend is None:
+        candidates = HTML_PARSER_PREFERENCE if HTML_PARSER == "auto" else [HTML_PARSER, 'html.parser']
+        for name in candidates:
+            if builder_registry.lookup(name) is not None:
+                _parser_backend = name
+                break
+        if HTML_PARSER not in ("auto", _parser_backend):
+            logger.warning(f"HTML parser '{HTML_PARSER}' is not available, using '{_parser_backend}'")
+        logger.info(f"Using '{_parser_backend}' to parse HTML")
+    return _parser_backend
+
+def make_soup(html):
+    """Parse HTML with the configured parser backend"""
+    return BeautifulSoup(html, get_parser_backend())
+
+# Tags whose text is compared against heading labels such as "Abstract"
+HEADING_TAGS = ('h1', 'h2', 'h3')
+ABSTRACT_LABEL = re.compile(r'Abstract[:\s]')
+# Tags that start a new paragraph of the main content; the text of other tags
+# runs on with their neighbours
+BLOCK_TAGS = frozenset(('address', 'article', 'aside', 'blockquote', 'dd', 'div', 'dl', 'dt', 'figcaption',
+                        'figure', 'footer', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'header', 'li', 'main', 'ol',
+                        'p', 'pre', 'section', 'table', 'tr', 'ul'))
+# Containers and sections with less text are navigation or boilerplate
+MIN_CONTENT_CHARS = 200
+
+
+class PageCandidates:
+    """Candidate nodes for every field of a page, collected in one DOM walk.
+
+    The candidate slots mirror the priority lists the extractors used to build
+    with separate soup.find() calls; each slot keeps the first node in
+    document order that matches its rule. Stripped node text is memoized so
+    a node's text is computed at most once.
+    """
+
+    def __init__(self, soup):
+        self._text = {}
+        self.title = None
+        # Slots in priority order: div#abstract, section#abstract, div.abstract,
+        # section.abstract, any *abstract* class, "Abstract" heading
+        self.abstract = [None] * 6
+        # Slots in priority order: div#authors, section#authors, div.authors,
+        # div.author-list, any *author* class, "Author(s)" heading
+        self.authors = [None] * 6
+        # Slots in priority order: div#content, div#main-content, div#body, article
+        self.content = [None] * 4
+        self.abstract_label = None
+        self.sections = []
+        self.paragraphs = []
+        self._collect(soup)
+
+    def text(self, node):
+        """Stripped text of a node, computed once per node"""
+        key = id(node)
+        text = self._text.get(key)
+        if text is None:
+            text = node.get_text(strip=True)
+            self._text[key] = text
+        return text
+
+    def _collect(self, soup):
+        abstract, authors, content = self.abstract, self.authors, self.content
+        for node in soup.descendants:
+            if not isinstance(node, Tag):
+                if (self.abstract_label is None and isinstance(node, NavigableString)
+                        and ABSTRACT_LABEL.search(node)):
+                    self.abstract_label = node
+                continue
+
+            name = node.name
+            if name == 'p':
+                self.paragraphs.append(node)
+            elif name == 'section':
+                self.sections.append(node)
+            elif name == 'title' and self.title is None:
+                self.title = node
+            elif name == 'article' and content[3] is None:
+                content[3] = node
+
+            node_id = node.get('id')
+            classes = node.get('class') or []
+            if isinstance(classes, str):
+                classes = classes.split()
+
+            if name == 'div':
+                if node_id == 'abstract' and abstract[0] is None:
+                    abstract[0] = node
+                elif node_id == 'authors' and authors[0] is None:
+                    authors[0] = node
+                elif node_id == 'content' and content[0] is None:
+                    content[0] = node
+                elif node_id == 'main-content' and content[1] is None:
+                    content[1] = node
+                elif node_id == 'body' and content[2] is None:
+                    content[2] = node
+                if 'abstract' in classes and abstract[2] is None:
+                    abstract[2] = node
+                if 'authors' in classes and authors[2] is None:
+                    authors[2] = node
+                if 'author-list' in classes and authors[3] is None:
+                    authors[3] = node
+            elif name == 'section':
+                if node_id == 'abstract' and abstract[1] is None:
+                    abstract[1] = node
+                elif node_id == 'authors' and authors[1] is None:
+                    authors[1] = node
+                if 'abstract' in classes and abstract[3] is None:
+                    abstract[3] = node
+            elif name in HEADING_TAGS and (abstract[5] is None or authors[5] is None):
+                label = self.text(node).lower()
+                if label == 'abstract' and abstract[5] is None:
+                    abstract[5] = node
+                elif label in ('authors', 'author') and authors[5] is None:
+                    authors[5] = node
+
+            if classes and (abstract[4] is None or authors[4] is None):
+                lowered = [c.lower() for c in classes]
+                if abstract[4] is None and any('abstract' in c for c in lowered):
+                    abstract[4] = node
+                if authors[4] is None and any('author' in c for c in lowered):
+                    authors[4] = node
+
 def universal_scraper(url):
     """
     A universal scraper that can extract content from any research paper website
@@ -22,37 +158,35 @@ def universal_scraper(url):
     
     for attempt in range(attempts):
         try:
-            result = extract_with_requests(url)
-            if is_valid_content(result):
+            paper = extract_with_requests(url)
+            if paper.is_substantial():
                 logger.info(f"Successfully extracted content, attempt {attempt+1}")
-                return result
+                return paper
             else:
                 logger.warning(f"Attempt {attempt+1}: Extracted content not valid")
                 if attempt < attempts - 1:
                     time.sleep(delay)
                     delay *= 2  # Exponential backoff
+        except FetchError as e:
+            logger.error(f"Extraction attempt {attempt+1} failed: {str(e)}")
+            if not e.retryable:
+                raise
+            if attempt < attempts - 1:
+                time.sleep(delay)
+                delay *= 2
         except Exception as e:
             logger.error(f"Extraction attempt {attempt+1} failed: {str(e)}")
             if attempt < attempts - 1:
                 time.sleep(delay)
                 delay *= 2
     
-    # If all extraction attempts fail, try to extract minimal info from URL
-    try:
-        paper_id = extract_paper_id_from_url(url)
-        domain = extract_domain(url)
-        if paper_id:
-            return f"Title: Research Paper from {domain}\nPaper ID: {paper_id}\nAbstract: Could not extract content from URL. Using minimal information derived from URL."
-    except Exception as e:
-        logger.error(f"Error extracting paper ID: {str(e)}")
-    
-    # If all methods fail, return an error message
+    # Nothing usable was extracted; a placeholder would only get embedded as if it were the paper
     logger.error(f"All extraction methods failed for URL: {url}")
-    return f"Failed to extract content from {url}. Please check if the URL is valid and accessible."
+    raise ExtractionError(f"Failed to extract content from {url}. Please check if the URL is valid and accessible.", url)
 
 
 def extract_with_requests(url):
-    """Extract content using requests and BeautifulSoup"""
+    """Extract a Paper using requests and BeautifulSoup"""
     headers = {
         'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
     }
@@ -60,221 +194,183 @@ def extract_with_requests(url):
     response = requests.get(url, headers=headers, timeout=20)
     if response.status_code != 200:
         logger.warning(f"Request returned non-200 status code: {response.status_code}")
-        raise Exception(f"Failed to load URL: {url}, Status code: {response.status_code}")
+        raise FetchError(f"Failed to load URL: {url}, Status code: {response.status_code}", url, response.status_code)
     
-    soup = BeautifulSoup(response.text, 'html.parser')
+    soup = make_soup(response.text)
     logger.info("Successfully loaded and parsed page content")
     
-    # Extract title
-    title = soup.find('title').get_text(strip=True) if soup.find('title') else "Unknown Title"
-    
-    # Extract main content
-    content = {}
-    
-    # Try to find abstract
-    abstract = extract_abstract(soup)
+    # Collect every candidate node in a single pass over the DOM
+    page = PageCandidates(soup)
     
-    # Try to find authors
-    authors = extract_authors(soup)
+    paper = Paper(source=url)
+    paper.assign("title", page.text(page.title) if page.title else "Unknown Title")
+    paper.assign("authors", extract_authors(soup, page))
+    paper.assign("abstract", extract_abstract(soup, page))
     
-    # Try to find main content sections
-    main_content = extract_main_content(soup)
-    
-    # Combine all extracted content
-    content_text = f"Title: {title}\n\n"
-    
-    if authors:
-        content_text += f"Authors: {authors}\n\n"
-        
-    if abstract:
-        content_text += f"Abstract: {abstract}\n\n"
-    
-    if main_content:
-        content_text += f"Content: {main_content}\n\n"
-    else:
+    # Main content sections, in segments of bounded size
+    paper.add_segments("Content", extract_main_content(soup, page))
+    if not paper.sections:
         # Fallback to extracting paragraphs
-        paragraphs = [p.get_text(strip=True) for p in soup.find_all('p') if len(p.get_text(strip=True)) > 100]
-        if paragraphs:
-            content_text += f"Content: {' '.join(paragraphs[:10])}\n\n"
+        paragraphs = (text for text in (page.text(p) for p in page.paragraphs) if len(text) > 100)
+        paper.add_segments("Content", paragraphs, separator=" ")
     
     # If we didn't get much content, try a site-specific approach based on domain
-    if len(content_text) < 500:
+    if len(paper.to_text()) < 500:
         domain = extract_domain(url)
-        content_text = apply_site_specific_extraction(soup, domain, url, content_text)
+        apply_site_specific_extraction(soup, domain, paper, page)
     
-    return content_text
+    return paper
 
 
-def extract_abstract(soup):
+def extract_abstract(soup, page=None):
     """Extract abstract from soup object"""
-    # Try multiple approaches to find abstract
-    abstract_candidates = [
-        # Direct class or ID match
-        soup.find('div', {'id': 'abstract'}),
-        soup.find('section', {'id': 'abstract'}),
-        soup.find('div', {'class': 'abstract'}),
-        soup.find('section', {'class': 'abstract'}),
-        
-        # Partial class match
-        soup.find(lambda tag: tag.name and tag.get('class') and 
-                 any('abstract' in c.lower() for c in tag.get('class'))),
-                 
-        # Abstract section by heading
-        soup.find(lambda tag: tag.name in ['h1', 'h2', 'h3'] and 
-                 tag.get_text(strip=True).lower() == 'abstract'),
-    ]
+    page = page or PageCandidates(soup)
     
-    for candidate in abstract_candidates:
+    for candidate in page.abstract:
         if candidate:
             # If we found a heading, get the next element
-            if candidate.name in ['h1', 'h2', 'h3']:
+            if candidate.name in HEADING_TAGS:
                 next_elem = candidate.find_next()
-                if next_elem and len(next_elem.get_text(strip=True)) > 50:
-                    return next_elem.get_text(strip=True)
+                if next_elem and len(page.text(next_elem)) > 50:
+                    return page.text(next_elem)
             # Otherwise return the candidate text
-            if len(candidate.get_text(strip=True)) > 50:
-                return candidate.get_text(strip=True)
+            if len(page.text(candidate)) > 50:
+                return page.text(candidate)
     
     # Try finding text with "Abstract" label
-    abstract_text = soup.find(string=re.compile(r'Abstract[:\s]'))
+    abstract_text = page.abstract_label
     if abstract_text:
         parent = abstract_text.parent
         next_elem = parent.find_next()
-        if next_elem and len(next_elem.get_text(strip=True)) > 50:
-            return next_elem.get_text(strip=True)
-        elif parent and len(parent.get_text(strip=True)) > 100:
-            return parent.get_text(strip=True).replace("Abstract:", "").replace("Abstract", "").strip()
+        if next_elem and len(page.text(next_elem)) > 50:
+            return page.text(next_elem)
+        elif parent and len(page.text(parent)) > 100:
+            return page.text(parent).replace("Abstract:", "").replace("Abstract", "").strip()
     
     return ""
 
 
-def extract_authors(soup):
+def extract_authors(soup, page=None):
     """Extract authors from soup object"""
-    # Try multiple approaches to find authors
-    author_candidates = [
-        # Direct class or ID match
-        soup.find('div', {'id': 'authors'}),
-        soup.find('section', {'id': 'authors'}),
-        soup.find('div', {'class': 'authors'}),
-        soup.find('div', {'class': 'author-list'}),
-        
-        # Partial class match
-        soup.find(lambda tag: tag.name and tag.get('class') and 
-                 any('author' in c.lower() for c in tag.get('class'))),
-                 
-        # Authors section by heading
-        soup.find(lambda tag: tag.name in ['h1', 'h2', 'h3'] and 
-                 tag.get_text(strip=True).lower() in ['authors', 'author']),
-    ]
+    page = page or PageCandidates(soup)
     
-    for candidate in author_candidates:
+    for candidate in page.authors:
         if candidate:
             # If we found a heading, get the next element
-            if candidate.name in ['h1', 'h2', 'h3']:
+            if candidate.name in HEADING_TAGS:
                 next_elem = candidate.find_next()
                 if next_elem:
-                    return next_elem.get_text(strip=True)
+                    return page.text(next_elem)
             # Otherwise return the candidate text
-            return candidate.get_text(strip=True)
+            return page.text(candidate)
     
     return ""
 
 
-def extract_main_content(soup):
-    """Extract main content from soup object"""
-    # Try multiple approaches to find main content
-    content_candidates = [
-        # Common content containers
-        soup.find('div', {'id': 'content'}),
-        soup.find('div', {'id': 'main-content'}),
-        soup.find('div', {'id': 'body'}),
-        soup.find('article'),
-        
-        # Sections that might contain content
-        soup.find_all('section'),
-    ]
-    
-    for candidate in content_candidates:
-        if candidate:
-            if isinstance(candidate, list):
-                # For a list of sections, combine their text
-                texts = []
-                for section in candidate:
-                    text = section.get_text(strip=True)
-                    if len(text) > 200:  # Only include substantial sections
-                        texts.append(text)
-                if texts:
-                    return "\n\n".join(texts[:5])  # Limit to first 5 sections
+def extract_main_content(soup, page=None):
+    """
+    Texts of the main content in document order, one block at a time and
+    without a length limit, so a long paper is never held as a single string.
+    """
+    page = page or PageCandidates(soup)
+    
+    # Common content containers first, then the page's sections
+    for candidate in page.content:
+        if candidate is not None and text_length(candidate) > MIN_CONTENT_CHARS:
+            yield from block_texts(candidate)
+            return
+    yield from section_texts(page)
+
+
+def section_texts(page):
+    """Texts of the page's substantial sections; nested sections are part of their parent's text"""
+    taken = set()
+    for section in page.sections:
+        if any(id(parent) in taken for parent in section.parents):
+            continue
+        length = text_length(section)
+        if length <= MIN_CONTENT_CHARS:
+            continue
+        taken.add(id(section))
+        if length > SEGMENT_MAX_CHARS:
+            yield from block_texts(section)
+        else:
+            yield page.text(section)
+
+
+def text_length(node):
+    """Length of node.get_text(strip=True), without building the string"""
+    return sum(len(text) for text in node.stripped_strings)
+
+
+def block_texts(node, max_chars=SEGMENT_MAX_CHARS):
+    """
+    The text of a node one paragraph at a time. Blocks longer than max_chars
+    are walked the same way, so no text much longer than that is built.
+    """
+    inline = []
+    for child in node.children:
+        if isinstance(child, Tag) and child.name in BLOCK_TAGS:
+            if inline:
+                yield " ".join("".join(inline).split())
+                inline = []
+            if text_length(child) > max_chars:
+                yield from block_texts(child, max_chars)
             else:
-                # For a single element, get its text
-                text = candidate.get_text(strip=True)
-                if len(text) > 200:
-                    return text[:5000]  # Limit to 5000 chars
-    
-    return ""
+                yield child.get_text(strip=True)
+        elif isinstance(child, Tag):
+            # Inline markup keeps the spaces around it
+            inline.append(child.get_text())
+        elif type(child) is NavigableString:
+            inline.append(str(child))
+    if inline:
+        yield " ".join("".join(inline).split())
 
 
-def apply_site_specific_extraction(soup, domain, url, content_text):
-    """Apply site-specific extraction based on the domain"""
+def apply_site_specific_extraction(soup, domain, paper, page=None):
+    """Fill in a Paper with site-specific selectors based on the domain"""
     logger.info(f"Applying site-specific extraction for domain: {domain}")
+    page = page or PageCandidates(soup)
     
     if "arxiv.org" in domain:
-        # ArXiv specific extraction
+        # ArXiv specific extraction; these elements beat the generic guesses
         title_elem = soup.find('h1', {'class': 'title'})
         if title_elem:
-            title = title_elem.get_text(strip=True).replace('Title:', '').strip()
-            content_text = f"Title: {title}\n\n"
+            paper.title = ""
+            paper.assign("title", title_elem.get_text(strip=True))
         
         abstract_elem = soup.find('blockquote', {'class': 'abstract'})
         if abstract_elem:
-            abstract = abstract_elem.get_text(strip=True).replace('Abstract:', '').strip()
-            content_text += f"Abstract: {abstract}\n\n"
+            paper.abstract = ""
+            paper.assign("abstract", abstract_elem.get_text(strip=True))
         
         authors_elem = soup.find('div', {'class': 'authors'})
         if authors_elem:
-            authors = authors_elem.get_text(strip=True)
-            content_text += f"Authors: {authors}\n\n"
+            paper.authors = split_authors(authors_elem.get_text(strip=True))
     
     elif "ieee" in domain:
         # IEEE specific extraction
         abstract_elem = soup.find('div', {'class': 'abstract-text'})
         if abstract_elem:
-            abstract = abstract_elem.get_text(strip=True)
-            content_text = content_text.replace("Abstract:", "")
-            content_text += f"Abstract: {abstract}\n\n"
+            paper.abstract = abstract_elem.get_text(strip=True)
         
         # IEEE often has structured content in sections
         sections = soup.find_all('div', {'class': 'section'})
-        if sections:
-            section_texts = []
-            for section in sections:
-                heading = section.find(['h2', 'h3'])
-                if heading:
-                    section_text = f"{heading.get_text(strip=True)}:\n"
-                    section_text += section.get_text(strip=True).replace(heading.get_text(strip=True), "")
-                    section_texts.append(section_text)
-            if section_texts:
-                content_text += "Sections:\n" + "\n\n".join(section_texts[:5]) + "\n\n"
+        for section in sections:
+            heading = section.find(['h2', 'h3'])
+            if heading:
+                paper.add_segments(page.text(heading), [page.text(section).replace(page.text(heading), "")])
     
     elif "sciencedirect" in domain:
         # ScienceDirect specific extraction
         abstract_elem = soup.find('div', {'class': 'abstract'})
         if abstract_elem:
-            abstract = abstract_elem.get_text(strip=True)
-            content_text = content_text.replace("Abstract:", "")
-            content_text += f"Abstract: {abstract}\n\n"
+            paper.abstract = abstract_elem.get_text(strip=True)
         
         # ScienceDirect often has structured sections
-        sections = soup.find_all('section')
-        if sections:
-            section_texts = []
-            for section in sections:
-                if len(section.get_text(strip=True)) > 200:
-                    section_texts.append(section.get_text(strip=True))
-            if section_texts:
-                content_text += "Sections:\n" + "\n\n".join(section_texts[:5]) + "\n\n"
+        paper.add_segments("", section_texts(page))
     
-    return content_text
+    return paper
 
 
 def extract_domain(url):
@@ -282,44 +378,3 @@ def extract_domain(url):
     parsed_url = urllib.parse.urlparse(url)
     domain = parsed_url.netloc
     return domain
-
-
-def is_valid_content(content):
-    """Check if the extracted content is valid and substantial"""
-    if not content:
-        return False
-    
-    # Check if content has enough length
-    if len(content) < 200:
-        return False
-    
-    # Check if content contains at least title and some other content
-    if "Title:" not in content or len(content.split("Title:")[1].strip()) < 10:
-        return False
-    
-    # Check if we have either abstract or content
-    if "Abstract:" not in content and "Content:" not in content:
-        return False
-    
-    return True
-
-
-def extract_paper_id_from_url(url):
-    """Extract paper ID from URL using common patterns"""
-    patterns = [
-        r'arxiv\.org/abs/(\d+\.\d+)',         # ArXiv ID format
-        r'doi\.org/([^/]+/[^/]+)',             # DOI format
-        r'(\d{4}\.\d{4,5})',                   # ArXiv ID in URL
-        r'paper[=/](\w+)',                     # Generic paper ID
-        r'article[=/](\w+)',                   # Generic article ID
-        r'document/(\d+)',                     # IEEE format
-        r'pii/(S\d+)',                         # ScienceDirect format
-        r'([^/]+)$'                            # Last segment as fallback
-    ]
-    
-    for pattern in patterns:
-        match = re.search(pattern, url)
-        if match:
-            return match.group(1)
-    
-    return None 
\ No newline at end of file
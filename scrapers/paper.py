@@ -0,0 +1,201 @@
+import os
+import re
+
+
+class ScrapeError(Exception):
+    """A paper could not be scraped; the message is meant for the user"""
+
+    def __init__(self, message, url=None):
+        super().__init__(message)
+        self.url = url
+
+
+class FetchError(ScrapeError):
+    """The page could not be downloaded"""
+
+    def __init__(self, message, url=None, status_code=None):
+        super().__init__(message, url)
+        self.status_code = status_code
+
+    @property
+    def retryable(self):
+        """Client errors (404, 403 ...) other than rate limiting will not go away on retry"""
+        return not (self.status_code and 400 <= self.status_code < 500 and self.status_code != 429)
+
+
+class ExtractionError(ScrapeError):
+    """The page was downloaded but held no usable paper content"""
+
+
+class UnsupportedSiteError(ScrapeError):
+    """The generic scraper failed and no site-specific scraper exists for the URL"""
+
+
+# Labels pages put in front of field text ("Title:", "Authors:" ...)
+FIELD_LABEL = re.compile(r'^\s*(?:title|authors?|abstract|doi)\s*:\s*', re.IGNORECASE)
+AUTHOR_SEPARATOR = re.compile(r'\s*[;,]\s*')
+# A DOI inside scraped text, such as a doi.org link
+DOI = re.compile(r'\b10\.\d{4,9}/[^\s"<>]+')
+
+# Longest piece of text a section is stored and chunked in (can be overridden from the environment)
+SEGMENT_MAX_CHARS = int(os.getenv("SEGMENT_MAX_CHARS", "8000"))
+# Where an oversized text is preferably cut, best first
+SEGMENT_BREAKS = ("\n\n", "\n", ". ", " ")
+
+
+def normalize_doi(text):
+    """The bare DOI ("10.48550/arXiv.2412.04447") in a DOI, doi: name or doi.org URL"""
+    match = DOI.search(text)
+    return match.group(0).rstrip(".,;") if match else text
+
+
+def split_authors(text):
+    """Author names from a scraped author line"""
+    text = FIELD_LABEL.sub("", text)
+    return [name for name in AUTHOR_SEPARATOR.split(text) if name]
+
+
+def pack_segments(texts, max_chars=SEGMENT_MAX_CHARS, separator="\n\n"):
+    """
+    Join consecutive texts into segments of at most max_chars, cutting texts
+    that are longer on a paragraph, line, sentence or word break.
+    texts may be any iterable; segments are yielded as soon as they are full.
+    """
+    parts, size = [], 0
+    for text in texts:
+        text = text.strip()
+        while len(text) > max_chars:
+            cut = max_chars
+            for mark in SEGMENT_BREAKS:
+                # Only breaks in the second half, so no segment ends up tiny
+                position = text.rfind(mark, max_chars // 2, max_chars)
+                if position > 0:
+                    cut = position + 1
+                    break
+            if parts:
+                yield separator.join(parts)
+                parts, size = [], 0
+            yield text[:cut].strip()
+            text = text[cut:].strip()
+        if not text:
+            continue
+        if parts and size + len(separator) + len(text) > max_chars:
+            yield separator.join(parts)
+            parts, size = [], 0
+        size += len(text) + (len(separator) if parts else 0)
+        parts.append(text)
+    if parts:
+        yield separator.join(parts)
+
+
+class Paper:
+    """One scraped paper.
+
+    sections is a list of (heading, text) pairs, heading may be empty; extra
+    holds site-specific fields such as arXiv subjects or IEEE keywords.
+    """
+
+    __slots__ = ("title", "authors", "abstract", "sections", "doi", "source", "extra")
+
+    def __init__(self, title="", authors=None, abstract="", sections=None, doi="", source="", extra=None):
+        self.title = title
+        self.authors = authors or []
+        self.abstract = abstract
+        self.sections = sections or []
+        self.doi = doi
+        self.source = source
+        self.extra = extra or {}
+
+    def assign(self, field, text):
+        """Fill a field from scraped text unless it is already set; other names go to extra"""
+        text = FIELD_LABEL.sub("", " ".join(text.split()))
+        if not text:
+            return
+        if field == "authors":
+            if not self.authors:
+                self.authors = split_authors(text)
+        elif field == "doi":
+            if not self.doi:
+                self.doi = normalize_doi(text)
+        elif field in ("title", "abstract"):
+            if not getattr(self, field):
+                setattr(self, field, text)
+        else:
+            self.extra.setdefault(field, text)
+
+    def add_section(self, heading, text):
+        text = text.strip()
+        if text:
+            self.sections.append((heading, text))
+
+    def add_segments(self, heading, texts, separator="\n\n"):
+        """Add texts as consecutive sections of bounded size, the first one under heading"""
+        for segment in pack_segments(texts, separator=separator):
+            self.add_section(heading, segment)
+            heading = ""
+
+    def has_content(self):
+        return bool(self.abstract or self.sections)
+
+    def is_substantial(self, min_chars=200):
+        """Whether there is a real title, an abstract or body, and enough text to index"""
+        return len(self.title) >= 10 and self.has_content() and len(self.to_text()) >= min_chars
+
+    def to_text(self):
+        """The paper as the plain text that gets chunked and embedded"""
+        return "\n\n".join(self.parts())
+
+    def parts(self):
+        """The paragraphs of to_text(), one at a time"""
+        if self.title:
+            yield f"Title: {self.title}"
+        if self.authors:
+            yield f"Authors: {', '.join(self.authors)}"
+        if self.abstract:
+            yield f"Abstract: {self.abstract}"
+        for name, value in self.extra.items():
+            yield f"{name}: {value}"
+        if self.doi:
+            yield f"DOI: {self.doi}"
+        for heading, text in self.sections:
+            yield f"{heading}: {text}" if heading else text
+
+    def segments(self, max_chars=SEGMENT_MAX_CHARS):
+        """to_text() in pieces of at most max_chars, cut between paragraphs where possible,
+        so a long paper can be chunked and embedded piece by piece"""
+        return pack_segments(self.parts(), max_chars)
+
+    def metadata(self):
+        """Fields stored with every chunk of the paper, for filtering and citations"""
+        metadata = {"title": self.title, "authors": self.authors, "doi": self.doi}
+        # The vector stores reject empty values
+        return {key: value for key, value in metadata.items() if value}
+
+    def to_dict(self, sections=True):
+        """Plain dict of the fields; sections=False keeps just the bibliographic ones"""
+        fields = {
+            "title": self.title,
+            "authors": list(self.authors),
+            "abstract": self.abstract,
+            "doi": self.doi,
+            "source": self.source,
+            "extra": dict(self.extra),
+        }
+        if sections:
+            fields["sections"] = [{"heading": heading, "text": text} for heading, text in self.sections]
+        return fields
+
+    @classmethod
+    def from_dict(cls, fields):
+        return cls(
+            title=fields.get("title", ""),
+            authors=list(fields.get("authors", [])),
+            abstract=fields.get("abstract", ""),
+            sections=[(section["heading"], section["text"]) for section in fields.get("sections", [])],
+            doi=fields.get("doi", ""),
+            source=fields.get("source", ""),
+            extra=dict(fields.get("extra", {}))
+        )
+
+    def __repr__(self):
+        return f"Paper(title={self.title!r}, source={self.source!r}, sections={len(self.sections)})"
@@ -0,0 +1,367 @@
+import os
+import time
+import zlib
+import logging
+import threading
+from collections import Counter, OrderedDict
+from datetime import datetime
+
+try:
+    import zstandard
+except ImportError:  # zstd is optional, zlib is always available
+    zstandard = None
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Cache configuration (can be overridden from the environment)
+SESSION_CACHE_MAX_BYTES = int(os.getenv("SESSION_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+SESSION_CACHE_COMPRESSION = os.getenv("SESSION_CACHE_COMPRESSION", "zstd").lower()
+
+# Rough bookkeeping cost of a session besides its document text
+ENTRY_OVERHEAD_BYTES = 512
+# Texts shorter than this are stored as plain UTF-8, compression would not pay off
+MIN_COMPRESS_BYTES = 1024
+
+
+def _pick_codec(name):
+    """Resolve the configured compression codec to one that is available"""
+    if name == "zstd" and zstandard is None:
+        logger.warning("zstandard is not installed, falling back to zlib for session text")
+        return "zlib"
+    if name not in ("zstd", "zlib", "none"):
+        logger.warning(f"Unknown session compression '{name}', storing text uncompressed")
+        return "none"
+    return name
+
+
+def _compress(codec, raw):
+    if codec == "zstd":
+        return zstandard.ZstdCompressor(level=3).compress(raw)
+    if codec == "zlib":
+        return zlib.compress(raw, 6)
+    return raw
+
+
+def _compress_parts(codec, parts):
+    """Compress an iterable of byte strings as they arrive; returns (codec, blob, size).
+    Input shorter than MIN_COMPRESS_BYTES is returned uncompressed."""
+    head, chunks, size, compressor = [], [], 0, None
+    for data in parts:
+        size += len(data)
+        if compressor is not None:
+            chunks.append(compressor.compress(data))
+            continue
+        head.append(data)
+        if codec != "none" and size >= MIN_COMPRESS_BYTES:
+            compressor = zstandard.ZstdCompressor(level=3).compressobj() if codec == "zstd" else zlib.compressobj(6)
+            chunks.append(compressor.compress(b"".join(head)))
+            head = None
+    if compressor is None:
+        return "none", b"".join(head), size
+    chunks.append(compressor.flush())
+    return codec, b"".join(chunks), size
+
+
+def _decompress(codec, blob):
+    if codec == "zstd":
+        # Streamed frames do not record their size, which decompress() needs
+        return zstandard.ZstdDecompressor().decompressobj().decompress(blob)
+    if codec == "zlib":
+        return zlib.decompress(blob)
+    return blob
+
+
+def _joined(parts):
+    """The UTF-8 of parts joined by blank lines, a part at a time"""
+    for number, part in enumerate(parts):
+        if number:
+            yield b"\n\n"
+        yield part.encode("utf-8")
+
+
+def _field_size(value):
+    """Approximate bytes held by a session field: its strings, including nested ones"""
+    if isinstance(value, str):
+        return len(value)
+    if isinstance(value, (list, tuple)):
+        return sum(_field_size(v) for v in value)
+    if isinstance(value, dict):
+        return sum(_field_size(k) + _field_size(v) for k, v in value.items())
+    return 0
+
+
+class _Entry:
+    __slots__ = ("fields", "texts", "last_active", "size", "raw")
+
+    def __init__(self, fields):
+        self.fields = fields
+        # name -> (codec, stored bytes, raw length)
+        self.texts = {}
+        self.last_active = time.time()
+        self.size = 0
+        self.raw = 0
+
+
+class SessionCache:
+    """LRU store for per-session state, bounded by the bytes it holds.
+
+    Sessions are kept in an OrderedDict ordered from least to most recently
+    used, so touching and evicting are O(1). Document text is stored
+    compressed and counted against ``max_bytes``; when a write pushes the
+    cache over budget the least recently used sessions are evicted and
+    handed to ``on_evict(session_id, fields)``. New sessions are reported to
+    ``on_create(session_id, last_active)`` so a scheduler can track them.
+    """
+
+    def __init__(self, max_bytes=SESSION_CACHE_MAX_BYTES, compression=SESSION_CACHE_COMPRESSION,
+                 on_evict=None, on_create=None):
+        self.max_bytes = max_bytes
+        self.codec = _pick_codec(compression)
+        self.on_evict = on_evict
+        self.on_create = on_create
+        self._entries = OrderedDict()
+        # Upload filename -> number of sessions referencing it
+        self._files = Counter()
+        self._lock = threading.RLock()
+        self._bytes = 0
+        self._raw_bytes = 0
+        self._counters = {
+            "hits": 0,
+            "misses": 0,
+            "evictions_capacity": 0,
+            "evictions_idle": 0,
+            "removed": 0,
+        }
+
+    def __contains__(self, session_id):
+        with self._lock:
+            return session_id in self._entries
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def session_ids(self):
+        """Snapshot of the cached session ids, least recently used first"""
+        with self._lock:
+            return list(self._entries)
+
+    def get(self, session_id, touch=False):
+        """Return a copy of the session's fields (without text), or None"""
+        with self._lock:
+            entry = self._entries.get(session_id)
+            if entry is None:
+                self._counters["misses"] += 1
+                return None
+            self._counters["hits"] += 1
+            if touch:
+                self._touch(session_id, entry)
+            return self._public_fields(entry)
+
+    def create(self, session_id, **fields):
+        """Create (or replace) a session and mark it most recently used"""
+        with self._lock:
+            old = self._entries.pop(session_id, None)
+            if old is not None:
+                self._forget(old)
+            entry = _Entry(dict(fields))
+            entry.fields["pdf_list"] = list(entry.fields.get("pdf_list", []))
+            self._files.update(entry.fields["pdf_list"])
+            self._entries[session_id] = entry
+            self._resize(entry)
+            evicted = self._enforce_budget()
+        self._notify(evicted)
+        if self.on_create:
+            self.on_create(session_id, entry.last_active)
+        return self._public_fields(entry)
+
+    def update(self, session_id, **fields):
+        """Merge fields into an existing session and touch it"""
+        with self._lock:
+            entry = self._entries.get(session_id)
+            if entry is None:
+                raise KeyError(session_id)
+            if "pdf_list" in fields:
+                fields["pdf_list"] = list(fields["pdf_list"])
+                self._unref_files(entry.fields.get("pdf_list", []))
+                self._files.update(fields["pdf_list"])
+            entry.fields.update(fields)
+            self._touch(session_id, entry)
+            self._resize(entry)
+            evicted = self._enforce_budget()
+        self._notify(evicted)
+
+    def last_active(self, session_id):
+        """Timestamp (time.time()) of the session's last use, or None"""
+        with self._lock:
+            entry = self._entries.get(session_id)
+            return entry.last_active if entry is not None else None
+
+    def is_tracked_file(self, filename):
+        """Whether any cached session references this upload"""
+        with self._lock:
+            return self._files[filename] > 0
+
+    def touch(self, session_id):
+        """Mark a session as just used; returns False if it is not cached"""
+        with self._lock:
+            entry = self._entries.get(session_id)
+            if entry is None:
+                return False
+            self._touch(session_id, entry)
+            return True
+
+    def set_text(self, session_id, text, name="data"):
+        """Store document text for a session, compressing it if worthwhile.
+
+        text may also be an iterable of paragraphs (see Paper.parts), stored
+        joined by blank lines and compressed as they arrive.
+        """
+        if text is None or isinstance(text, str):
+            raw = (text or "").encode("utf-8")
+            codec = self.codec if len(raw) >= MIN_COMPRESS_BYTES else "none"
+            blob = _compress(codec, raw)
+            if codec != "none" and len(blob) >= len(raw):
+                codec, blob = "none", raw
+            size = len(raw)
+        else:
+            codec, blob, size = _compress_parts(self.codec, _joined(text))
+        with self._lock:
+            entry = self._entries.get(session_id)
+            if entry is None:
+                raise KeyError(session_id)
+            entry.texts[name] = (codec, blob, size)
+            self._touch(session_id, entry)
+            self._resize(entry)
+            evicted = self._enforce_budget()
+        self._notify(evicted)
+
+    def get_text(self, session_id, name="data"):
+        """Return stored document text for a session, or '' if there is none"""
+        with self._lock:
+            entry = self._entries.get(session_id)
+            stored = entry.texts.get(name) if entry is not None else None
+        if stored is None:
+            return ""
+        codec, blob, _ = stored
+        return _decompress(codec, blob).decode("utf-8")
+
+    def drop_text(self, session_id, name="data"):
+        """Forget stored text for a session"""
+        with self._lock:
+            entry = self._entries.get(session_id)
+            if entry is not None and entry.texts.pop(name, None) is not None:
+                self._resize(entry)
+
+    def pop(self, session_id):
+        """Remove a session explicitly; returns its fields or None"""
+        with self._lock:
+            entry = self._entries.pop(session_id, None)
+            if entry is None:
+                return None
+            self._forget(entry)
+            self._counters["removed"] += 1
+            return self._public_fields(entry)
+
+    def evict_idle(self, max_idle_seconds):
+        """Evict sessions idle for longer than max_idle_seconds.
+
+        Idle sessions are always at the LRU head, so this stops at the first
+        session that is still fresh instead of scanning everything.
+        """
+        cutoff = time.time() - max_idle_seconds
+        evicted = []
+        with self._lock:
+            while self._entries:
+                session_id, entry = next(iter(self._entries.items()))
+                if entry.last_active >= cutoff:
+                    break
+                self._entries.popitem(last=False)
+                self._forget(entry)
+                self._counters["evictions_idle"] += 1
+                evicted.append((session_id, self._public_fields(entry)))
+        self._notify(evicted)
+        return len(evicted)
+
+    def expire(self, session_id, max_idle_seconds):
+        """Evict one session if it is still idle; returns True if it was evicted"""
+        with self._lock:
+            entry = self._entries.get(session_id)
+            if entry is None or entry.last_active >= time.time() - max_idle_seconds:
+                return False
+            del self._entries[session_id]
+            self._forget(entry)
+            self._counters["evictions_idle"] += 1
+            fields = self._public_fields(entry)
+        self._notify([(session_id, fields)])
+        return True
+
+    def stats(self):
+        """Counters describing the cache for status endpoints"""
+        with self._lock:
+            stats = dict(self._counters)
+            stats.update({
+                "sessions": len(self._entries),
+                "bytes_held": self._bytes,
+                "raw_text_bytes": self._raw_bytes,
+                "max_bytes": self.max_bytes,
+                "compression": self.codec,
+            })
+        return stats
+
+    # Internal helpers (callers hold the lock)
+
+    def _touch(self, session_id, entry):
+        entry.last_active = time.time()
+        self._entries.move_to_end(session_id)
+
+    def _public_fields(self, entry):
+        fields = dict(entry.fields)
+        fields["pdf_list"] = list(fields.get("pdf_list", []))
+        fields["last_active"] = datetime.fromtimestamp(entry.last_active)
+        return fields
+
+    def _resize(self, entry):
+        size = ENTRY_OVERHEAD_BYTES + sum(len(blob) for _, blob, _ in entry.texts.values())
+        size += sum(_field_size(value) for value in entry.fields.values())
+        raw = sum(raw_len for _, _, raw_len in entry.texts.values())
+        self._account(size - entry.size, raw - entry.raw)
+        entry.size, entry.raw = size, raw
+
+    def _forget(self, entry):
+        self._account(-entry.size, -entry.raw)
+        self._unref_files(entry.fields.get("pdf_list", []))
+
+    def _unref_files(self, filenames):
+        for filename in filenames:
+            remaining = self._files[filename] - 1
+            if remaining > 0:
+                self._files[filename] = remaining
+            else:
+                self._files.pop(filename, None)
+
+    def _account(self, size_delta, raw_delta):
+        self._bytes += size_delta
+        self._raw_bytes += raw_delta
+
+    def _enforce_budget(self):
+        evicted = []
+        # Never evict the most recently used session, it is the one being written
+        while self._bytes > self.max_bytes and len(self._entries) > 1:
+            session_id, entry = self._entries.popitem(last=False)
+            self._forget(entry)
+            self._counters["evictions_capacity"] += 1
+            evicted.append((session_id, self._public_fields(entry)))
+            logger.info(f"Evicted session {session_id} to stay within the {self.max_bytes} byte budget")
+        return evicted
+
+    def _notify(self, evicted):
+        if not self.on_evict:
+            return
+        for session_id, fields in evicted:
+            try:
+                self.on_evict(session_id, fields)
+            except Exception as e:
+                logger.error(f"Error releasing evicted session {session_id}: {str(e)}")
@@ -0,0 +1,300 @@
+import os
+import time
+import heapq
+import logging
+import threading
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Reaper configuration (can be overridden from the environment)
+REAPER_INTERVAL_SECONDS = float(os.getenv("REAPER_INTERVAL_SECONDS", "30"))
+REAPER_ORPHAN_SWEEP_SECONDS = float(os.getenv("REAPER_ORPHAN_SWEEP_SECONDS", "600"))
+REAPER_DELETE_BATCH_SIZE = int(os.getenv("REAPER_DELETE_BATCH_SIZE", "100"))
+# How often live sessions are reported to the shared session registry
+REAPER_HEARTBEAT_SECONDS = float(os.getenv("REAPER_HEARTBEAT_SECONDS", "300"))
+
+
+class SessionReaper:
+    """Background thread that expires idle sessions and releases their resources.
+
+    Expiry deadlines live in a min-heap with one entry per session. Touching a
+    session does not reschedule it; when its entry comes due the reaper checks
+    the real last-active time and pushes it back if the session was used in
+    the meantime. Released sessions are queued and their PDFs and vectors are
+    deleted in batches, so request handlers never wait on cleanup.
+
+    ``delete_documents(session_id, sources)`` deletes the vectors of some
+    documents of a session that lives on, for sessions started over with a
+    new paper; without it those vectors are left to reconcile_vectors.py.
+
+    With a ``registry`` (session_registry.SessionRegistry) the reaper also
+    reports the cached sessions' last-active times to it every
+    ``heartbeat_interval`` seconds and removes released sessions from it once
+    their vectors are gone, so reconcile_vectors.py can find what a dead
+    worker left behind.
+    """
+
+    def __init__(self, cache, upload_folder, max_idle_seconds, delete_sessions,
+                 interval=REAPER_INTERVAL_SECONDS, orphan_sweep_interval=REAPER_ORPHAN_SWEEP_SECONDS,
+                 batch_size=REAPER_DELETE_BATCH_SIZE, registry=None, heartbeat_interval=REAPER_HEARTBEAT_SECONDS,
+                 delete_documents=None):
+        self.cache = cache
+        self.upload_folder = upload_folder
+        self.max_idle_seconds = max_idle_seconds
+        self.delete_sessions = delete_sessions
+        self.delete_documents = delete_documents
+        self.interval = interval
+        self.orphan_sweep_interval = orphan_sweep_interval
+        self.batch_size = batch_size
+        self.registry = registry
+        self.heartbeat_interval = heartbeat_interval
+
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._heap = []  # (deadline, session_id)
+        self._scheduled = set()
+        self._pending = []  # (session_id, pdf_list, delete_vectors, sources) waiting to be released
+        self._thread = None
+        self._pid = None
+        self._stopping = False
+        self._last_orphan_sweep = 0.0
+        self._last_heartbeat = 0.0
+        self._metrics = {
+            "runs": 0,
+            "last_run_seconds": 0.0,
+            "total_run_seconds": 0.0,
+            "sessions_expired": 0,
+            "sessions_released": 0,
+            "files_deleted": 0,
+            "orphan_files_deleted": 0,
+            "vector_delete_batches": 0,
+            "heartbeats": 0,
+            "errors": 0,
+        }
+
+    def schedule(self, session_id, last_active=None):
+        """Register a session so it is checked once its idle deadline passes"""
+        deadline = (last_active or time.time()) + self.max_idle_seconds
+        with self._lock:
+            if session_id in self._scheduled:
+                return
+            self._scheduled.add(session_id)
+            heapq.heappush(self._heap, (deadline, session_id))
+
+    def release(self, session_id, session, delete_vectors=True, sources=None):
+        """
+        Queue a removed session's PDFs (and, by default, its vectors) for deletion.
+        With sources only the vectors of those documents are deleted, and the
+        session stays registered: it was started over, not removed.
+        """
+        sources = list(sources) if sources is not None else None
+        with self._lock:
+            self._pending.append((session_id, list(session.get('pdf_list', [])), delete_vectors, sources))
+        self._wakeup.set()
+
+    def wake(self):
+        """Ask the reaper to run as soon as possible"""
+        self._wakeup.set()
+
+    def ensure_started(self):
+        """Start the reaper thread in this process if it is not running"""
+        # Threads do not survive a fork, so check the owning pid as well
+        if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+                return
+            self._stopping = False
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name="session-reaper", daemon=True)
+            self._thread.start()
+            logger.info(f"Started session reaper in process {self._pid}")
+
+    def stop(self, timeout=5):
+        self._stopping = True
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def stats(self):
+        """Backlog and runtime metrics for monitoring"""
+        with self._lock:
+            stats = dict(self._metrics)
+            stats.update({
+                "scheduled_sessions": len(self._heap),
+                "next_deadline_in_seconds": max(0.0, self._heap[0][0] - time.time()) if self._heap else None,
+                "pending_releases": len(self._pending),
+                "running": self._thread is not None and self._thread.is_alive(),
+            })
+        return stats
+
+    def run_once(self):
+        """Expire due sessions, release queued ones and sweep orphan uploads"""
+        started = time.time()
+        try:
+            self._expire_due(started)
+            self._release_pending()
+            if started - self._last_orphan_sweep >= self.orphan_sweep_interval:
+                self._sweep_orphans(started)
+                self._last_orphan_sweep = started
+            if self.registry is not None and started - self._last_heartbeat >= self.heartbeat_interval:
+                self._heartbeat()
+                self._last_heartbeat = started
+        except Exception as e:
+            logger.error(f"Session reaper run failed: {str(e)}")
+            with self._lock:
+                self._metrics["errors"] += 1
+        elapsed = time.time() - started
+        with self._lock:
+            self._metrics["runs"] += 1
+            self._metrics["last_run_seconds"] = elapsed
+            self._metrics["total_run_seconds"] += elapsed
+
+    def _run(self):
+        while not self._stopping:
+            self.run_once()
+            self._wakeup.wait(self._next_wait())
+            self._wakeup.clear()
+
+    def _next_wait(self):
+        with self._lock:
+            if self._pending:
+                return 0
+            if not self._heap:
+                return self.interval
+            return min(self.interval, max(0.0, self._heap[0][0] - time.time()))
+
+    def _expire_due(self, now):
+        while True:
+            with self._lock:
+                if not self._heap or self._heap[0][0] > now:
+                    return
+                _, session_id = heapq.heappop(self._heap)
+            last_active = self.cache.last_active(session_id)
+            if last_active is None:
+                # Already removed through another path
+                with self._lock:
+                    self._scheduled.discard(session_id)
+                continue
+            deadline = last_active + self.max_idle_seconds
+            if deadline > now:
+                # Used since it was scheduled; check again at its new deadline
+                with self._lock:
+                    heapq.heappush(self._heap, (deadline, session_id))
+                continue
+            # The cache hands the expired session back to release() via on_evict
+            if self.cache.expire(session_id, self.max_idle_seconds):
+                logger.info(f"Expired idle session: {session_id}")
+                with self._lock:
+                    self._scheduled.discard(session_id)
+                    self._metrics["sessions_expired"] += 1
+                continue
+            # Touched between the check and the eviction
+            last_active = self.cache.last_active(session_id)
+            with self._lock:
+                if last_active is None:
+                    self._scheduled.discard(session_id)
+                else:
+                    heapq.heappush(self._heap, (last_active + self.max_idle_seconds, session_id))
+
+    def _release_pending(self):
+        with self._lock:
+            pending, self._pending = self._pending, []
+        if not pending:
+            return
+
+        for _, pdf_list, _, _ in pending:
+            for pdf_filename in pdf_list:
+                # Another live session may still reference the same upload
+                if self.cache.is_tracked_file(pdf_filename):
+                    continue
+                if self._remove_upload(pdf_filename):
+                    with self._lock:
+                        self._metrics["files_deleted"] += 1
+
+        session_ids = [session_id for session_id, _, delete_vectors, sources in pending
+                       if delete_vectors and sources is None]
+        for session_id, _, delete_vectors, sources in pending:
+            if delete_vectors and sources and self.delete_documents is not None:
+                self._release_documents(session_id, sources)
+        for start in range(0, len(session_ids), self.batch_size):
+            batch = session_ids[start:start + self.batch_size]
+            try:
+                if not self.delete_sessions(batch):
+                    logger.warning(f"Vector deletion reported failure for {len(batch)} sessions")
+                elif self.registry is not None:
+                    self.registry.remove(batch)
+                with self._lock:
+                    self._metrics["vector_delete_batches"] += 1
+            except Exception as e:
+                logger.error(f"Error deleting vectors for expired sessions: {str(e)}")
+                with self._lock:
+                    self._metrics["errors"] += 1
+
+        with self._lock:
+            self._metrics["sessions_released"] += len(pending)
+        logger.info(f"Released {len(pending)} sessions")
+
+    def _release_documents(self, session_id, sources):
+        try:
+            if not self.delete_documents(session_id, sources):
+                logger.warning(f"Vector deletion reported failure for {len(sources)} documents of {session_id}")
+            elif self.registry is not None:
+                self.registry.remove_documents(session_id, sources)
+            with self._lock:
+                self._metrics["vector_delete_batches"] += 1
+        except Exception as e:
+            logger.error(f"Error deleting vectors of replaced documents: {str(e)}")
+            with self._lock:
+                self._metrics["errors"] += 1
+
+    def _heartbeat(self):
+        sessions = []
+        for session_id in self.cache.session_ids():
+            last_active = self.cache.last_active(session_id)
+            if last_active is not None:
+                sessions.append((session_id, last_active))
+        if self.registry.touch_many(sessions):
+            with self._lock:
+                self._metrics["heartbeats"] += 1
+
+    def _sweep_orphans(self, now):
+        # One directory pass with O(1) membership checks against the cache's file index
+        cutoff = now - self.max_idle_seconds
+        try:
+            with os.scandir(self.upload_folder) as entries:
+                for entry in entries:
+                    if not entry.name.endswith('.pdf') or not entry.is_file():
+                        continue
+                    if self.cache.is_tracked_file(entry.name):
+                        continue
+                    try:
+                        if entry.stat().st_mtime >= cutoff:
+                            continue
+                    except OSError:
+                        continue
+                    if self._remove_upload(entry.name):
+                        logger.info(f"Deleted orphaned PDF file: {entry.path}")
+                        with self._lock:
+                            self._metrics["orphan_files_deleted"] += 1
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logger.error(f"Error cleaning up orphaned PDFs: {str(e)}")
+            with self._lock:
+                self._metrics["errors"] += 1
+
+    def _remove_upload(self, filename):
+        pdf_path = os.path.join(self.upload_folder, filename)
+        try:
+            os.remove(pdf_path)
+            return True
+        except FileNotFoundError:
+            return False
+        except Exception as e:
+            logger.error(f"Error deleting PDF file {pdf_path}: {str(e)}")
+            with self._lock:
+                self._metrics["errors"] += 1
+            return False
@@ -0,0 +1,179 @@
+"""
+Registry of live sessions shared by every worker process.
+
+Session state lives in each worker's memory (session_cache.py), so a restart
+or crash loses it without the session's vectors ever being deleted. This
+SQLite file records which sessions and documents are alive, outside any one
+process, so reconcile_vectors.py can tell which vectors nobody owns anymore:
+
+    sessions(session_id, last_active)     refreshed by the reaper's heartbeat
+    documents(session_id, source)         every document indexed for a session
+    reconcile_runs(finished, dry_run, report)
+
+The file must be on storage that every worker sees, like the local indexes.
+"""
+import os
+import json
+import time
+import sqlite3
+import logging
+import threading
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Registry location (can be overridden from the environment)
+SESSION_REGISTRY_DB = os.getenv("SESSION_REGISTRY_DB", "session_registry.db")
+# Seconds to wait for another worker's write before giving up
+SESSION_REGISTRY_TIMEOUT = float(os.getenv("SESSION_REGISTRY_TIMEOUT", "5"))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    session_id TEXT PRIMARY KEY,
+    last_active REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS documents (
+    session_id TEXT NOT NULL,
+    source TEXT NOT NULL,
+    PRIMARY KEY (session_id, source)
+);
+CREATE TABLE IF NOT EXISTS reconcile_runs (
+    finished REAL NOT NULL,
+    dry_run INTEGER NOT NULL,
+    report TEXT NOT NULL
+);
+"""
+
+
+class SessionRegistry:
+    """
+    Live sessions and their documents in a SQLite file. Writes are small
+    single statements in WAL mode, so many workers can share the file; a
+    failed write is logged and reported as False, never raised into a request.
+    """
+
+    def __init__(self, path=SESSION_REGISTRY_DB, timeout=SESSION_REGISTRY_TIMEOUT):
+        self.path = path
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._connection = None
+        self._pid = None
+        self._metrics = {"writes": 0, "errors": 0}
+
+    def touch(self, session_id, last_active=None):
+        """Record a session as alive"""
+        return self.touch_many([(session_id, last_active or time.time())])
+
+    def touch_many(self, sessions):
+        """Record [(session id, last active)] as alive in one transaction"""
+        sessions = list(sessions)
+        if not sessions:
+            return True
+        return self._write(
+            "INSERT INTO sessions (session_id, last_active) VALUES (?, ?) "
+            "ON CONFLICT(session_id) DO UPDATE SET last_active = MAX(last_active, excluded.last_active)",
+            sessions
+        )
+
+    def add_document(self, session_id, source):
+        """Record a document of a session, before its vectors are written"""
+        now = time.time()
+        return (self.touch(session_id, now) and
+                self._write("INSERT OR IGNORE INTO documents (session_id, source) VALUES (?, ?)",
+                            [(session_id, source)]))
+
+    def remove(self, session_ids):
+        """Forget sessions whose vectors have been deleted"""
+        rows = [(session_id,) for session_id in session_ids]
+        if not rows:
+            return True
+        return (self._write("DELETE FROM documents WHERE session_id = ?", rows) and
+                self._write("DELETE FROM sessions WHERE session_id = ?", rows))
+
+    def remove_documents(self, session_id, sources):
+        """Forget documents of a live session whose vectors have been deleted"""
+        rows = [(session_id, source) for source in sources]
+        if not rows:
+            return True
+        return self._write("DELETE FROM documents WHERE session_id = ? AND source = ?", rows)
+
+    def remove_stale(self, before):
+        """Forget sessions no worker has reported since before; returns how many"""
+        stale = [session_id for session_id, last_active in self.sessions().items() if last_active < before]
+        if stale:
+            # Re-checked in the statement, a worker may have touched one meanwhile
+            self._write("DELETE FROM documents WHERE session_id IN "
+                        "(SELECT session_id FROM sessions WHERE session_id = ? AND last_active < ?)",
+                        [(session_id, before) for session_id in stale])
+            self._write("DELETE FROM sessions WHERE session_id = ? AND last_active < ?",
+                        [(session_id, before) for session_id in stale])
+        return len(stale)
+
+    def sessions(self):
+        """{session id: last active} of every registered session"""
+        return dict(self._read("SELECT session_id, last_active FROM sessions"))
+
+    def documents(self):
+        """{session id: set of sources} of every registered document"""
+        documents = {}
+        for session_id, source in self._read("SELECT session_id, source FROM documents"):
+            documents.setdefault(session_id, set()).add(source)
+        return documents
+
+    def record_run(self, report, dry_run):
+        """Keep the report of a reconciliation run for /metrics"""
+        return self._write("INSERT INTO reconcile_runs (finished, dry_run, report) VALUES (?, ?, ?)",
+                           [(time.time(), int(dry_run), json.dumps(report))])
+
+    def last_run(self):
+        rows = self._read("SELECT finished, dry_run, report FROM reconcile_runs ORDER BY finished DESC LIMIT 1")
+        if not rows:
+            return None
+        finished, dry_run, report = rows[0]
+        return dict(json.loads(report), finished=finished, dry_run=bool(dry_run))
+
+    def stats(self):
+        """Registry size, write counters and the last reconciliation run"""
+        try:
+            counts = self._read("SELECT (SELECT COUNT(*) FROM sessions), (SELECT COUNT(*) FROM documents)")
+            sessions, documents = counts[0]
+            last_run = self.last_run()
+        except Exception as e:
+            logger.error(f"Error reading session registry stats: {str(e)}")
+            sessions = documents = last_run = None
+        with self._lock:
+            stats = dict(self._metrics)
+        stats.update({"sessions": sessions, "documents": documents, "last_reconcile": last_run})
+        return stats
+
+    def _connect(self):
+        # Connections must not be shared with a forked child
+        if self._connection is None or self._pid != os.getpid():
+            directory = os.path.dirname(os.path.abspath(self.path))
+            os.makedirs(directory, exist_ok=True)
+            connection = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None,
+                                         check_same_thread=False)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.executescript(SCHEMA)
+            self._connection, self._pid = connection, os.getpid()
+        return self._connection
+
+    def _write(self, statement, rows):
+        with self._lock:
+            try:
+                connection = self._connect()
+                with connection:
+                    connection.execute("BEGIN IMMEDIATE")
+                    connection.executemany(statement, rows)
+                self._metrics["writes"] += 1
+                return True
+            except Exception as e:
+                self._metrics["errors"] += 1
+                logger.error(f"Error writing to the session registry: {str(e)}")
+                return False
+
+    def _read(self, query):
+        with self._lock:
+            return self._connect().execute(query).fetchall()
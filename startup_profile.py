@@ -0,0 +1,83 @@
+"""
+Import-time profile of the web app, to keep worker boot fast.
+
+Runs `python -X importtime -c "import main"` in a fresh interpreter and reports
+the total import time and the slowest top-level packages, so a heavy module
+that slips back into the import path shows up before it reaches a deploy.
+
+    python startup_profile.py                # profile main.py
+    python startup_profile.py --module finalEmbed --top 30
+    python startup_profile.py --max-seconds 3   # exit 1 when importing takes longer
+"""
+import os
+import re
+import sys
+import time
+import argparse
+import subprocess
+
+# Lines look like "import time:       412 |      10523 | langchain_core"
+IMPORTTIME_LINE = re.compile(r"import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+
+def profile_imports(module="main"):
+    """
+    Import module in a child interpreter.
+    Returns (wall seconds, [(name, self_us, cumulative_us, depth)]) in import order.
+    """
+    env = dict(os.environ, PYTHONDONTWRITEBYTECODE="1")
+    started = time.time()
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True, env=env, cwd=os.path.dirname(os.path.abspath(__file__))
+    )
+    elapsed = time.time() - started
+    if result.returncode != 0:
+        raise RuntimeError(f"Importing {module} failed:\n{result.stderr[-2000:]}")
+
+    entries = []
+    for line in result.stderr.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            entries.append((name, int(self_us), int(cumulative_us), (len(indent) - 1) // 2))
+    return elapsed, entries
+
+
+def report(module="main", top=20):
+    elapsed, entries = profile_imports(module)
+    # Top-level packages carry the cumulative cost of everything they import
+    packages = {}
+    for name, _, cumulative_us, _ in entries:
+        package = name.split(".")[0]
+        packages[package] = max(packages.get(package, 0), cumulative_us)
+    slowest = sorted(packages.items(), key=lambda item: item[1], reverse=True)[:top]
+    own = [entry for entry in entries if entry[0] == module]
+    total_us = own[-1][2] if own else sum(self_us for _, self_us, _, _ in entries)
+
+    print(f"import {module}: {total_us / 1e6:.2f}s of imports, {elapsed:.2f}s wall "
+          f"(includes interpreter start and module-level code)")
+    print(f"{len(entries)} modules imported\n")
+    print(f"{'package':<32}{'cumulative':>12}")
+    for package, cumulative_us in slowest:
+        print(f"{package:<32}{cumulative_us / 1e3:>10.1f}ms")
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Report which imports make the app slow to start")
+    parser.add_argument("--module", default="main", help="module to import (default: main)")
+    parser.add_argument("--top", type=int, default=20, help="number of packages to list")
+    parser.add_argument("--max-seconds", type=float, default=None,
+                        help="exit with status 1 if the import takes longer than this")
+    args = parser.parse_args()
+
+    elapsed = report(args.module, args.top)
+    if args.max_seconds is not None and elapsed > args.max_seconds:
+        print(f"\nImport took {elapsed:.2f}s, over the {args.max_seconds:.2f}s budget")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
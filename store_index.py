@@ -1,44 +1,132 @@
-from scrapers.ArxivScraper import arxiv_scrap
+from scrapers.ArxivScraper import arxiv_scrap, arxiv_fast_path, normalize_arxiv_id, canonical_arxiv_url, fetch_arxiv_metadata
 from scrapers.IeeeScraper import ieee_scrap
 from scrapers.ScienceDirectScraper import scdir_scrap
-from scrapers.UniversalScraper import universal_scraper
+from scrapers.UniversalScraper import universal_scraper, extract_domain
+from scrapers.paper import Paper, ScrapeError, FetchError, UnsupportedSiteError
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from collections import OrderedDict, deque
 import logging
+import os
+import time
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Bulk ingestion limits (can be overridden from the environment)
+BULK_FETCH_WORKERS = int(os.getenv("BULK_FETCH_WORKERS", "8"))
+BULK_FETCH_PER_DOMAIN = int(os.getenv("BULK_FETCH_PER_DOMAIN", "2"))
+
 def store_data(url):
     """
     Process a URL to extract research paper content.
     Uses a universal scraper first and falls back to specialized scrapers if needed.
+    Returns a Paper; raises a ScrapeError subclass when nothing usable was found.
     """
     try:
+        # arXiv papers are resolved straight from the export API
+        if normalize_arxiv_id(url):
+            paper = arxiv_fast_path(url)
+            if paper:
+                return paper
+            logger.info(f"arXiv API lookup failed for {url}, scraping the page instead")
+        
         # First try with the universal scraper
         logger.info(f"Attempting to scrape {url} with universal scraper")
-        data = universal_scraper(url)
-        
-        # If universal scraper returns a valid result, use it
-        if data and not data.startswith("Failed to extract"):
-            return data
+        try:
+            return universal_scraper(url)
+        except FetchError as e:
+            # The specialized scrapers request the same page; a 404 or 403 will not change
+            if not e.retryable:
+                raise
+            error = e
+        except ScrapeError as e:
+            error = e
         
         # If universal scraper failed, try with specific scrapers based on domain
         logger.info(f"Universal scraper failed, trying specialized scrapers for {url}")
         if "sciencedirect.com" in url:
-            data = scdir_scrap(url)
+            return scdir_scrap(url)
         elif "arxiv.org" in url:
-            data = arxiv_scrap(url)
+            return arxiv_scrap(url)
         elif "ieeexplore.ieee.org" in url:
-            data = ieee_scrap(url)
-        else:
-            # For unsupported sites, we already tried the universal scraper
-            # Return a more helpful error message
-            return f"The URL {url} is not from a supported research site. Here's what we could extract:\n\n{data}"
+            return ieee_scrap(url)
         
-        return data
+        # For unsupported sites, we already tried the universal scraper
+        raise UnsupportedSiteError(f"The URL {url} is not from a supported research site and no content could be extracted: {error}", url)
+    except ScrapeError:
+        raise
     except Exception as e:
         logger.error(f"Error while processing URL {url}: {str(e)}")
-        return f"Error processing {url}: {str(e)}. Please check if the URL is valid and accessible."
+        raise ScrapeError(f"Error processing {url}: {str(e)}. Please check if the URL is valid and accessible.", url)
+
+def canonical_url(url):
+    """Collapse URL variants of the same paper (arXiv abs/pdf/html, versions) to one URL"""
+    arxiv_id = normalize_arxiv_id(url)
+    return canonical_arxiv_url(arxiv_id) if arxiv_id else url
+
+def is_failed_scrape(result):
+    """Whether a store_many result is an error instead of a Paper"""
+    return not isinstance(result, Paper)
+
+def store_many(urls, max_workers=BULK_FETCH_WORKERS, per_domain=BULK_FETCH_PER_DOMAIN):
+    """
+    Fetch many URLs concurrently with store_data, yielding results as they finish.
+    At most per_domain requests run against any one site at a time; URLs for a
+    busy site wait in that site's queue without tying up a worker thread.
+    Yields (url, result, seconds) tuples in completion order, with URLs in
+    canonical form (see canonical_url); result is a Paper or the ScrapeError
+    that stopped it.
+    """
+    # Group URLs by domain, dropping duplicates but keeping the input order
+    urls = list(dict.fromkeys(canonical_url(url) for url in urls))
+    queues = OrderedDict()
+    for url in urls:
+        queues.setdefault(extract_domain(url), deque()).append(url)
+    
+    # Warm the arXiv metadata cache with batched API calls instead of one per paper
+    arxiv_ids = [normalize_arxiv_id(url) for url in urls]
+    arxiv_ids = [arxiv_id for arxiv_id in arxiv_ids if arxiv_id]
+    if arxiv_ids:
+        try:
+            fetch_arxiv_metadata(arxiv_ids)
+        except Exception as e:
+            logger.warning(f"Batched arXiv lookup failed, papers will be fetched one by one: {str(e)}")
+
+    in_flight = {}  # future -> (url, domain, started)
+    active = {domain: 0 for domain in queues}
+
+    def fill(executor):
+        # Round-robin over domains so one large site cannot starve the others
+        submitted = True
+        while submitted and len(in_flight) < max_workers:
+            submitted = False
+            for domain, queue in queues.items():
+                if len(in_flight) >= max_workers:
+                    break
+                if queue and active[domain] < per_domain:
+                    url = queue.popleft()
+                    active[domain] += 1
+                    in_flight[executor.submit(store_data, url)] = (url, domain, time.time())
+                    submitted = True
+
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="bulk-fetch") as executor:
+        fill(executor)
+        while in_flight:
+            done, _ = wait(list(in_flight), return_when=FIRST_COMPLETED)
+            for future in done:
+                url, domain, started = in_flight.pop(future)
+                active[domain] -= 1
+                try:
+                    result = future.result()
+                except ScrapeError as e:
+                    logger.warning(f"Could not extract content from {url}: {str(e)}")
+                    result = e
+                except Exception as e:
+                    logger.error(f"Error while processing URL {url}: {str(e)}")
+                    result = ScrapeError(f"Error processing {url}: {str(e)}", url)
+                yield url, result, time.time() - started
+            fill(executor)
 
 # store_data(url)
 
@@ -0,0 +1,18 @@
+import os
+import importlib
+import pytest
+
+
+@pytest.fixture(scope="session")
+def main(tmp_path_factory):
+    """The Flask app module, with its uploads folder and session registry in a temporary directory"""
+    directory = tmp_path_factory.mktemp("app")
+    cwd = os.getcwd()
+    os.chdir(directory)
+    try:
+        module = importlib.import_module("main")
+    finally:
+        os.chdir(cwd)
+    # The registry connects on first use, by then from the repository directory
+    module.session_registry.path = str(directory / "session_registry.db")
+    return module
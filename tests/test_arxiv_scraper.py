@@ -0,0 +1,150 @@
+import os
+import pytest
+from scrapers import ArxivScraper
+from scrapers.paper import Paper
+from scrapers.ArxivScraper import normalize_arxiv_id, fetch_arxiv_metadata, arxiv_fast_path
+
+FIXTURES = os.path.join(os.path.dirname(ArxivScraper.__file__), "fixtures", "arxiv")
+
+FEED = """<?xml version="1.0" encoding="UTF-8"?>
+<feed xmlns="http://www.w3.org/2005/Atom">{entries}</feed>"""
+ENTRY = """<entry>
+  <id>http://arxiv.org/abs/{id}v2</id>
+  <title>Paper {id}</title>
+  <summary>Abstract of {id}.</summary>
+  <author><name>Ada Lovelace</name></author>
+</entry>"""
+
+
+@pytest.fixture(autouse=True)
+def empty_cache(monkeypatch):
+    monkeypatch.setattr(ArxivScraper, "_metadata_cache", ArxivScraper.OrderedDict())
+    monkeypatch.setattr(ArxivScraper, "ARXIV_API_MIN_INTERVAL", 0)
+    monkeypatch.setattr(ArxivScraper, "ARXIV_API_FIXTURES", "")
+
+
+class FakeResponse:
+    status_code = 200
+
+    def __init__(self, content):
+        self.content = content.encode("utf-8")
+
+
+@pytest.fixture
+def api(monkeypatch):
+    """Stands in for the export API; records the id list of every call"""
+    calls = []
+
+    def get(url, params=None, timeout=None):
+        ids = params["id_list"].split(",")
+        calls.append(ids)
+        return FakeResponse(FEED.format(entries="".join(ENTRY.format(id=i) for i in ids if i != "2401.99999")))
+
+    monkeypatch.setattr(ArxivScraper.requests, "get", get)
+    return calls
+
+
+@pytest.mark.parametrize("value", [
+    "2412.04447",
+    "2412.04447v3",
+    "arXiv:2412.04447",
+    "arxiv:2412.04447v1",
+    "https://arxiv.org/abs/2412.04447",
+    "https://arxiv.org/abs/2412.04447v2",
+    "http://arxiv.org/pdf/2412.04447v1",
+    "https://arxiv.org/pdf/2412.04447.pdf",
+    "https://arxiv.org/html/2412.04447v1/",
+    "https://export.arxiv.org/abs/2412.04447",
+    "arxiv.org/abs/2412.04447",
+    "https://doi.org/10.48550/arXiv.2412.04447",
+    "10.48550/arXiv.2412.04447",
+    "doi:10.48550/arxiv.2412.04447",
+    "  2412.04447  ",
+])
+def test_normalize_new_style_variants(value):
+    assert normalize_arxiv_id(value) == "2412.04447"
+
+
+def test_normalize_old_style_ids():
+    assert normalize_arxiv_id("hep-th/9901001v2") == "hep-th/9901001"
+    assert normalize_arxiv_id("https://arxiv.org/abs/math.GT/0309136") == "math.GT/0309136"
+
+
+@pytest.mark.parametrize("value", [
+    None,
+    "",
+    "https://example.com/abs/2412.04447",
+    "https://doi.org/10.1000/xyz123",
+    "10.1000/xyz123",
+    "https://arxiv.org/list/cs.AI/recent",
+    "not an id",
+])
+def test_normalize_rejects_other_input(value):
+    assert normalize_arxiv_id(value) is None
+
+
+def test_fetch_batches_missing_ids(api, monkeypatch):
+    monkeypatch.setattr(ArxivScraper, "ARXIV_API_BATCH_SIZE", 2)
+    ids = ["2401.00001", "2401.00002", "2401.00003", "2401.00001"]
+    found = fetch_arxiv_metadata(ids)
+    assert api == [["2401.00001", "2401.00002"], ["2401.00003"]]
+    assert sorted(found) == ["2401.00001", "2401.00002", "2401.00003"]
+    assert found["2401.00002"]["version"] == "v2"
+    assert found["2401.00002"]["authors"] == ["Ada Lovelace"]
+
+
+def test_fetch_serves_repeats_from_cache(api):
+    fetch_arxiv_metadata(["2401.00001"])
+    found = fetch_arxiv_metadata(["2401.00001", "2401.00002"])
+    assert api == [["2401.00001"], ["2401.00002"]]
+    assert sorted(found) == ["2401.00001", "2401.00002"]
+
+
+def test_fetch_refetches_expired_entries(api, monkeypatch):
+    monkeypatch.setattr(ArxivScraper, "ARXIV_CACHE_TTL_SECONDS", -1)
+    fetch_arxiv_metadata(["2401.00001"])
+    fetch_arxiv_metadata(["2401.00001"])
+    assert api == [["2401.00001"], ["2401.00001"]]
+
+
+def test_fetch_cache_is_bounded(api, monkeypatch):
+    monkeypatch.setattr(ArxivScraper, "ARXIV_CACHE_SIZE", 2)
+    fetch_arxiv_metadata(["2401.00001", "2401.00002", "2401.00003"])
+    assert list(ArxivScraper._metadata_cache) == ["2401.00002", "2401.00003"]
+
+
+def test_fetch_skips_unknown_ids(api):
+    assert fetch_arxiv_metadata(["2401.99999"]) == {}
+
+
+def test_fast_path_from_fixture(monkeypatch):
+    monkeypatch.setattr(ArxivScraper, "ARXIV_API_FIXTURES", FIXTURES)
+    paper = arxiv_fast_path("https://arxiv.org/pdf/2412.04447v1.pdf")
+    assert paper.title.startswith("EgoPlan-Bench2: A Benchmark for Multimodal Large Language Model Planning")
+    assert "\n" not in paper.title
+    assert paper.authors == ["Lu Qiu", "Yuying Ge", "Yi Chen", "Yixiao Ge", "Ying Shan", "Xihui Liu"]
+    assert paper.abstract.startswith("The advent of Multimodal Large Language Models")
+    assert paper.doi == "10.48550/arXiv.2412.04447"
+    assert paper.source == "https://arxiv.org/abs/2412.04447"
+    assert paper.extra["arXiv ID"] == "2412.04447v1"
+    assert paper.extra["Subjects"] == "cs.AI; cs.CV"
+
+
+@pytest.mark.parametrize("text", [
+    "10.48550/arXiv.2412.04447",
+    "https://doi.org/10.48550/arXiv.2412.04447",
+    "https://doi.org/10.48550/arXiv.2412.04447 Focus to learn more",
+    "DOI: 10.48550/arXiv.2412.04447",
+    "doi:10.48550/arXiv.2412.04447.",
+])
+def test_scraped_doi_is_stored_bare(text):
+    # Same format as the API fast path, whichever way the page shows it
+    paper = Paper()
+    paper.assign("doi", text)
+    assert paper.doi == "10.48550/arXiv.2412.04447"
+
+
+def test_fast_path_without_a_record(monkeypatch):
+    monkeypatch.setattr(ArxivScraper, "ARXIV_API_FIXTURES", FIXTURES)
+    assert arxiv_fast_path("https://arxiv.org/abs/2401.00001") is None
+    assert arxiv_fast_path("https://example.com/paper") is None
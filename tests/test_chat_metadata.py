@@ -0,0 +1,45 @@
+import pytest
+from scrapers.paper import Paper
+
+URL = "https://arxiv.org/abs/2412.04447"
+PDF = "s1_notes.pdf"
+
+
+@pytest.fixture
+def chat(main, monkeypatch):
+    """Posts a chat message; the retrieval pipeline answers "retrieved" """
+    monkeypatch.setattr(main, "PINECONE_INITIALIZED", True)
+    monkeypatch.setattr(main, "answer_from_summaries", lambda query, documents: None)
+    monkeypatch.setattr(main, "answer_across_documents",
+                        lambda query, session_id, documents, fallback=None: "retrieved")
+    client = main.app.test_client()
+
+    def post(message, session_id="s1"):
+        return client.post("/get", data={"msg": message, "session_id": session_id}).get_data(as_text=True)
+
+    return post
+
+
+def make_session(main, documents, **fields):
+    main.session_data.pop("s1")
+    paper = Paper(title="Scaling Laws", authors=["Ada Lovelace", "Alan Turing"], source=URL)
+    main.session_data.create("s1", url=URL, pdf_filename="", pdf_list=[], documents=documents,
+                             papers={URL: paper.to_dict(sections=False)})
+    if fields:
+        main.session_data.update("s1", **fields)
+
+
+def test_url_only_session_answers_from_metadata(main, chat):
+    make_session(main, [URL])
+    assert "Ada Lovelace" in chat("Who wrote this paper?")
+
+
+def test_active_pdf_is_not_answered_from_the_url_paper(main, chat):
+    make_session(main, [URL, main.pdf_source(PDF)], pdf_filename=PDF, pdf_list=[PDF])
+    assert chat("Who wrote this paper?") == "retrieved"
+
+
+def test_active_url_paper_is_answered_alone_in_a_mixed_session(main, chat):
+    make_session(main, [URL, main.pdf_source(PDF)], pdf_list=[PDF])
+    answer = chat("Who wrote this paper?")
+    assert "Ada Lovelace" in answer and "notes.pdf" not in answer
@@ -0,0 +1,68 @@
+import pytest
+from chunk_dedup import ChunkDeduplicator, shingles
+
+
+def paragraph(topic, words=60):
+    return " ".join(f"{topic}{i}" for i in range(words))
+
+
+@pytest.fixture
+def dedup():
+    return ChunkDeduplicator(threshold=0.85)
+
+
+def test_exact_and_near_duplicates_are_dropped(dedup):
+    first = paragraph("alpha", 200)
+    # One word in 200 changes 5 of 196 shingles, a Jaccard similarity of about 0.95
+    near = first.replace("alpha100", "changed", 1)
+    kept = dedup.filter([first, paragraph("beta"), first, near, paragraph("gamma")])
+    assert kept == [first, paragraph("beta"), paragraph("gamma")]
+
+
+def test_case_and_punctuation_do_not_matter(dedup):
+    text = paragraph("delta")
+    assert dedup.filter([text, text.upper().replace(" ", ", ")]) == [text]
+
+
+def test_loosely_related_chunks_are_kept(dedup):
+    first = paragraph("alpha")
+    # Half of the words replaced is well below the threshold
+    half = " ".join(word if i % 2 else f"other{i}" for i, word in enumerate(first.split()))
+    assert dedup.filter([first, half]) == [first, half]
+
+
+def test_stream_yields_before_the_input_is_exhausted(dedup):
+    consumed = []
+
+    def chunks():
+        for topic in ("alpha", "beta", "gamma"):
+            consumed.append(topic)
+            yield paragraph(topic)
+
+    stream = dedup.stream(chunks())
+    assert next(stream) == paragraph("alpha")
+    assert consumed == ["alpha"]
+
+
+def test_stats_report_the_dropped_ratio(dedup):
+    assert dedup.stats() == {"documents": 0, "chunks_seen": 0, "chunks_dropped": 0, "dedupe_ratio": 0.0}
+    text = paragraph("alpha")
+    dedup.filter([text, text, text, paragraph("beta")])
+    dedup.filter([text])
+    assert dedup.stats() == {"documents": 2, "chunks_seen": 5, "chunks_dropped": 2, "dedupe_ratio": 0.4}
+
+
+def test_each_document_is_deduplicated_on_its_own(dedup):
+    text = paragraph("alpha")
+    assert dedup.filter([text]) == [text]
+    assert dedup.filter([text]) == [text]
+
+
+def test_short_chunks_get_one_shingle():
+    assert len(shingles("Only four words here")) == 1
+    assert len(shingles("one two three four five six")) == 2
+
+
+def test_permutations_must_split_into_bands():
+    with pytest.raises(ValueError):
+        ChunkDeduplicator(permutations=100, bands=16)
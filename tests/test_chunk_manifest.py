@@ -0,0 +1,149 @@
+import pytest
+from chunk_manifest import sync_document, document_prefix, chunk_vector_id, belongs_to
+
+PREFIX = document_prefix("https://arxiv.org/abs/2412.04447", "session")
+
+
+class FakeIndex:
+    """The index interface sync_document needs, backed by dicts"""
+
+    def __init__(self):
+        self.vectors_by_id = {}
+        self.metadata = {}
+        self.upserts = []
+        self.deletes = []
+
+    def document(self, prefix):
+        return {vector_id: dict(metadata) for vector_id, metadata in self.metadata.items()
+                if belongs_to(vector_id, prefix)}
+
+    def vectors(self, ids):
+        return {vector_id: self.vectors_by_id[vector_id] for vector_id in ids if vector_id in self.vectors_by_id}
+
+    def upsert(self, ids, vectors, metadatas):
+        self.upserts.append(list(ids))
+        for vector_id, vector, metadata in zip(ids, vectors, metadatas):
+            self.vectors_by_id[vector_id] = vector
+            self.metadata[vector_id] = metadata
+
+    def delete_ids(self, ids):
+        self.deletes.append(list(ids))
+        for vector_id in ids:
+            del self.vectors_by_id[vector_id]
+            del self.metadata[vector_id]
+
+    def texts(self):
+        """The stored chunk texts in chunk order"""
+        return [metadata["text"] for metadata in sorted(self.metadata.values(), key=lambda m: m["chunk_id"])]
+
+
+@pytest.fixture
+def index():
+    return FakeIndex()
+
+
+@pytest.fixture
+def embedded():
+    """Stands in for the embedding model; records every text it embeds"""
+    texts = []
+
+    def embed(batch):
+        texts.extend(batch)
+        return [[float(len(text))] for text in batch]
+
+    embed.texts = texts
+    return embed
+
+
+def sync(index, texts, embed, base=None, **kwargs):
+    return sync_document(index, PREFIX, texts, base or {"source": "arxiv"}, embed, **kwargs)
+
+
+V1 = [f"Section {i} of the first version." for i in range(6)]
+
+
+def test_new_document_is_embedded_and_added(index, embedded):
+    report = sync(index, V1, embedded)
+    assert report == {"chunks": 6, "added": 6, "rewritten": 0, "removed": 0, "unchanged": 0, "embedded": 6}
+    assert index.texts() == V1
+    assert embedded.texts == V1
+    assert set(index.metadata) == {chunk_vector_id(PREFIX, text) for text in V1}
+    assert len({metadata["batch_id"] for metadata in index.metadata.values()}) == 1
+
+
+def test_same_document_again_writes_nothing(index, embedded):
+    sync(index, V1, embedded)
+    index.upserts.clear()
+    report = sync(index, iter(V1), embedded)
+    assert report["unchanged"] == 6 and report["embedded"] == 0
+    assert index.upserts == [] and index.deletes == []
+
+
+def test_v1_to_v2_embeds_only_the_edited_chunks(index, embedded):
+    sync(index, V1, embedded)
+    embedded.texts.clear()
+    v2 = list(V1)
+    v2[2] = "Section 2, rewritten for the second version."
+    v2.append("A new appendix.")
+    report = sync(index, v2, embedded)
+    assert embedded.texts == [v2[2], "A new appendix."]
+    assert report == {"chunks": 7, "added": 2, "rewritten": 0, "removed": 1, "unchanged": 5, "embedded": 2}
+    assert index.texts() == v2
+    assert index.deletes == [[chunk_vector_id(PREFIX, V1[2])]]
+
+
+def test_moved_chunks_are_rewritten_with_their_stored_vectors(index, embedded):
+    sync(index, V1, embedded)
+    embedded.texts.clear()
+    stored = dict(index.vectors_by_id)
+    report = sync(index, ["A new first section."] + V1, embedded)
+    assert embedded.texts == ["A new first section."]
+    assert report["added"] == 1 and report["rewritten"] == 6
+    assert all(index.vectors_by_id[vector_id] == vector for vector_id, vector in stored.items())
+    assert index.texts() == ["A new first section."] + V1
+
+
+def test_changed_paper_fields_rewrite_without_embedding(index, embedded):
+    sync(index, V1, embedded)
+    embedded.texts.clear()
+    report = sync(index, V1, embedded, base={"source": "arxiv", "title": "Corrected title"})
+    assert report["rewritten"] == 6 and report["embedded"] == 0
+    assert {metadata["title"] for metadata in index.metadata.values()} == {"Corrected title"}
+
+
+def test_removed_chunks_are_deleted_after_the_upserts(index, embedded):
+    sync(index, V1, embedded)
+    index.upserts.clear()
+    report = sync(index, V1[:2], embedded)
+    assert report["removed"] == 4 and report["chunks"] == 2
+    assert index.texts() == V1[:2]
+    assert sorted(index.deletes[0]) == sorted(chunk_vector_id(PREFIX, text) for text in V1[2:])
+
+
+def test_repeated_text_is_stored_once(index, embedded):
+    report = sync(index, [V1[0], V1[1], V1[0]], embedded)
+    assert report["chunks"] == 2
+    assert index.texts() == V1[:2]
+
+
+def test_batches_and_on_batch_follow_document_order(index, embedded):
+    sync(index, V1, embedded)
+    embedded.texts.clear()
+    v2 = list(V1)
+    v2[4] = "Section 4, edited."
+    batches = []
+    report = sync(index, v2, embedded, batch_size=4, on_batch=lambda texts, vectors: batches.append((texts, vectors)))
+    assert [texts for texts, _ in batches] == [v2[:4], v2[4:]]
+    # Unchanged chunks come with their stored vectors, edited ones with new embeddings
+    assert [vector for _, vectors in batches for vector in vectors] == [[float(len(text))] for text in v2]
+    assert embedded.texts == [v2[4]]
+    assert report["embedded"] == 1
+
+
+def test_documents_with_a_common_key_prefix_are_kept_apart(index, embedded):
+    sync(index, V1, embedded)
+    other = document_prefix("https://arxiv.org/abs/2412.04447v2", "session")
+    sync_document(index, other, ["Other paper."], {"source": "arxiv"}, embedded)
+    report = sync(index, V1[:1], embedded)
+    assert report["removed"] == 5
+    assert chunk_vector_id(other, "Other paper.") in index.metadata
@@ -0,0 +1,173 @@
+import time
+import threading
+import pytest
+import generation_client
+from generation_client import CircuitBreaker, GenerationClient, BackendError, CLOSED, OPEN, HALF_OPEN
+from generation_scheduler import GenerationScheduler
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def time(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(generation_client, "time", clock)
+    return clock
+
+
+@pytest.fixture
+def breaker(clock):
+    return CircuitBreaker("hf", failure_threshold=3, reset_seconds=30)
+
+
+def open_breaker(breaker):
+    for _ in range(breaker.failure_threshold):
+        assert breaker.allow()
+        breaker.record_failure()
+
+
+def test_breaker_opens_after_consecutive_failures(breaker):
+    breaker.record_failure()
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.stats()["state"] == CLOSED
+    breaker.record_failure()
+    assert breaker.stats()["state"] == OPEN
+    assert not breaker.allow()
+    assert breaker.stats()["rejected"] == 1 and breaker.stats()["opened"] == 1
+
+
+def test_non_retryable_failures_do_not_open_the_breaker(breaker):
+    for _ in range(10):
+        breaker.record_failure(retryable=False)
+    assert breaker.stats()["state"] == CLOSED
+
+
+def test_half_open_lets_one_probe_through(breaker, clock):
+    open_breaker(breaker)
+    clock.now += 29
+    assert not breaker.allow()
+    clock.now += 1
+    assert breaker.allow()
+    assert breaker.stats()["state"] == HALF_OPEN
+    assert not breaker.allow()
+    assert breaker.stats()["probes"] == 1
+
+
+def test_successful_probe_closes_the_breaker(breaker, clock):
+    open_breaker(breaker)
+    clock.now += 30
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.stats() == {"opened": 1, "rejected": 0, "probes": 1, "state": CLOSED, "consecutive_failures": 0}
+    assert breaker.allow()
+
+
+def test_failed_probe_opens_the_breaker_for_another_period(breaker, clock):
+    open_breaker(breaker)
+    clock.now += 30
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.stats()["state"] == OPEN and breaker.stats()["opened"] == 2
+    clock.now += 29
+    assert not breaker.allow()
+    clock.now += 1
+    assert breaker.allow()
+
+
+def test_probe_answered_with_a_client_error_closes_the_breaker(breaker, clock):
+    open_breaker(breaker)
+    clock.now += 30
+    assert breaker.allow()
+    breaker.record_failure(retryable=False)
+    assert breaker.stats()["state"] == CLOSED
+
+
+def test_client_falls_back_while_the_breaker_is_open(clock):
+    calls = []
+
+    def failing(prompt, max_new_tokens, timeout):
+        calls.append("hf")
+        raise BackendError("503")
+
+    def local(prompt, max_new_tokens, timeout):
+        calls.append("local")
+        return "local reply"
+
+    client = GenerationClient([("hf", failing, False), ("local", local, False)])
+    client.breakers["hf"].failure_threshold = 2
+    assert [client.complete("p", 10, 5) for _ in range(3)] == ["local reply"] * 3
+    assert calls == ["hf", "local", "hf", "local", "local"]
+    stats = client.stats()
+    assert stats["fallbacks"] == 3
+    assert stats["backends"]["hf"]["state"] == OPEN
+
+    clock.now += generation_client.BREAKER_RESET_SECONDS
+    assert client.complete("p", 10, 5) == "local reply"
+    assert calls[-2:] == ["hf", "local"]
+
+
+def slow_first_backend(release):
+    """A backend whose first call hangs until release is set; later calls answer at once"""
+    calls = []
+
+    def call(prompt, max_new_tokens, timeout):
+        calls.append(timeout)
+        if len(calls) == 1:
+            release.wait(2)
+            return "first"
+        return "hedge"
+
+    return call, calls
+
+
+def hedging_client(call, scheduler):
+    client = GenerationClient([("hf", call, True)], hedge_budget=1.0, scheduler=scheduler)
+    for _ in range(generation_client.LATENCY_MIN_SAMPLES):
+        client.latencies["hf"].add(0.01)
+    return client
+
+
+@pytest.fixture
+def short_hedge_delay(monkeypatch):
+    monkeypatch.setattr(generation_client, "GENERATION_HEDGE_MIN_DELAY", 0.02)
+
+
+def test_hedge_takes_a_free_scheduler_slot_and_gives_it_back(short_hedge_delay):
+    scheduler = GenerationScheduler(max_in_flight=2, max_queue=2, reserved_interactive=0)
+    release = threading.Event()
+    call, calls = slow_first_backend(release)
+    client = hedging_client(call, scheduler)
+    with scheduler.slot(time.time() + 5):
+        assert client.complete("p", 10, 5) == "hedge"
+        # The hedge's slot is given back by a done callback, just after its result is set
+        end = time.time() + 2
+        while scheduler.stats()["in_flight"] != 1 and time.time() < end:
+            time.sleep(0.005)
+        assert scheduler.stats()["in_flight"] == 1
+    release.set()
+    assert len(calls) == 2
+    stats = client.stats()
+    assert stats["hedges"] == 1 and stats["hedge_wins"] == 1 and stats["hedges_skipped_busy"] == 0
+
+
+def test_hedge_is_skipped_when_the_scheduler_is_full(short_hedge_delay):
+    scheduler = GenerationScheduler(max_in_flight=1, max_queue=2, reserved_interactive=0)
+    release = threading.Event()
+    call, calls = slow_first_backend(release)
+    client = hedging_client(call, scheduler)
+    threading.Timer(0.2, release.set).start()
+    with scheduler.slot(time.time() + 5):
+        assert client.complete("p", 10, 5) == "first"
+    assert len(calls) == 1
+    stats = client.stats()
+    assert stats["hedges"] == 0 and stats["hedges_skipped_busy"] == 1
+    assert scheduler.stats()["in_flight"] == 0
@@ -0,0 +1,136 @@
+import time
+import threading
+import pytest
+from generation_scheduler import GenerationScheduler, GenerationBusy, INTERACTIVE, BACKGROUND
+
+
+def wait_for(condition, timeout=2.0):
+    end = time.time() + timeout
+    while not condition():
+        assert time.time() < end, "timed out waiting for the scheduler"
+        time.sleep(0.005)
+
+
+class Caller(threading.Thread):
+    """Takes a slot on its own thread and records whether it ran or was shed"""
+
+    def __init__(self, scheduler, priority, seconds=2.0, order=None, name=None):
+        super().__init__(daemon=True)
+        self.scheduler = scheduler
+        self.priority = priority
+        self.deadline = time.time() + seconds
+        self.order = order
+        self.label = name
+        self.outcome = None
+
+    def run(self):
+        try:
+            with self.scheduler.slot(self.deadline, self.priority):
+                if self.order is not None:
+                    self.order.append(self.label)
+                self.outcome = "ran"
+        except GenerationBusy as e:
+            self.outcome = str(e)
+
+
+def queued(scheduler, depth):
+    wait_for(lambda: scheduler.stats()["queue_depth"] == depth)
+
+
+def test_free_slots_are_taken_at_once():
+    scheduler = GenerationScheduler(max_in_flight=2, max_queue=2, reserved_interactive=0)
+    with scheduler.slot(time.time() + 5) as remaining:
+        assert 4 < remaining <= 5
+        with scheduler.slot(time.time() + 5, BACKGROUND):
+            assert scheduler.stats()["in_flight"] == 2
+    stats = scheduler.stats()
+    assert stats["in_flight"] == 0 and stats["admitted"] == 2 and stats["queued"] == 0
+
+
+def test_background_work_leaves_the_reserved_slots_to_chat():
+    scheduler = GenerationScheduler(max_in_flight=2, max_queue=2, reserved_interactive=1)
+    with scheduler.slot(time.time() + 5, BACKGROUND):
+        with pytest.raises(GenerationBusy):
+            with scheduler.slot(time.time() + 0.05, BACKGROUND):
+                pass
+        with scheduler.slot(time.time() + 5, INTERACTIVE):
+            assert scheduler.stats()["in_flight_background"] == 1
+
+
+def test_waiting_chat_runs_before_waiting_background_work():
+    scheduler = GenerationScheduler(max_in_flight=1, max_queue=4, reserved_interactive=0)
+    order = []
+    with scheduler.slot(time.time() + 5):
+        background = Caller(scheduler, BACKGROUND, order=order, name="background")
+        background.start()
+        queued(scheduler, 1)
+        chat = Caller(scheduler, INTERACTIVE, order=order, name="chat")
+        chat.start()
+        queued(scheduler, 2)
+    background.join(2)
+    chat.join(2)
+    assert order == ["chat", "background"]
+    assert scheduler.stats()["queued"] == 2
+
+
+def test_full_queue_displaces_less_urgent_waiters():
+    scheduler = GenerationScheduler(max_in_flight=1, max_queue=1, reserved_interactive=0)
+    with scheduler.slot(time.time() + 5):
+        background = Caller(scheduler, BACKGROUND)
+        background.start()
+        queued(scheduler, 1)
+        chat = Caller(scheduler, INTERACTIVE)
+        chat.start()
+        background.join(2)
+        assert background.outcome == "The model is busy with more urgent requests"
+        queued(scheduler, 1)
+
+        # Nothing queued is less urgent than another background call, so it is turned away
+        with pytest.raises(GenerationBusy, match="busy"):
+            with scheduler.slot(time.time() + 5, BACKGROUND):
+                pass
+    chat.join(2)
+    assert chat.outcome == "ran"
+    assert scheduler.stats()["shed_queue_full"] == 2
+
+
+def test_calls_past_their_deadline_are_shed():
+    scheduler = GenerationScheduler(max_in_flight=1, max_queue=4, reserved_interactive=0)
+    with pytest.raises(GenerationBusy, match="ran out of time"):
+        with scheduler.slot(time.time() - 1):
+            pass
+    with scheduler.slot(time.time() + 5):
+        late = Caller(scheduler, INTERACTIVE, seconds=0.05)
+        late.start()
+        late.join(2)
+        assert late.outcome == "The model did not become free before the request's deadline"
+    stats = scheduler.stats()
+    assert stats["shed_deadline"] == 2 and stats["queue_depth"] == 0 and stats["in_flight"] == 0
+
+
+def test_try_acquire_only_takes_an_idle_slot():
+    scheduler = GenerationScheduler(max_in_flight=2, max_queue=4, reserved_interactive=0)
+    with scheduler.slot(time.time() + 5):
+        assert scheduler.try_acquire()
+        assert not scheduler.try_acquire()
+        waiting = Caller(scheduler, INTERACTIVE)
+        waiting.start()
+        queued(scheduler, 1)
+        scheduler.release()
+        waiting.join(2)
+        assert waiting.outcome == "ran"
+    assert scheduler.stats()["in_flight"] == 0
+
+
+def test_try_acquire_does_not_jump_the_queue():
+    scheduler = GenerationScheduler(max_in_flight=2, max_queue=4, reserved_interactive=1)
+    with scheduler.slot(time.time() + 5, BACKGROUND):
+        background = Caller(scheduler, BACKGROUND, seconds=0.5)
+        background.start()
+        queued(scheduler, 1)
+        # The free slot is reserved for chat, and an interactive extra call may take it
+        assert not scheduler.try_acquire(BACKGROUND)
+        assert scheduler.try_acquire(INTERACTIVE)
+        scheduler.release(INTERACTIVE)
+    background.join(2)
+    assert background.outcome == "ran"
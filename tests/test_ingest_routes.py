@@ -0,0 +1,40 @@
+import pytest
+from scrapers.paper import Paper
+
+URLS = ["https://arxiv.org/abs/1", "https://arxiv.org/abs/2", "https://arxiv.org/abs/3"]
+
+
+@pytest.fixture
+def ingest(main, monkeypatch):
+    """Posts a reading list; index_document stores 3 chunks, raises or stores nothing, per URL"""
+    outcomes = {URLS[0]: 3, URLS[1]: RuntimeError("session cache is full"), URLS[2]: 0}
+
+    def index_document(text, source, session_id, paper=None):
+        outcome = outcomes[source]
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    monkeypatch.setattr(main, "PINECONE_INITIALIZED", True)
+    monkeypatch.setattr(main, "store_many", lambda urls: ((url, Paper(title=url, source=url), 0.1) for url in urls))
+    monkeypatch.setattr(main, "index_document", index_document)
+    main.session_data.pop("bulk")
+    client = main.app.test_client()
+    return lambda urls: client.post("/process_urls", json={"urls": urls, "session_id": "bulk"})
+
+
+def test_one_failing_document_keeps_the_other_results(main, ingest):
+    response = ingest(URLS)
+    assert response.status_code == 200
+    body = response.get_json()
+    assert [result["status"] for result in body["results"]] == ["indexed", "failed", "failed"]
+    assert "session cache is full" in body["results"][1]["message"]
+    assert body["indexed"] == 1 and body["failed"] == 2
+
+
+def test_only_stored_documents_are_recorded(main, ingest):
+    ingest(URLS)
+    session = main.session_data.get("bulk")
+    assert session["documents"] == [URLS[0]]
+    assert list(session["papers"]) == [URLS[0]]
+    assert main.session_registry.documents()["bulk"] == {URLS[0]}
@@ -0,0 +1,59 @@
+import pytest
+from scrapers import ArxivScraper, IeeeScraper, ScienceDirectScraper, UniversalScraper
+from scrapers.paper import FetchError, ExtractionError
+
+SCRAPERS = [
+    (ArxivScraper, ArxivScraper.arxiv_scrap),
+    (IeeeScraper, IeeeScraper.ieee_scrap),
+    (ScienceDirectScraper, ScienceDirectScraper.scdir_scrap),
+    (UniversalScraper, UniversalScraper.universal_scraper),
+]
+
+
+class FakeResponse:
+    text = ""
+
+    def __init__(self, status_code):
+        self.status_code = status_code
+
+
+@pytest.fixture
+def respond(monkeypatch):
+    """Answers every page request of the scrapers with one status; records the requests and sleeps"""
+    calls = {"requests": 0, "sleeps": []}
+
+    def install(status_code):
+        def get(url, headers=None, timeout=None):
+            calls["requests"] += 1
+            return FakeResponse(status_code)
+
+        for module, _ in SCRAPERS:
+            monkeypatch.setattr(module.requests, "get", get)
+            monkeypatch.setattr(module.time, "sleep", calls["sleeps"].append)
+        return calls
+
+    return install
+
+
+@pytest.mark.parametrize("module, scrape", SCRAPERS)
+@pytest.mark.parametrize("status_code", [403, 404])
+def test_client_errors_are_not_retried(respond, module, scrape, status_code):
+    calls = respond(status_code)
+    with pytest.raises(FetchError) as error:
+        scrape("https://example.org/paper/1")
+    assert error.value.status_code == status_code
+    assert calls["requests"] == 1 and calls["sleeps"] == []
+
+
+@pytest.mark.parametrize("module, scrape", SCRAPERS)
+@pytest.mark.parametrize("status_code", [429, 503])
+def test_transient_errors_are_retried_with_backoff(respond, module, scrape, status_code):
+    calls = respond(status_code)
+    with pytest.raises(ExtractionError):
+        scrape("https://example.org/paper/1")
+    assert calls["requests"] == 3 and calls["sleeps"] == [2, 4]
+
+
+@pytest.mark.parametrize("status_code, retryable", [(None, True), (404, False), (410, False), (429, True), (500, True)])
+def test_fetch_error_retryable(status_code, retryable):
+    assert FetchError("failed", "https://example.org", status_code).retryable is retryable
@@ -0,0 +1,265 @@
+import os
+import json
+import time
+import queue
+import logging
+import threading
+from concurrent.futures import Future
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Writer configuration (can be overridden from the environment)
+VECTOR_WRITE_WORKERS = int(os.getenv("VECTOR_WRITE_WORKERS", "4"))
+# Batches waiting for a worker before writers are pushed back
+VECTOR_WRITE_QUEUE_SIZE = int(os.getenv("VECTOR_WRITE_QUEUE_SIZE", "64"))
+VECTOR_WRITE_QUEUE_TIMEOUT = float(os.getenv("VECTOR_WRITE_QUEUE_TIMEOUT", "10"))
+# Pinecone takes at most 1000 vectors and 2MB per upsert
+VECTOR_UPSERT_BATCH = int(os.getenv("VECTOR_UPSERT_BATCH", "100"))
+VECTOR_UPSERT_MAX_BYTES = int(os.getenv("VECTOR_UPSERT_MAX_BYTES", str(2 * 1024 * 1024)))
+# Session ids per "$in" delete, and how long single deletes wait to be coalesced
+VECTOR_DELETE_BATCH = int(os.getenv("VECTOR_DELETE_BATCH", "100"))
+VECTOR_DELETE_WINDOW_MS = float(os.getenv("VECTOR_DELETE_WINDOW_MS", "200"))
+# Attempts per batch, with exponential backoff starting at VECTOR_WRITE_BACKOFF seconds
+VECTOR_WRITE_ATTEMPTS = int(os.getenv("VECTOR_WRITE_ATTEMPTS", "3"))
+VECTOR_WRITE_BACKOFF = float(os.getenv("VECTOR_WRITE_BACKOFF", "0.5"))
+
+
+class VectorWriteError(Exception):
+    """Some batches could not be written even after retries"""
+
+
+def row_bytes(vector_id, vector, metadata):
+    """Rough request size of one upserted vector"""
+    return len(vector_id) + 12 * len(vector) + len(json.dumps(metadata))
+
+
+def split_rows(rows, max_rows=VECTOR_UPSERT_BATCH, max_bytes=VECTOR_UPSERT_MAX_BYTES):
+    """Cut (id, vector, metadata) rows into batches under both limits"""
+    batches, batch, size = [], [], 0
+    for row in rows:
+        row_size = row_bytes(*row)
+        if batch and (len(batch) >= max_rows or size + row_size > max_bytes):
+            batches.append(batch)
+            batch, size = [], 0
+        batch.append(row)
+        size += row_size
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+class VectorWriter:
+    """Sends vector upserts and deletes through a bounded pool of worker threads.
+
+    ``upsert_batch(index_name, rows)`` and ``delete_batch(index_name, filter)``
+    do the actual calls. Upserts are cut into size-bounded batches that run
+    concurrently; session deletes arriving within ``VECTOR_DELETE_WINDOW_MS`` of
+    each other are merged into "$in" filters. Both are idempotent, so a failed
+    batch is simply retried with backoff. The work queue is bounded: when it
+    is full, callers wait up to ``VECTOR_WRITE_QUEUE_TIMEOUT`` seconds and then
+    get a VectorWriteError instead of piling up more work.
+    """
+
+    def __init__(self, upsert_batch, delete_batch, workers=VECTOR_WRITE_WORKERS, queue_size=VECTOR_WRITE_QUEUE_SIZE,
+                 queue_timeout=VECTOR_WRITE_QUEUE_TIMEOUT, attempts=VECTOR_WRITE_ATTEMPTS, backoff=VECTOR_WRITE_BACKOFF,
+                 delete_batch_size=VECTOR_DELETE_BATCH, delete_window_ms=VECTOR_DELETE_WINDOW_MS):
+        self.upsert_batch = upsert_batch
+        self.delete_batch = delete_batch
+        self.workers = max(1, workers)
+        self.queue_size = max(1, queue_size)
+        self.queue_timeout = queue_timeout
+        self.attempts = max(1, attempts)
+        self.backoff = backoff
+        self.delete_batch_size = max(1, delete_batch_size)
+        self.delete_window = max(0.0, delete_window_ms) / 1000.0
+        self._queue = queue.Queue(maxsize=self.queue_size)
+        self._lock = threading.Lock()
+        self._threads = []
+        self._pid = None
+        self._in_flight = 0
+        self._pending_deletes = {}  # tuple of index names -> [(session ids, Future)]
+        self._deletes_ready = threading.Event()
+        self._metrics = {
+            "upsert_batches": 0,
+            "vectors_written": 0,
+            "delete_batches": 0,
+            "sessions_deleted": 0,
+            "retries": 0,
+            "failed_batches": 0,
+            "rejected": 0,
+            "max_queue_depth_seen": 0,
+        }
+
+    def upsert(self, index_name, ids, vectors, metadatas):
+        """Write vectors and wait for every batch; returns the number written"""
+        rows = list(zip(ids, vectors, metadatas))
+        if not rows:
+            return 0
+        batches = split_rows(rows)
+        futures = [self._submit("upsert", index_name, batch) for batch in batches]
+        self._wait(futures, f"{len(batches)} upsert batches to {index_name}")
+        return len(rows)
+
+    def delete(self, index_names, filter):
+        """Delete by filter from every index concurrently and wait"""
+        futures = [self._submit("delete", index_name, filter) for index_name in index_names]
+        self._wait(futures, f"delete from {len(futures)} indexes")
+        return True
+
+    def delete_sessions(self, index_names, session_ids, wait=True):
+        """
+        Delete the vectors of sessions, merged with other callers' session
+        deletes into "$in" batches. Returns a Future (or its result when wait
+        is set) that is True once every batch holding these sessions succeeded.
+        """
+        self._ensure_started()
+        future = Future()
+        session_ids = list(session_ids)
+        if not session_ids:
+            future.set_result(True)
+        else:
+            with self._lock:
+                self._pending_deletes.setdefault(tuple(index_names), []).append((session_ids, future))
+            self._deletes_ready.set()
+        return future.result() if wait else future
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._metrics)
+            stats.update({
+                "workers": self.workers,
+                "queue_depth": self._queue.qsize(),
+                "queue_size": self.queue_size,
+                "in_flight": self._in_flight,
+                "pending_session_deletes": sum(len(ids) for calls in self._pending_deletes.values()
+                                               for ids, _ in calls),
+            })
+        return stats
+
+    def _submit(self, operation, index_name, payload):
+        self._ensure_started()
+        future = Future()
+        try:
+            self._queue.put((operation, index_name, payload, future), timeout=self.queue_timeout)
+        except queue.Full:
+            with self._lock:
+                self._metrics["rejected"] += 1
+            raise VectorWriteError(f"Vector write queue is full ({self.queue_size} batches waiting)")
+        with self._lock:
+            self._metrics["max_queue_depth_seen"] = max(self._metrics["max_queue_depth_seen"], self._queue.qsize())
+        return future
+
+    def _wait(self, futures, what):
+        errors = []
+        for future in futures:
+            try:
+                future.result()
+            except Exception as e:
+                errors.append(e)
+        if errors:
+            raise VectorWriteError(f"{len(errors)} of {len(futures)} batches failed ({what}): {errors[0]}")
+
+    def _ensure_started(self):
+        # Threads do not survive a fork, so check the owning pid as well
+        if self._threads and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._threads and self._pid == os.getpid():
+                return
+            if self._pid is not None and self._pid != os.getpid():
+                # Work queued by the parent belongs to its (dead) threads
+                self._queue = queue.Queue(maxsize=self.queue_size)
+                self._pending_deletes = {}
+                self._in_flight = 0
+            self._pid = os.getpid()
+            self._threads = [threading.Thread(target=self._run, name=f"vector-writer-{n}", daemon=True)
+                             for n in range(self.workers)]
+            self._threads.append(threading.Thread(target=self._coalesce_deletes, name="vector-delete-coalescer",
+                                                  daemon=True))
+            for thread in self._threads:
+                thread.start()
+            logger.info(f"Started vector writer with {self.workers} workers in process {self._pid}")
+
+    def _run(self):
+        while True:
+            operation, index_name, payload, future = self._queue.get()
+            if not future.set_running_or_notify_cancel():
+                continue
+            with self._lock:
+                self._in_flight += 1
+            try:
+                future.set_result(self._attempt(operation, index_name, payload))
+            except Exception as e:
+                future.set_exception(e)
+            finally:
+                with self._lock:
+                    self._in_flight -= 1
+
+    def _attempt(self, operation, index_name, payload):
+        """Run one batch, retrying failures; upserts by id and deletes by filter are idempotent"""
+        for attempt in range(1, self.attempts + 1):
+            try:
+                if operation == "upsert":
+                    self.upsert_batch(index_name, payload)
+                else:
+                    self.delete_batch(index_name, payload)
+                break
+            except Exception as e:
+                if attempt == self.attempts:
+                    with self._lock:
+                        self._metrics["failed_batches"] += 1
+                    logger.error(f"Vector {operation} on {index_name} failed after {attempt} attempts: {str(e)}")
+                    raise
+                with self._lock:
+                    self._metrics["retries"] += 1
+                logger.warning(f"Vector {operation} on {index_name} failed (attempt {attempt}), retrying: {str(e)}")
+                time.sleep(self.backoff * 2 ** (attempt - 1))
+
+        with self._lock:
+            if operation == "upsert":
+                self._metrics["upsert_batches"] += 1
+                self._metrics["vectors_written"] += len(payload)
+            else:
+                self._metrics["delete_batches"] += 1
+        return True
+
+    def _coalesce_deletes(self):
+        while True:
+            self._deletes_ready.wait()
+            # Let deletes from other requests and the reaper gather
+            time.sleep(self.delete_window)
+            with self._lock:
+                pending, self._pending_deletes = self._pending_deletes, {}
+                self._deletes_ready.clear()
+            for index_names, calls in pending.items():
+                try:
+                    self._flush_deletes(index_names, calls)
+                except Exception as e:
+                    logger.error(f"Error deleting session vectors: {str(e)}")
+                    for _, future in calls:
+                        if not future.done():
+                            future.set_exception(e)
+
+    def _flush_deletes(self, index_names, calls):
+        session_ids = sorted({session_id for ids, _ in calls for session_id in ids})
+        futures = {}  # session id chunk -> futures of its batches
+        for start in range(0, len(session_ids), self.delete_batch_size):
+            chunk = session_ids[start:start + self.delete_batch_size]
+            futures[tuple(chunk)] = [
+                self._submit("delete", index_name, {"session_id": {"$in": chunk}}) for index_name in index_names
+            ]
+        failed = set()
+        for chunk, chunk_futures in futures.items():
+            for future in chunk_futures:
+                try:
+                    future.result()
+                except Exception:
+                    failed.update(chunk)
+        with self._lock:
+            self._metrics["sessions_deleted"] += len(session_ids) - len(failed)
+        for ids, future in calls:
+            future.set_result(not failed.intersection(ids))
+        if len(calls) > 1:
+            logger.info(f"Coalesced {len(calls)} session deletes into {len(futures)} batches")